@@ -128,17 +128,11 @@ def home(request):
       persona_names_set.add(x)
 
   persona_init_pos = []
-  file_count = []
-  for i in find_filenames(f"storage/{sim_code}/environment", ".json"):
-    x = i.split("/")[-1].strip()
-    if x[0] != ".": 
-      file_count += [int(x.split(".")[0])]
-  curr_json = f'storage/{sim_code}/environment/{str(max(file_count))}.json'
-  with open(curr_json) as json_file:  
-    persona_init_pos_dict = json.load(json_file)
-    for key, val in persona_init_pos_dict.items(): 
-      if key in persona_names_set: 
-        persona_init_pos += [[key, val["x"], val["y"]]]
+  env_log = get_step_log(f"storage/{sim_code}/environment")
+  persona_init_pos_dict = env_log.read(env_log.steps()[-1])
+  for key, val in persona_init_pos_dict.items(): 
+    if key in persona_names_set: 
+      persona_init_pos += [[key, val["x"], val["y"]]]
 
   context = {"sim_code": sim_code,
              "step": step, 
@@ -162,17 +156,11 @@ def replay(request, sim_code, step):
       persona_names_set.add(x)
 
   persona_init_pos = []
-  file_count = []
-  for i in find_filenames(f"storage/{sim_code}/environment", ".json"):
-    x = i.split("/")[-1].strip()
-    if x[0] != ".": 
-      file_count += [int(x.split(".")[0])]
-  curr_json = f'storage/{sim_code}/environment/{str(max(file_count))}.json'
-  with open(curr_json) as json_file:  
-    persona_init_pos_dict = json.load(json_file)
-    for key, val in persona_init_pos_dict.items(): 
-      if key in persona_names_set: 
-        persona_init_pos += [[key, val["x"], val["y"]]]
+  env_log = get_step_log(f"storage/{sim_code}/environment")
+  persona_init_pos_dict = env_log.read(env_log.steps()[-1])
+  for key, val in persona_init_pos_dict.items(): 
+    if key in persona_names_set: 
+      persona_init_pos += [[key, val["x"], val["y"]]]
 
   context = {"sim_code": sim_code,
              "step": step,
@@ -199,8 +187,7 @@ def replay_persona_state(request, sim_code, step, persona_name):
   with open(memory + "/spatial_memory.json") as json_file:  
     spatial = json.load(json_file)
 
-  with open(memory + "/associative_memory/nodes.json") as json_file:  
-    associative = json.load(json_file)
+  associative = load_memory_nodes(memory + "/associative_memory")
 
   a_mem_event = []
   a_mem_chat = []
@@ -242,8 +229,10 @@ def process_environment(request):
   """
   <FRONTEND to BACKEND> 
   This sends the frontend visual world information to the backend server. 
-  It does this by writing the current environment representation to 
-  "storage/environment.json" file. 
+  It does this by appending the current environment representation to the
+  simulation's environment step log (see StepLog in global_methods.py), and
+  then pushing it through the backend's step channel so the backend does not
+  have to wait for its next poll of the log. 
 
   ARGS:
     request: Django request
@@ -259,8 +248,12 @@ def process_environment(request):
   sim_code = data["sim_code"]
   environment = data["environment"]
 
-  with open(f"storage/{sim_code}/environment/{step}.json", "w") as outfile:
-    outfile.write(json.dumps(environment, indent=2))
+  get_step_log(f"storage/{sim_code}/environment").append(int(step), 
+                                                        environment)
+  send_step_frame("temp_storage", {"type": "environment", 
+                                   "sim_code": sim_code, 
+                                   "step": int(step), 
+                                   "environment": environment})
 
   return HttpResponse("received")
 
@@ -270,8 +263,10 @@ def update_environment(request):
   <BACKEND to FRONTEND> 
   This sends the backend computation of the persona behavior to the frontend
   visual server. 
-  It does this by reading the new movement information from 
-  "storage/movement.json" file.
+  It does this by reading the new movement information from the 
+  simulation's movement step log. If the backend has not computed the step
+  yet, we hold the request on the backend's step channel until it does (or
+  until the channel times out, in which case the frontend asks again). 
 
   ARGS:
     request: Django request
@@ -287,9 +282,16 @@ def update_environment(request):
   sim_code = data["sim_code"]
 
   response_data = {"<step>": -1}
-  if (check_if_file_exists(f"storage/{sim_code}/movement/{step}.json")):
-    with open(f"storage/{sim_code}/movement/{step}.json") as json_file: 
-      response_data = json.load(json_file)
+  move_log = get_step_log(f"storage/{sim_code}/movement")
+  if move_log.has_step(int(step)): 
+    response_data = move_log.read(int(step))
+    response_data["<step>"] = step
+  else: 
+    reply = send_step_frame("temp_storage", {"type": "movement", 
+                                             "sim_code": sim_code, 
+                                             "step": int(step)})
+    if reply and reply["movements"]: 
+      response_data = reply["movements"]
       response_data["<step>"] = step
 
   return JsonResponse(response_data)
@@ -7,6 +7,11 @@ Description: Contains functions used throughout my projects.
 import random
 import string
 import csv
+import json
+import select
+import socket
+import struct
+import threading
 import time
 import datetime as dt
 import pathlib
@@ -229,6 +234,459 @@ def copyanything(src, dst):
     else: raise
 
 
+def forkanything(src, dst): 
+  """
+  Forks the src folder into dst. Like copyanything, but the files are hard
+  linked instead of copied, so forking takes next to no time or disk no 
+  matter how long the source simulation ran. Whoever writes to a file under
+  either folder must call unshare_file on it first, so that the write does 
+  not show through to the other folder. Files are copied where hard links are
+  not supported (e.g., across devices). 
+  ARGS:
+    src: address of the source folder  
+    dst: address of the destination folder  
+  RETURNS: 
+    None
+  """
+  shutil.copytree(src, dst, copy_function=_link_or_copy)
+
+
+def _link_or_copy(src, dst): 
+  try: 
+    os.link(src, dst)
+  except OSError: 
+    shutil.copy2(src, dst)
+
+
+def unshare_file(path): 
+  """
+  Gives <path> a file of its own if it is hard linked with another folder's
+  (see forkanything), so we can write to it without changing the other one.
+  ARGS:
+    path: address of the file we are about to write to or append to. 
+  RETURNS: 
+    None
+  """
+  try: 
+    if os.stat(path).st_nlink < 2: 
+      return
+  except FileNotFoundError: 
+    return
+  tmp_path = f"{path}.unshare"
+  shutil.copy2(path, tmp_path)
+  os.replace(tmp_path, path)
+
+
+def write_file_atomic(path, text): 
+  """
+  Writes <text> to <path> through a temp file and a rename, so readers see 
+  either the old or the new file, never a partial one. This also gives the
+  file a new inode, so it is never shared with a fork (see forkanything). 
+  ARGS:
+    path: address of the file. 
+    text: the string to write. 
+  RETURNS: 
+    None
+  """
+  tmp_path = f"{path}.tmp"
+  with open(tmp_path, "w") as outfile: 
+    outfile.write(text)
+  os.replace(tmp_path, path)
+
+
+##############################################################################
+#                            MEMORY NODE CHECKPOINTS                         #
+##############################################################################
+
+# The associative memory's nodes are saved as nodes.json, a snapshot of all
+# nodes, plus nodes_log.jsonl, where each save appends the nodes added since
+# as one {node_id: node details} JSON line. nodes_meta.json records how many 
+# bytes of the log are committed; bytes past that are from a save that was 
+# cut short and are ignored. Older folders only have nodes.json. 
+MEMORY_NODES_FILE = "nodes.json"
+MEMORY_NODES_LOG = "nodes_log.jsonl"
+MEMORY_NODES_META = "nodes_meta.json"
+
+
+def read_memory_nodes_meta(folder): 
+  """
+  Returns the nodes_meta.json content of an associative memory folder, or 
+  the meta of an empty log if there is none. 
+  """
+  if not os.path.exists(f"{folder}/{MEMORY_NODES_META}"): 
+    return {"version": 1, "log_bytes": 0}
+  with open(f"{folder}/{MEMORY_NODES_META}") as json_file: 
+    return json.load(json_file)
+
+
+def load_memory_nodes(folder): 
+  """
+  Loads the nodes saved in an associative memory folder. 
+  ARGS:
+    folder: the associative_memory folder of a persona. 
+  RETURNS: 
+    A dictionary of node_id -> node details, as in nodes.json. 
+  """
+  with open(f"{folder}/{MEMORY_NODES_FILE}") as json_file: 
+    nodes = json.load(json_file)
+  log_bytes = read_memory_nodes_meta(folder)["log_bytes"]
+  if log_bytes: 
+    with open(f"{folder}/{MEMORY_NODES_LOG}", "rb") as log_file: 
+      for line in log_file.read(log_bytes).splitlines(): 
+        nodes.update(json.loads(line))
+  return nodes
+
+
+##############################################################################
+#                                  STEP LOG                                  #
+##############################################################################
+
+# A step log keeps one JSON record per simulation step (e.g., the personas'
+# movements, or the environment the frontend reports back) in a few 
+# append-only segment files instead of one small json file per step. Each 
+# segment holds STEP_LOG_SEGMENT_STEPS steps: 
+#   steps-000000.jsonl -- one compact JSON line per record. 
+#   steps-000000.idx   -- one fixed size (step, offset, length) entry per 
+#                         record, written after the record itself. 
+# Readers only trust records that made it into the index, so a reader never
+# sees a half written record. If a step is written twice, the last record 
+# wins. Folders of older simulations that still hold {step}.json files are 
+# read through the same interface. 
+STEP_LOG_SEGMENT_STEPS = 1000
+_STEP_INDEX_ENTRY = struct.Struct("<qQI")
+
+
+class StepLog: 
+  def __init__(self, folder): 
+    # <folder> is the step folder, e.g., "{sim_folder}/movement".
+    # <index> maps a step to the (segment, offset, length) of its record, and
+    # <index_read> keeps how many bytes of each segment's index we have read.
+    self.folder = folder
+    self.index = dict()
+    self.index_read = dict()
+    self.lock = threading.Lock()
+
+
+  def _segment_path(self, segment, ext): 
+    return f"{self.folder}/steps-{segment:06d}.{ext}"
+
+
+  def _refresh(self, segment): 
+    # Reads the index entries that were appended since our last read. 
+    idx_path = self._segment_path(segment, "idx")
+    if not os.path.exists(idx_path): 
+      return
+    start = self.index_read.get(segment, 0)
+    with open(idx_path, "rb") as idx_file: 
+      idx_file.seek(start)
+      data = idx_file.read()
+    n_entries = len(data) // _STEP_INDEX_ENTRY.size
+    for i in range(n_entries): 
+      step, offset, length = _STEP_INDEX_ENTRY.unpack_from(
+                               data, i * _STEP_INDEX_ENTRY.size)
+      self.index[step] = (segment, offset, length)
+    self.index_read[segment] = start + n_entries * _STEP_INDEX_ENTRY.size
+
+
+  def append(self, step, record): 
+    """
+    Appends the record of <step> to the log. 
+    ARGS:
+      step: the step number. 
+      record: a json serializable dictionary. 
+    RETURNS: 
+      None
+    """
+    segment = step // STEP_LOG_SEGMENT_STEPS
+    line = (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+    with self.lock: 
+      if not os.path.exists(self.folder): 
+        os.makedirs(self.folder)
+      unshare_file(self._segment_path(segment, "jsonl"))
+      unshare_file(self._segment_path(segment, "idx"))
+      with open(self._segment_path(segment, "jsonl"), "ab") as log_file: 
+        log_file.seek(0, os.SEEK_END)
+        offset = log_file.tell()
+        log_file.write(line)
+      with open(self._segment_path(segment, "idx"), "ab") as idx_file: 
+        idx_file.write(_STEP_INDEX_ENTRY.pack(step, offset, len(line)))
+      self._refresh(segment)
+
+
+  def has_step(self, step): 
+    """
+    Returns True if there is a record for <step>. 
+    """
+    with self.lock: 
+      if step not in self.index: 
+        self._refresh(step // STEP_LOG_SEGMENT_STEPS)
+      if step in self.index: 
+        return True
+    return os.path.exists(f"{self.folder}/{step}.json")
+
+
+  def read(self, step): 
+    """
+    Returns the record of <step>, or None if there is none. 
+    """
+    with self.lock: 
+      if step not in self.index: 
+        self._refresh(step // STEP_LOG_SEGMENT_STEPS)
+      entry = self.index.get(step)
+    if entry: 
+      segment, offset, length = entry
+      with open(self._segment_path(segment, "jsonl"), "rb") as log_file: 
+        log_file.seek(offset)
+        return json.loads(log_file.read(length))
+
+    legacy_file = f"{self.folder}/{step}.json"
+    if os.path.exists(legacy_file): 
+      with open(legacy_file) as json_file: 
+        return json.load(json_file)
+    return None
+
+
+  def steps(self): 
+    """
+    Returns a sorted list of all steps with a record, in the log or in 
+    legacy {step}.json files. 
+    """
+    if not os.path.exists(self.folder): 
+      return []
+    all_steps = set()
+    with self.lock: 
+      for filename in listdir(self.folder): 
+        if filename.startswith("steps-") and filename.endswith(".idx"): 
+          self._refresh(int(filename[len("steps-"):-len(".idx")]))
+        elif filename.endswith(".json") and filename[:-5].isdigit(): 
+          all_steps.add(int(filename[:-5]))
+      all_steps.update(self.index.keys())
+    return sorted(all_steps)
+
+
+_step_logs = dict()
+_step_logs_lock = threading.Lock()
+
+
+def get_step_log(folder): 
+  """
+  Returns the shared StepLog for <folder>, so that repeated reads in the same
+  process only read the newly appended index entries. 
+  ARGS:
+    folder: the step folder, e.g., "{sim_folder}/movement". 
+  RETURNS: 
+    a StepLog instance. 
+  """
+  folder = os.path.normpath(folder)
+  with _step_logs_lock: 
+    if folder not in _step_logs: 
+      _step_logs[folder] = StepLog(folder)
+    return _step_logs[folder]
+
+
+##############################################################################
+#                                STEP CHANNEL                                #
+##############################################################################
+
+# The step channel is a local socket through which the frontend pushes each
+# step's environment to the backend, and the backend pushes each step's 
+# movements back to the frontend's waiting request, so neither side has to 
+# poll the step logs. The step logs are still written and stay the source of
+# truth: if there is no channel (e.g., an older backend, or a backend that
+# crashed), both sides simply fall back to polling them. 
+# The backend listens on a Unix domain socket (or on a localhost TCP port 
+# where those are not available) and writes its address to 
+# STEP_CHANNEL_FILE in the temp storage. Frames are one JSON object per line.
+STEP_CHANNEL_FILE = "reverie_channel.json"
+
+
+class StepChannel: 
+  def __init__(self, temp_storage, move_log=None): 
+    # <move_log> lets us answer a request for a movement that was already 
+    # published before the request arrived. 
+    self.address_file = f"{temp_storage}/{STEP_CHANNEL_FILE}"
+    self.move_log = move_log
+    self.sock_path = None
+    sock_path = os.path.abspath(f"{temp_storage}/reverie.sock")
+    if hasattr(socket, "AF_UNIX") and len(sock_path) < 100: 
+      if os.path.exists(sock_path): 
+        os.remove(sock_path)
+      self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+      self.server.bind(sock_path)
+      self.sock_path = sock_path
+      address = {"family": "unix", "address": sock_path}
+    else: 
+      self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+      self.server.bind(("127.0.0.1", 0))
+      address = {"family": "tcp", "address": list(self.server.getsockname())}
+    self.server.listen(16)
+    self.server.setblocking(False)
+
+    # <clients> maps a connected socket to its unread bytes. <environments>
+    # holds the environment frames received, keyed by (sim_code, step), and
+    # <waiters> the sockets waiting on the movements of (sim_code, step).
+    self.clients = dict()
+    self.environments = dict()
+    self.waiters = dict()
+
+    tmp_file = self.address_file + ".tmp"
+    with open(tmp_file, "w") as outfile: 
+      outfile.write(json.dumps(address))
+    os.replace(tmp_file, self.address_file)
+
+
+  def poll(self, timeout): 
+    """
+    Waits up to <timeout> seconds for frames from the frontend, and handles
+    the frames that arrived. 
+    ARGS:
+      timeout: seconds to wait. 0 handles what already arrived. 
+    RETURNS: 
+      True if any frame arrived. 
+    """
+    received = False
+    deadline = time.time() + timeout
+    while True: 
+      readable, _, _ = select.select([self.server] + list(self.clients), 
+                                     [], [], max(0, deadline - time.time()))
+      if not readable: 
+        return received
+      for sock in readable: 
+        if sock is self.server: 
+          try: 
+            client, _ = self.server.accept()
+          except OSError: 
+            continue
+          client.setblocking(False)
+          self.clients[client] = b""
+          continue
+
+        try: 
+          data = sock.recv(65536)
+        except OSError: 
+          data = b""
+        if not data: 
+          self._drop(sock)
+          continue
+        self.clients[sock] += data
+        while sock in self.clients and b"\n" in self.clients[sock]: 
+          line, self.clients[sock] = self.clients[sock].split(b"\n", 1)
+          try: 
+            frame = json.loads(line)
+          except ValueError: 
+            self._drop(sock)
+            break
+          self._handle(sock, frame)
+          received = True
+      if received: 
+        return received
+
+
+  def _handle(self, sock, frame): 
+    key = (frame.get("sim_code"), frame.get("step"))
+    if frame.get("type") == "environment": 
+      self.environments[key] = frame["environment"]
+    elif frame.get("type") == "movement": 
+      # This socket now only waits for our answer. 
+      del self.clients[sock]
+      if self.move_log and self.move_log.has_step(frame["step"]): 
+        self._reply(sock, frame["step"], self.move_log.read(frame["step"]))
+      else: 
+        self.waiters.setdefault(key, []).append(sock)
+
+
+  def _reply(self, sock, step, movements): 
+    try: 
+      sock.setblocking(True)
+      sock.sendall((json.dumps({"step": step, "movements": movements}) 
+                    + "\n").encode("utf-8"))
+    except OSError: 
+      pass
+    sock.close()
+
+
+  def _drop(self, sock): 
+    self.clients.pop(sock, None)
+    sock.close()
+
+
+  def pop_environment(self, sim_code, step): 
+    """
+    Returns the environment the frontend pushed for <step>, or None. 
+    """
+    self.poll(0)
+    environment = self.environments.pop((sim_code, step), None)
+    # Frames for steps we already ran are of no use anymore. 
+    for key in [k for k in self.environments if k[1] < step]: 
+      del self.environments[key]
+    return environment
+
+
+  def publish_movement(self, sim_code, step, movements): 
+    """
+    Sends the movements of <step> to the frontend requests waiting on them.
+    """
+    self.poll(0)
+    for sock in self.waiters.pop((sim_code, step), []): 
+      self._reply(sock, step, movements)
+
+
+  def close(self): 
+    for sock in list(self.clients): 
+      self._drop(sock)
+    for socks in self.waiters.values(): 
+      for sock in socks: 
+        sock.close()
+    self.waiters = dict()
+    self.server.close()
+    for path in [self.address_file, self.sock_path]: 
+      if path and os.path.exists(path): 
+        os.remove(path)
+
+
+def send_step_frame(temp_storage, frame, timeout=2.0): 
+  """
+  Sends a frame to the backend's step channel. For a "movement" frame, waits 
+  up to <timeout> seconds for the backend's answer. 
+  ARGS:
+    temp_storage: the temp storage folder that holds STEP_CHANNEL_FILE. 
+    frame: a json serializable dictionary with "type", "sim_code", "step".
+    timeout: seconds to wait on the backend. 
+  RETURNS: 
+    The backend's answer for "movement" frames, or None if there is no 
+    answer (no channel, a timeout, or any other frame type). 
+  """
+  try: 
+    with open(f"{temp_storage}/{STEP_CHANNEL_FILE}") as json_file: 
+      address = json.load(json_file)
+    if address["family"] == "unix": 
+      sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+      target = address["address"]
+    else: 
+      sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+      target = tuple(address["address"])
+  except (OSError, ValueError, KeyError): 
+    return None
+
+  try: 
+    sock.settimeout(timeout)
+    sock.connect(target)
+    sock.sendall((json.dumps(frame) + "\n").encode("utf-8"))
+    if frame.get("type") != "movement": 
+      return None
+    data = b""
+    while b"\n" not in data: 
+      chunk = sock.recv(65536)
+      if not chunk: 
+        return None
+      data += chunk
+    return json.loads(data.split(b"\n", 1)[0])
+  except (OSError, ValueError): 
+    return None
+  finally: 
+    sock.close()
+
+
 if __name__ == '__main__':
   pass
 
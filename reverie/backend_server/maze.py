@@ -8,13 +8,33 @@ world in a 2-dimensional matrix.
 import json
 import numpy
 import datetime
+import hashlib
+import os
 import pickle
+import shutil
 import time
 import math
 
+from collections import OrderedDict
+
 from global_methods import *
+from path_finder import PathGrid
 from utils import *
 
+# The events of a tile that has none (see Maze.access_tile). 
+_NO_EVENTS = frozenset()
+
+# Bump MAZE_CACHE_VERSION whenever the cached layers change, so that older 
+# caches are not loaded (see Maze._maze_cache_folder). 
+MAZE_CACHE_VERSION = 1
+MAZE_BLOCKS = ["world", "sector", "arena", "game_object", "spawning_location"]
+MAZE_CACHE_LAYERS = ["world_layer", "sector_layer", "arena_layer", 
+                     "game_object_layer", "spawning_location_layer", 
+                     "collision_layer", "collision_block_layer", 
+                     "sector_path_layer", "arena_path_layer", 
+                     "game_object_path_layer"]
+
+
 class Maze: 
   def __init__(self, maze_name): 
     # READING IN THE BASIC META INFORMATION ABOUT THE MAP
@@ -33,6 +53,117 @@ class Maze:
     # e.g., "planning to stay at home all day and never go out of her home"
     self.special_constraint = meta_info["special_constraint"]
 
+    # LOADING THE TILE LAYERS
+    # Parsing the map's CSV files is the slow part of loading a maze, so the
+    # parsed layers are cached as a binary artifact keyed on the files' 
+    # contents (see _maze_cache_folder). Later loads, including those of 
+    # other processes, memory-map the cached layers instead. 
+    cache_folder = self._maze_cache_folder()
+    if not (cache_folder and self._load_maze_cache(cache_folder)): 
+      self._read_maze_files(meta_info)
+      if cache_folder: 
+        self._save_maze_cache(cache_folder)
+
+    # <path_grid> is the walkability grid that path_finder searches over. We
+    # build it once here so that path finding does not have to re-scan the
+    # collision maze on every call. 
+    self.path_grid = PathGrid(self.collision_maze, collision_block_id)
+
+    # <tile_events> maps an (x, y) tile to the set of all events taking place
+    # in it. Tiles without events have no entry. 
+    # e.g., self.tile_events[(58, 9)] = 
+    #         {('double studio:double studio:bedroom 2:bed', None, None, 
+    #           None)}
+    # <arena_events> indexes the same events by the address ID of their 
+    # tile's arena (see get_tile_path_id), mapping each event to the set of 
+    # tiles it occupies in that arena. This is what perception looks up, so 
+    # it only has to look at the events of the persona's arena. 
+    # e.g., self.arena_events[<id of 'double studio:double studio:bedroom 2'>]
+    #         = {('double studio:double studio:bedroom 2:bed', None, None, 
+    #             None): {(58, 9), (58, 10)}, ...}
+    # <subject_events> is the same registry keyed by the event's subject 
+    # (a persona's name or a game object's address), so that a persona's 
+    # events can be dropped without scanning the events of a busy tile. 
+    # e.g., self.subject_events['Isabella Rodriguez'] = 
+    #         {('Isabella Rodriguez', 'is', 'sleeping', 'sleeping'): {(58, 9)}}
+    # <active_object_events> maps the object events that personas set off 
+    # during this step to their tiles, so they can all be turned back idle 
+    # at the end of the step (see idle_object_events). 
+    # Each game object occupies an event in the tile. We are setting up the 
+    # default event value here. 
+    self.tile_events = dict()
+    self.arena_events = dict()
+    self.subject_events = dict()
+    self.active_object_events = dict()
+    for i, j in zip(*numpy.nonzero(self.game_object_layer)): 
+      object_name = self.address_table[self.game_object_path_layer[i, j]]
+      self.add_event_from_tile((object_name, None, None, None), 
+                               (int(j), int(i)))
+
+    # <distance_fields> is an LRU cache of BFS distance fields, one per 
+    # address in <address_tiles>. Each field holds, for every tile, the 
+    # number of steps to the nearest tile of that address, so finding the 
+    # closest target tile (and the path to it) is a walk down the field 
+    # instead of a path search per candidate tile. Fields are built lazily
+    # and dropped whenever the collision grid changes. 
+    # e.g., self.distance_fields['the ville:hobbs cafe:cafe'] = array('i',..)
+    self.distance_field_cache_size = 128
+    self.distance_fields = OrderedDict()
+
+
+  def intern_address(self, address): 
+    """
+    Returns the ID of a name or address string in <address_table>, adding it
+    if it is new. 
+
+    INPUT
+      address: A name or address string. e.g., "bedroom 2"
+    OUTPUT
+      The integer ID of the string. 
+    """
+    if address not in self.address_ids: 
+      self.address_ids[address] = len(self.address_table)
+      self.address_table += [address]
+    return self.address_ids[address]
+
+
+  def _name_layer(self, block_maze, block_dict): 
+    # Maps each tile's color block to the ID of its name (0 if none). 
+    block_ids = {block: self.intern_address(name) 
+                 for block, name in block_dict.items()}
+    return numpy.array([[block_ids.get(block, 0) for block in row] 
+                        for row in block_maze], dtype=numpy.int32)
+
+
+  def _path_layer(self, *name_layers): 
+    # Interns the ":"-joined address of every distinct combination of names
+    # in <name_layers> and returns the layer of those addresses' IDs. 
+    base = len(self.address_table)
+    keys = numpy.zeros(name_layers[0].size, dtype=numpy.int64)
+    for layer in name_layers: 
+      keys = keys * base + layer.ravel()
+    combos, inverse = numpy.unique(keys, return_inverse=True)
+    combo_ids = []
+    for key in combos.tolist(): 
+      names = []
+      for _ in name_layers: 
+        key, name_id = divmod(key, base)
+        names[0:0] = [self.address_table[name_id]]
+      combo_ids += [self.intern_address(":".join(names))]
+    combo_ids = numpy.array(combo_ids, dtype=numpy.int32)
+    return combo_ids[inverse.ravel()].reshape(name_layers[0].shape)
+
+
+  def _read_maze_files(self, meta_info): 
+    """
+    Reads the map's special blocks and matrices, and builds the tile layers
+    and <address_tiles> from them. 
+
+    INPUT
+      meta_info: The content of maze_meta_info.json. 
+    OUTPUT
+      None
+    """
     # READING IN SPECIAL BLOCKS
     # Special blocks are those that are colored in the Tiled map. 
 
@@ -109,100 +240,150 @@ class Maze:
       game_object_maze += [game_object_maze_raw[i:i+tw]]
       spawning_location_maze += [spawning_location_maze_raw[i:i+tw]]
 
-    # Once we are done loading in the maze, we now set up self.tiles. This is
-    # a matrix accessed by row:col where each access point is a dictionary
-    # that contains all the things that are taking place in that tile. 
-    # More specifically, it contains information about its "world," "sector,"
-    # "arena," "game_object," "spawning_location," as well as whether it is a
-    # collision block, and a set of all events taking place in it. 
-    # e.g., self.tiles[32][59] = {'world': 'double studio', 
-    #            'sector': '', 'arena': '', 'game_object': '', 
-    #            'spawning_location': '', 'collision': False, 'events': set()}
-    # e.g., self.tiles[9][58] = {'world': 'double studio', 
-    #         'sector': 'double studio', 'arena': 'bedroom 2', 
-    #         'game_object': 'bed', 'spawning_location': 'bedroom-2-a', 
-    #         'collision': False,
-    #         'events': {('double studio:double studio:bedroom 2:bed',
-    #                    None, None)}} 
-    self.tiles = []
-    for i in range(self.maze_height): 
-      row = []
-      for j in range(self.maze_width):
-        tile_details = dict()
-        tile_details["world"] = wb
-        
-        tile_details["sector"] = ""
-        if sector_maze[i][j] in sb_dict: 
-          tile_details["sector"] = sb_dict[sector_maze[i][j]]
-        
-        tile_details["arena"] = ""
-        if arena_maze[i][j] in ab_dict: 
-          tile_details["arena"] = ab_dict[arena_maze[i][j]]
-        
-        tile_details["game_object"] = ""
-        if game_object_maze[i][j] in gob_dict: 
-          tile_details["game_object"] = gob_dict[game_object_maze[i][j]]
-        
-        tile_details["spawning_location"] = ""
-        if spawning_location_maze[i][j] in slb_dict: 
-          tile_details["spawning_location"] = slb_dict[spawning_location_maze[i][j]]
-        
-        tile_details["collision"] = False
-        if self.collision_maze[i][j] != "0": 
-          tile_details["collision"] = True
-
-        tile_details["events"] = set()
-        
-        row += [tile_details]
-      self.tiles += [row]
-    # Each game object occupies an event in the tile. We are setting up the 
-    # default event value here. 
-    for i in range(self.maze_height):
-      for j in range(self.maze_width): 
-        if self.tiles[i][j]["game_object"]:
-          object_name = ":".join([self.tiles[i][j]["world"], 
-                                  self.tiles[i][j]["sector"], 
-                                  self.tiles[i][j]["arena"], 
-                                  self.tiles[i][j]["game_object"]])
-          go_event = (object_name, None, None, None)
-          self.tiles[i][j]["events"].add(go_event)
+    # Once we are done loading in the maze, we set up the tile layers. 
+    # <address_table> interns every name and address string of the map, and
+    # <address_ids> maps a string back to its ID (0 is the empty string). 
+    # Each layer is a maze_height x maze_width int32 array accessed by 
+    # [row, col] that holds the ID of the tile's "world," "sector," "arena,"
+    # "game_object," and "spawning_location" name. The *_path_layer arrays 
+    # hold the ID of the tile's full address at that level, exactly as 
+    # get_tile_path spells it, so comparing two tiles' addresses is an 
+    # integer compare. <collision_layer> marks the collision blocks. 
+    # e.g., self.address_table[self.arena_layer[9, 58]] == 'bedroom 2'
+    # e.g., self.address_table[self.arena_path_layer[9, 58]] 
+    #         == 'double studio:double studio:bedroom 2'
+    # The tile's events live in <tile_events> (see access_tile). 
+    self.address_table = [""]
+    self.address_ids = {"": 0}
+    shape = (self.maze_height, self.maze_width)
+    self.world_layer = numpy.full(shape, self.intern_address(wb), 
+                                  dtype=numpy.int32)
+    self.sector_layer = self._name_layer(sector_maze, sb_dict)
+    self.arena_layer = self._name_layer(arena_maze, ab_dict)
+    self.game_object_layer = self._name_layer(game_object_maze, gob_dict)
+    self.spawning_location_layer = self._name_layer(spawning_location_maze, 
+                                                    slb_dict)
+    self.collision_layer = numpy.array(self.collision_maze) != "0"
+
+    self.sector_path_layer = self._path_layer(self.world_layer, 
+                                              self.sector_layer)
+    self.arena_path_layer = self._path_layer(self.world_layer, 
+                                             self.sector_layer, 
+                                             self.arena_layer)
+    self.game_object_path_layer = self._path_layer(self.world_layer, 
+                                                   self.sector_layer, 
+                                                   self.arena_layer, 
+                                                   self.game_object_layer)
 
     # Reverse tile access. 
     # <self.address_tiles> -- given a string address, we return a set of all 
     # tile coordinates belonging to that address (this is opposite of  
-    # self.tiles that give you the string address given a coordinate). This is
-    # an optimization component for finding paths for the personas' movement. 
+    # the layers that give you the string address given a coordinate). This 
+    # is an optimization component for finding paths for the personas' 
+    # movement. 
     # self.address_tiles['<spawn_loc>bedroom-2-a'] == {(58, 9)}
     # self.address_tiles['double studio:recreation:pool table'] 
     #   == {(29, 14), (31, 11), (30, 14), (32, 11), ...}, 
     self.address_tiles = dict()
-    for i in range(self.maze_height):
-      for j in range(self.maze_width): 
-        addresses = []
-        if self.tiles[i][j]["sector"]: 
-          add = f'{self.tiles[i][j]["world"]}:'
-          add += f'{self.tiles[i][j]["sector"]}'
-          addresses += [add]
-        if self.tiles[i][j]["arena"]: 
-          add = f'{self.tiles[i][j]["world"]}:'
-          add += f'{self.tiles[i][j]["sector"]}:'
-          add += f'{self.tiles[i][j]["arena"]}'
-          addresses += [add]
-        if self.tiles[i][j]["game_object"]: 
-          add = f'{self.tiles[i][j]["world"]}:'
-          add += f'{self.tiles[i][j]["sector"]}:'
-          add += f'{self.tiles[i][j]["arena"]}:'
-          add += f'{self.tiles[i][j]["game_object"]}'
-          addresses += [add]
-        if self.tiles[i][j]["spawning_location"]: 
-          add = f'<spawn_loc>{self.tiles[i][j]["spawning_location"]}'
-          addresses += [add]
-
-        for add in addresses: 
-          if add in self.address_tiles: 
-            self.address_tiles[add].add((j, i))
-          else: 
-            self.address_tiles[add] = set([(j, i)])
+    for name_layer, path_layer, prefix in [
+        (self.sector_layer, self.sector_path_layer, ""), 
+        (self.arena_layer, self.arena_path_layer, ""), 
+        (self.game_object_layer, self.game_object_path_layer, ""), 
+        (self.spawning_location_layer, self.spawning_location_layer, 
+         "<spawn_loc>")]: 
+      for i, j in zip(*numpy.nonzero(name_layer)): 
+        add = prefix + self.address_table[path_layer[i, j]]
+        if add in self.address_tiles: 
+          self.address_tiles[add].add((int(j), int(i)))
+        else: 
+          self.address_tiles[add] = set([(int(j), int(i))])
+    self.collision_block_layer = numpy.array(self.collision_maze, 
+                                             dtype=numpy.int64)
+
+
+  def _maze_cache_folder(self): 
+    """
+    Returns the folder that caches this maze's tile layers, or None if the
+    cache is turned off (MAZE_CACHE=0). The folder name holds a hash of 
+    MAZE_CACHE_VERSION and the contents of all of the map's source files, so
+    editing the map (or changing the cache format) misses the old cache. 
+    MAZE_CACHE_PATH sets where the folders live (by default, 
+    ~/.cache/generative_agents/maze). 
+
+    INPUT
+      None
+    OUTPUT
+      The cache folder of this maze, which may not exist yet. 
+    """
+    if os.environ.get("MAZE_CACHE", "1") == "0": 
+      return None
+    cache_root = os.environ.get("MAZE_CACHE_PATH")
+    if not cache_root: 
+      cache_dir = (os.environ.get("XDG_CACHE_HOME") 
+                   or os.path.join(os.path.expanduser("~"), ".cache"))
+      cache_root = os.path.join(cache_dir, "generative_agents", "maze")
+
+    source_hash = hashlib.sha1(f"{MAZE_CACHE_VERSION}".encode("utf-8"))
+    sources = [f"{env_matrix}/maze_meta_info.json"]
+    for block in MAZE_BLOCKS: 
+      sources += [f"{env_matrix}/special_blocks/{block}_blocks.csv"]
+      if block != "world": 
+        sources += [f"{env_matrix}/maze/{block}_maze.csv"]
+    sources += [f"{env_matrix}/maze/collision_maze.csv"]
+    for source in sources: 
+      with open(source, "rb") as infile: 
+        source_hash.update(infile.read())
+    return f"{cache_root}/{self.maze_name}-{source_hash.hexdigest()}"
+
+
+  def _load_maze_cache(self, cache_folder): 
+    """
+    Loads the tile layers and <address_tiles> from the cache. The layers are
+    memory-mapped copy-on-write, so changing a tile (e.g., with 
+    set_tile_collision) never writes back to the cache. 
+
+    INPUT
+      cache_folder: The folder from _maze_cache_folder. 
+    OUTPUT
+      True if the cache was loaded, False if there is none. 
+    """
+    if not os.path.exists(f"{cache_folder}/addresses.pickle"): 
+      return False
+    for layer in MAZE_CACHE_LAYERS: 
+      setattr(self, layer, numpy.load(f"{cache_folder}/{layer}.npy", 
+                                      mmap_mode="c"))
+    with open(f"{cache_folder}/addresses.pickle", "rb") as infile: 
+      self.address_table, self.address_tiles = pickle.load(infile)
+    self.address_ids = {address: address_id for address_id, address 
+                        in enumerate(self.address_table)}
+    self.collision_maze = self.collision_block_layer.astype(str).tolist()
+    return True
+
+
+  def _save_maze_cache(self, cache_folder): 
+    """
+    Writes the tile layers and <address_tiles> to the cache. We write into a
+    temp folder and rename it, so a process that loads the maze at the same
+    time never sees a partial cache. 
+
+    INPUT
+      cache_folder: The folder from _maze_cache_folder. 
+    OUTPUT
+      None
+    """
+    tmp_folder = f"{cache_folder}.{os.getpid()}.tmp"
+    try: 
+      os.makedirs(tmp_folder, exist_ok=True)
+      for layer in MAZE_CACHE_LAYERS: 
+        numpy.save(f"{tmp_folder}/{layer}.npy", getattr(self, layer))
+      # The pickle is written last; its presence marks a complete cache. 
+      with open(f"{tmp_folder}/addresses.pickle", "wb") as outfile: 
+        pickle.dump((self.address_table, self.address_tiles), outfile)
+      os.rename(tmp_folder, cache_folder)
+    except OSError: 
+      # Another process cached the same maze first, or we cannot write the
+      # cache at all; either way, we simply go on without it. 
+      shutil.rmtree(tmp_folder, ignore_errors=True)
 
 
   def turn_coordinate_to_tile(self, px_coordinate): 
@@ -225,8 +406,10 @@ class Maze:
 
   def access_tile(self, tile): 
     """
-    Returns the tiles details dictionary that is stored in self.tiles of the 
-    designated x, y location. 
+    Returns the tile details dictionary of the designated x, y location. This
+    is a view assembled from the tile layers; its "events" are the tile's 
+    live event set (an empty frozenset for tiles without events), so use 
+    add_event_from_tile and friends to change them. 
 
     INPUT
       tile: The tile coordinate of our interest in (x, y) form.
@@ -234,16 +417,46 @@ class Maze:
       The tile detail dictionary for the designated tile. 
     EXAMPLE OUTPUT
       Given (58, 9), 
-      self.tiles[9][58] = {'world': 'double studio', 
-            'sector': 'double studio', 'arena': 'bedroom 2', 
-            'game_object': 'bed', 'spawning_location': 'bedroom-2-a', 
-            'collision': False,
-            'events': {('double studio:double studio:bedroom 2:bed',
-                       None, None)}} 
+      {'world': 'double studio', 
+       'sector': 'double studio', 'arena': 'bedroom 2', 
+       'game_object': 'bed', 'spawning_location': 'bedroom-2-a', 
+       'collision': False,
+       'events': {('double studio:double studio:bedroom 2:bed',
+                  None, None)}} 
     """
     x = tile[0]
     y = tile[1]
-    return self.tiles[y][x]
+    table = self.address_table
+    return {"world": table[self.world_layer[y, x]], 
+            "sector": table[self.sector_layer[y, x]], 
+            "arena": table[self.arena_layer[y, x]], 
+            "game_object": table[self.game_object_layer[y, x]], 
+            "spawning_location": table[self.spawning_location_layer[y, x]], 
+            "collision": bool(self.collision_layer[y, x]), 
+            "events": self.tile_events.get((x, y), _NO_EVENTS)}
+
+
+  def get_tile_path_id(self, tile, level): 
+    """
+    Get the ID of the tile string address given its coordinate (see 
+    get_tile_path). Two tiles share an address at a level iff their IDs are
+    equal. 
+
+    INPUT: 
+      tile: The tile coordinate of our interest in (x, y) form.
+      level: world, sector, arena, or game object
+    OUTPUT
+      The integer ID of the address in <address_table>. 
+    """
+    x = tile[0]
+    y = tile[1]
+    if level == "world": 
+      return int(self.world_layer[y, x])
+    elif level == "sector": 
+      return int(self.sector_path_layer[y, x])
+    elif level == "arena": 
+      return int(self.arena_path_layer[y, x])
+    return int(self.game_object_path_layer[y, x])
 
 
   def get_tile_path(self, tile, level): 
@@ -260,46 +473,20 @@ class Maze:
       Given tile=(58, 9), and level=arena,
       "double studio:double studio:bedroom 2"
     """
-    x = tile[0]
-    y = tile[1]
-    tile = self.tiles[y][x]
-
-    path = f"{tile['world']}"
-    if level == "world": 
-      return path
-    else: 
-      path += f":{tile['sector']}"
-    
-    if level == "sector": 
-      return path
-    else: 
-      path += f":{tile['arena']}"
-
-    if level == "arena": 
-      return path
-    else: 
-      path += f":{tile['game_object']}"
-
-    return path
+    return self.address_table[self.get_tile_path_id(tile, level)]
 
 
-  def get_nearby_tiles(self, tile, vision_r): 
+  def get_nearby_bounds(self, tile, vision_r): 
     """
-    Given the current tile and vision_r, return a list of tiles that are 
-    within the radius. Note that this implementation looks at a square 
-    boundary when determining what is within the radius. 
-    i.e., for vision_r, returns x's. 
-    x x x x x 
-    x x x x x
-    x x P x x 
-    x x x x x
-    x x x x x
+    Given the current tile and vision_r, return the bounds of the square of
+    tiles that are within the radius (see get_nearby_tiles). 
 
     INPUT: 
       tile: The tile coordinate of our interest in (x, y) form.
       vision_r: The radius of the persona's vision. 
     OUTPUT: 
-      nearby_tiles: a list of tiles that are within the radius. 
+      (left_end, right_end, top_end, bottom_end): the tiles (x, y) with 
+      left_end <= x < right_end and top_end <= y < bottom_end are nearby. 
     """
     left_end = 0
     if tile[0] - vision_r > left_end: 
@@ -317,6 +504,29 @@ class Maze:
     if tile[1] - vision_r > top_end: 
       top_end = tile[1] - vision_r 
 
+    return left_end, right_end, top_end, bottom_end
+
+
+  def get_nearby_tiles(self, tile, vision_r): 
+    """
+    Given the current tile and vision_r, return a list of tiles that are 
+    within the radius. Note that this implementation looks at a square 
+    boundary when determining what is within the radius. 
+    i.e., for vision_r, returns x's. 
+    x x x x x 
+    x x x x x
+    x x P x x 
+    x x x x x
+    x x x x x
+
+    INPUT: 
+      tile: The tile coordinate of our interest in (x, y) form.
+      vision_r: The radius of the persona's vision. 
+    OUTPUT: 
+      nearby_tiles: a list of tiles that are within the radius. 
+    """
+    left_end, right_end, top_end, bottom_end = self.get_nearby_bounds(
+                                                 tile, vision_r)
     nearby_tiles = []
     for i in range(left_end, right_end): 
       for j in range(top_end, bottom_end): 
@@ -324,6 +534,85 @@ class Maze:
     return nearby_tiles
 
 
+  def get_nearby_tile_details(self, tile, vision_r): 
+    """
+    Returns the tile details (see access_tile) of one tile per distinct 
+    address within the radius, in the order in which get_nearby_tiles first
+    reaches each address. This is all that spatial memory needs to learn 
+    from the tiles a persona sees. 
+
+    INPUT: 
+      tile: The tile coordinate of our interest in (x, y) form.
+      vision_r: The radius of the persona's vision. 
+    OUTPUT: 
+      A list of tile detail dictionaries. 
+    """
+    left_end, right_end, top_end, bottom_end = self.get_nearby_bounds(
+                                                 tile, vision_r)
+    # The game object address spells out all four levels, so tiles with the
+    # same one have the same details. We transpose the window to walk it in
+    # get_nearby_tiles' (x first) order. 
+    window = self.game_object_path_layer[top_end:bottom_end, 
+                                         left_end:right_end].T.ravel()
+    _, first = numpy.unique(window, return_index=True)
+    height = bottom_end - top_end
+    details = []
+    for index in sorted(first.tolist()): 
+      details += [self.access_tile((left_end + index // height, 
+                                    top_end + index % height))]
+    return details
+
+
+  def get_nearby_events(self, tile, vision_r): 
+    """
+    Returns the events taking place within the radius and in the same arena
+    as the tile, with their distance from the tile. An event that occupies 
+    several tiles is measured from the first of its tiles in 
+    get_nearby_tiles' order. 
+
+    INPUT: 
+      tile: The tile coordinate of our interest in (x, y) form.
+      vision_r: The radius of the persona's vision. 
+    OUTPUT: 
+      A list of [distance, event tile, event] lists. 
+    """
+    left_end, right_end, top_end, bottom_end = self.get_nearby_bounds(
+                                                 tile, vision_r)
+    arena_events = self.arena_events.get(self.get_tile_path_id(tile, "arena"),
+                                         dict())
+    nearby_events = []
+    for event, event_tiles in arena_events.items(): 
+      nearby = [i for i in event_tiles 
+                if left_end <= i[0] < right_end 
+                and top_end <= i[1] < bottom_end]
+      if nearby: 
+        # (x, y) tuples order like get_nearby_tiles walks them. 
+        event_tile = min(nearby)
+        nearby_events += [[math.dist(event_tile, (tile[0], tile[1])), 
+                           event_tile, event]]
+    return nearby_events
+
+
+  def _link_event(self, index, key, curr_event, tile): 
+    # Records that <curr_event> occupies <tile> under <index>[<key>]. 
+    if key not in index: 
+      index[key] = dict()
+    if curr_event in index[key]: 
+      index[key][curr_event].add(tile)
+    else: 
+      index[key][curr_event] = set([tile])
+
+
+  def _unlink_event(self, index, key, curr_event, tile): 
+    # Undoes _link_event, dropping the entries that become empty. 
+    key_events = index[key]
+    key_events[curr_event].remove(tile)
+    if not key_events[curr_event]: 
+      del key_events[curr_event]
+      if not key_events: 
+        del index[key]
+
+
   def add_event_from_tile(self, curr_event, tile): 
     """
     Add an event triple to a tile.  
@@ -336,7 +625,15 @@ class Maze:
     OUPUT: 
       None
     """
-    self.tiles[tile[1]][tile[0]]["events"].add(curr_event)
+    tile = (tile[0], tile[1])
+    if tile in self.tile_events: 
+      self.tile_events[tile].add(curr_event)
+    else: 
+      self.tile_events[tile] = set([curr_event])
+
+    self._link_event(self.arena_events, self.get_tile_path_id(tile, "arena"), 
+                     curr_event, tile)
+    self._link_event(self.subject_events, curr_event[0], curr_event, tile)
 
 
   def remove_event_from_tile(self, curr_event, tile):
@@ -351,19 +648,22 @@ class Maze:
     OUPUT: 
       None
     """
-    curr_tile_ev_cp = self.tiles[tile[1]][tile[0]]["events"].copy()
-    for event in curr_tile_ev_cp: 
-      if event == curr_event:  
-        self.tiles[tile[1]][tile[0]]["events"].remove(event)
+    tile = (tile[0], tile[1])
+    if curr_event not in self.tile_events.get(tile, _NO_EVENTS): 
+      return
+    self.tile_events[tile].remove(curr_event)
+    if not self.tile_events[tile]: 
+      del self.tile_events[tile]
+
+    self._unlink_event(self.arena_events, 
+                       self.get_tile_path_id(tile, "arena"), curr_event, tile)
+    self._unlink_event(self.subject_events, curr_event[0], curr_event, tile)
 
 
   def turn_event_from_tile_idle(self, curr_event, tile):
-    curr_tile_ev_cp = self.tiles[tile[1]][tile[0]]["events"].copy()
-    for event in curr_tile_ev_cp: 
-      if event == curr_event:  
-        self.tiles[tile[1]][tile[0]]["events"].remove(event)
-        new_event = (event[0], None, None, None)
-        self.tiles[tile[1]][tile[0]]["events"].add(new_event)
+    if curr_event in self.tile_events.get((tile[0], tile[1]), _NO_EVENTS): 
+      self.remove_event_from_tile(curr_event, tile)
+      self.add_event_from_tile((curr_event[0], None, None, None), tile)
 
 
   def remove_subject_events_from_tile(self, subject, tile):
@@ -376,41 +676,106 @@ class Maze:
     OUPUT: 
       None
     """
-    curr_tile_ev_cp = self.tiles[tile[1]][tile[0]]["events"].copy()
-    for event in curr_tile_ev_cp: 
-      if event[0] == subject:  
-        self.tiles[tile[1]][tile[0]]["events"].remove(event)
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+    tile = (tile[0], tile[1])
+    subject_events = self.subject_events.get(subject)
+    if not subject_events: 
+      return
+    for event, event_tiles in list(subject_events.items()): 
+      if tile in event_tiles: 
+        self.remove_event_from_tile(event, tile)
 
 
+  def activate_object_event(self, obj_event, tile): 
+    """
+    Puts a game object's action event on its tile in place of the object's 
+    blank (idle) event, and remembers it so that idle_object_events can 
+    turn it back at the end of the step. 
 
+    INPUT: 
+      obj_event: The object's event triple. 
+        e.g., ('double studio[...]:bed', 'is', 'unmade', 'unmade')
+      tile: The tile coordinate of our interest in (x, y) form.
+    OUPUT: 
+      None
+    """
+    tile = (tile[0], tile[1])
+    self.active_object_events[obj_event] = tile
+    self.add_event_from_tile(obj_event, tile)
+    self.remove_event_from_tile((obj_event[0], None, None, None), tile)
 
 
+  def idle_object_events(self): 
+    """
+    Turns every object event activated since the last call back into its 
+    blank form, e.g., ('double studio[...]:bed', None, None, None). 
 
+    INPUT: 
+      None
+    OUPUT: 
+      None
+    """
+    for obj_event, tile in self.active_object_events.items(): 
+      self.turn_event_from_tile_idle(obj_event, tile)
+    self.active_object_events = dict()
 
 
+  def get_distance_field(self, address): 
+    """
+    Returns the (cached) distance field for a string address. See 
+    <self.distance_fields> in __init__. 
 
+    INPUT: 
+      address: A key of self.address_tiles. 
+        e.g., "the ville:hobbs cafe:cafe:cafe customer seating"
+    OUTPUT: 
+      A flat array('i') indexed by y * maze_width + x with the distance to 
+      the nearest walkable tile of the address, or -1 if unreachable. 
+    """
+    field = self.distance_fields.get(address)
+    if field is not None: 
+      self.distance_fields.move_to_end(address)
+      return field
 
+    field = self.path_grid.distance_field(self.address_tiles[address])
+    self.distance_fields[address] = field
+    if len(self.distance_fields) > self.distance_field_cache_size: 
+      self.distance_fields.popitem(last=False)
+    return field
 
 
+  def find_path_to_address(self, tile, address): 
+    """
+    Returns the shortest path from tile to the nearest walkable tile of the
+    address, considering all of the address's tiles. 
 
+    INPUT: 
+      tile: The starting tile coordinate in (x, y) form. 
+      address: A key of self.address_tiles. 
+    OUTPUT: 
+      A list of (x, y) tuples from tile to the nearest address tile, both 
+      inclusive, or None if no tile of the address is reachable. 
+    """
+    return self.path_grid.descend(self.get_distance_field(address), 
+                                  tuple(tile))
 
 
+  def set_tile_collision(self, tile, collision): 
+    """
+    Turns a tile into a collision block (or clears it) and invalidates 
+    everything that was derived from the collision grid. 
 
+    INPUT: 
+      tile: The tile coordinate of our interest in (x, y) form.
+      collision: True if the tile should block movement. 
+    OUPUT: 
+      None
+    """
+    x = tile[0]
+    y = tile[1]
+    if collision: 
+      self.collision_maze[y][x] = collision_block_id
+    else: 
+      self.collision_maze[y][x] = "0"
+    self.collision_layer[y, x] = collision
+    self.path_grid.set_walkable(tile, not collision)
+    self.distance_fields.clear()
@@ -5,8 +5,14 @@ File: path_finder.py
 Description: Implements various path finding functions for generative agents.
 Some of the functions are defunct. 
 """
+import heapq
+from array import array
+from collections import deque
+
 import numpy as np
 
+from step_profiler import profiled
+
 def print_maze(maze):
   for row in maze:
     for item in row:
@@ -93,88 +99,276 @@ def path_finder_v1(maze, start, end, collision_block_char, verbose=False):
   return path
 
 
-def path_finder_v2(a, start, end, collision_block_char, verbose=False):
-  def make_step(m, k):
-    for i in range(len(m)):
-      for j in range(len(m[i])):
-        if m[i][j] == k:
-          if i>0 and m[i-1][j] == 0 and a[i-1][j] == 0:
-            m[i-1][j] = k + 1
-          if j>0 and m[i][j-1] == 0 and a[i][j-1] == 0:
-            m[i][j-1] = k + 1
-          if i<len(m)-1 and m[i+1][j] == 0 and a[i+1][j] == 0:
-            m[i+1][j] = k + 1
-          if j<len(m[i])-1 and m[i][j+1] == 0 and a[i][j+1] == 0:
-             m[i][j+1] = k + 1
+class PathGrid: 
+  """
+  A walkability grid built once from a collision maze, with an A* search on
+  top of it. The grid is stored as a flat bytearray (1 = walkable, 
+  0 = collision block) indexed by y * width + x, so a lookup is a single 
+  integer index rather than a nested list access and string compare. 
+
+  Coordinates follow the same (x, y) convention as path_finder. 
+  e.g., PathGrid(maze.collision_maze, collision_block_id)
+  """
+  def __init__(self, collision_maze, collision_block_char): 
+    self.height = len(collision_maze)
+    self.width = len(collision_maze[0]) if collision_maze else 0
+    self.walkable = bytearray(self.width * self.height)
+    for y, row in enumerate(collision_maze): 
+      offset = y * self.width
+      for x, block in enumerate(row): 
+        if block != collision_block_char: 
+          self.walkable[offset + x] = 1
+
+
+  def is_walkable(self, tile): 
+    return self.walkable[tile[1] * self.width + tile[0]] == 1
+
+
+  def set_walkable(self, tile, walkable): 
+    self.walkable[tile[1] * self.width + tile[0]] = 1 if walkable else 0
+
+
+  def find_path(self, start, end): 
+    """
+    Finds the shortest 4-connected path from start to end with A* using the
+    Manhattan distance as the heuristic. 
+
+    INPUT: 
+      start: The starting tile coordinate in (x, y) form. 
+      end: The target tile coordinate in (x, y) form. 
+    OUTPUT: 
+      A list of (x, y) tuples from start to end, both inclusive. As with the
+      original flood fill, if end cannot be reached we return [end]. 
+    EXAMPLE OUTPUT: 
+      Given start=(0, 1), end=(3, 1) on an open row, 
+      [(0, 1), (1, 1), (2, 1), (3, 1)]
+    """
+    width = self.width
+    height = self.height
+    walkable = self.walkable
+    e_x, e_y = end
+    start_i = start[1] * width + start[0]
+    end_i = e_y * width + e_x
+
+    if start_i == end_i or not walkable[end_i]: 
+      return [(e_x, e_y)]
+
+    # <g_score> is the number of steps from start, and <came_from> lets us 
+    # walk back from end once we reach it. Heap entries are 
+    # (f, -g, index) so that among equal f we expand the deepest node first,
+    # which keeps the search close to a straight line in open rooms. 
+    g_score = {start_i: 0}
+    came_from = {start_i: -1}
+    open_heap = [(abs(start[0] - e_x) + abs(start[1] - e_y), 0, start_i)]
+    found = False
+    while open_heap: 
+      _, neg_g, curr = heapq.heappop(open_heap)
+      if curr == end_i: 
+        found = True
+        break
+      g = -neg_g
+      if g > g_score[curr]: 
+        continue
 
-  new_maze = []
-  for row in a: 
-    new_row = []
-    for j in row:
-      if j == collision_block_char: 
-        new_row += [1]
+      c_y, c_x = divmod(curr, width)
+      next_g = g + 1
+      for n_x, n_y in ((c_x, c_y - 1), (c_x - 1, c_y), 
+                       (c_x, c_y + 1), (c_x + 1, c_y)): 
+        if n_x < 0 or n_y < 0 or n_x >= width or n_y >= height: 
+          continue
+        n = n_y * width + n_x
+        if not walkable[n]: 
+          continue
+        if next_g < g_score.get(n, next_g + 1): 
+          g_score[n] = next_g
+          came_from[n] = curr
+          f = next_g + abs(n_x - e_x) + abs(n_y - e_y)
+          heapq.heappush(open_heap, (f, -next_g, n))
+
+    if not found: 
+      return [(e_x, e_y)]
+
+    the_path = []
+    curr = end_i
+    while curr != -1: 
+      c_y, c_x = divmod(curr, width)
+      the_path.append((c_x, c_y))
+      curr = came_from[curr]
+    the_path.reverse()
+    return the_path
+
+
+  def distance_field(self, sources): 
+    """
+    Runs a multi-source breadth first search from <sources> over the 
+    walkable tiles and returns the step distance of every tile to the 
+    nearest source. Sources that are collision blocks are skipped. 
+
+    INPUT: 
+      sources: An iterable of (x, y) tile coordinates. 
+    OUTPUT: 
+      A flat array('i') of length width * height indexed by y * width + x, 
+      holding the distance to the nearest source, or -1 if unreachable. 
+    """
+    width = self.width
+    height = self.height
+    walkable = self.walkable
+    field = array("i", [-1]) * (width * height)
+    frontier = deque()
+    for x, y in sources: 
+      i = y * width + x
+      if walkable[i] and field[i] == -1: 
+        field[i] = 0
+        frontier.append(i)
+
+    while frontier: 
+      curr = frontier.popleft()
+      c_y, c_x = divmod(curr, width)
+      next_d = field[curr] + 1
+      if c_y > 0: 
+        n = curr - width
+        if walkable[n] and field[n] == -1: 
+          field[n] = next_d
+          frontier.append(n)
+      if c_x > 0: 
+        n = curr - 1
+        if walkable[n] and field[n] == -1: 
+          field[n] = next_d
+          frontier.append(n)
+      if c_y < height - 1: 
+        n = curr + width
+        if walkable[n] and field[n] == -1: 
+          field[n] = next_d
+          frontier.append(n)
+      if c_x < width - 1: 
+        n = curr + 1
+        if walkable[n] and field[n] == -1: 
+          field[n] = next_d
+          frontier.append(n)
+    return field
+
+
+  def descend(self, field, start): 
+    """
+    Follows a distance field downhill from start until it reaches one of the
+    field's sources. This is the shortest path to the nearest source. 
+
+    INPUT: 
+      field: A distance field returned by distance_field(). 
+      start: The starting tile coordinate in (x, y) form. 
+    OUTPUT: 
+      A list of (x, y) tuples from start to the nearest source, both 
+      inclusive, or None if no source is reachable from start. 
+    """
+    width = self.width
+    height = self.height
+    x, y = start
+    d = field[y * width + x]
+    if d < 0: 
+      return None
+
+    the_path = [(x, y)]
+    while d > 0: 
+      d -= 1
+      if y > 0 and field[(y - 1) * width + x] == d: 
+        y -= 1
+      elif x > 0 and field[y * width + x - 1] == d: 
+        x -= 1
+      elif y < height - 1 and field[(y + 1) * width + x] == d: 
+        y += 1
       else: 
-        new_row += [0]
-    new_maze += [new_row]
-  a = new_maze
-
-  m = []
-  for i in range(len(a)):
-      m.append([])
-      for j in range(len(a[i])):
-          m[-1].append(0)
-  i,j = start
-  m[i][j] = 1 
-
-  k = 0
-  except_handle = 150
-  while m[end[0]][end[1]] == 0:
-      k += 1
-      make_step(m, k)
-
-      if except_handle == 0: 
-        break
-      except_handle -= 1 
-
-  i, j = end
-  k = m[i][j]
-  the_path = [(i,j)]
-  while k > 1:
-    if i > 0 and m[i - 1][j] == k-1:
-      i, j = i-1, j
-      the_path.append((i, j))
-      k-=1
-    elif j > 0 and m[i][j - 1] == k-1:
-      i, j = i, j-1
-      the_path.append((i, j))
-      k-=1
-    elif i < len(m) - 1 and m[i + 1][j] == k-1:
-      i, j = i+1, j
-      the_path.append((i, j))
-      k-=1
-    elif j < len(m[i]) - 1 and m[i][j + 1] == k-1:
-      i, j = i, j+1
-      the_path.append((i, j))
-      k -= 1
-        
-  the_path.reverse()
-  return the_path
+        x += 1
+      the_path.append((x, y))
+    return the_path
+
+
+  def find_path_to_nearest(self, start, targets): 
+    """
+    Runs a breadth first search from start that stops at the first target it
+    reaches. Unlike distance_field, this only visits the tiles that are
+    closer to start than the nearest target, so it is cheap for one-off
+    target sets that are not worth caching a field for.
+
+    INPUT: 
+      start: The starting tile coordinate in (x, y) form.
+      targets: A set of (x, y) tile coordinates.
+    OUTPUT: 
+      A list of (x, y) tuples from start to the nearest walkable target,
+      both inclusive, or None if no target is reachable from start.
+    """
+    width = self.width
+    height = self.height
+    walkable = self.walkable
+    target_i = set()
+    for x, y in targets: 
+      if walkable[y * width + x]: 
+        target_i.add(y * width + x)
+    start_i = start[1] * width + start[0]
+    if not target_i or not walkable[start_i]: 
+      return None
+
+    came_from = {start_i: -1}
+    frontier = deque([start_i])
+    found = start_i if start_i in target_i else -1
+    while frontier and found == -1: 
+      curr = frontier.popleft()
+      c_y, c_x = divmod(curr, width)
+      for n_x, n_y in ((c_x, c_y - 1), (c_x - 1, c_y),
+                       (c_x, c_y + 1), (c_x + 1, c_y)): 
+        if n_x < 0 or n_y < 0 or n_x >= width or n_y >= height: 
+          continue
+        n = n_y * width + n_x
+        if not walkable[n] or n in came_from: 
+          continue
+        came_from[n] = curr
+        if n in target_i: 
+          found = n
+          break
+        frontier.append(n)
+    if found == -1: 
+      return None
+
+    the_path = []
+    curr = found
+    while curr != -1: 
+      c_y, c_x = divmod(curr, width)
+      the_path.append((c_x, c_y))
+      curr = came_from[curr]
+    the_path.reverse()
+    return the_path
+
+
+def _as_path_grid(maze, collision_block_char): 
+  if isinstance(maze, PathGrid): 
+    return maze
+  return PathGrid(maze, collision_block_char)
 
 
+def path_finder_v2(a, start, end, collision_block_char, verbose=False):
+  # Kept for callers that work in (row, col) space. This used to flood fill 
+  # the whole grid once per step of distance; it now runs A* on a PathGrid.
+  grid = _as_path_grid(a, collision_block_char)
+  path = grid.find_path((start[1], start[0]), (end[1], end[0]))
+  return [(i[1], i[0]) for i in path]
+
+
+@profiled("path_finder")
 def path_finder(maze, start, end, collision_block_char, verbose=False):
-  # EMERGENCY PATCH
-  start = (start[1], start[0])
-  end = (end[1], end[0])
-  # END EMERGENCY PATCH
-
-  path = path_finder_v2(maze, start, end, collision_block_char, verbose)
-
-  new_path = []
-  for i in path: 
-    new_path += [(i[1], i[0])]
-  path = new_path
-  
-  return path
+  """
+  Returns the shortest path between two tiles. 
+
+  INPUT: 
+    maze: Either a <PathGrid> (preferred; e.g., maze.path_grid) or a raw 
+          collision maze in list-of-list form, in which case a grid is built
+          for this call. 
+    start: The starting tile coordinate in (x, y) form. 
+    end: The target tile coordinate in (x, y) form. 
+    collision_block_char: The collision block id in the raw collision maze.
+  OUTPUT: 
+    A list of (x, y) tuples that makes up the path, including start and end.
+  """
+  grid = _as_path_grid(maze, collision_block_char)
+  return grid.find_path(tuple(start), tuple(end))
 
 
 def closest_coordinate(curr_coordinate, target_coordinates): 
@@ -207,8 +401,9 @@ def path_finder_2(maze, start, end, collision_block_char, verbose=False):
   t_right = (end[0]+1, end[1])
   pot_target_coordinates = [t_top, t_bottom, t_left, t_right]
 
-  maze_width = len(maze[0]) 
-  maze_height = len(maze)
+  grid = _as_path_grid(maze, collision_block_char)
+  maze_width = grid.width
+  maze_height = grid.height
   target_coordinates = []
   for coordinate in pot_target_coordinates: 
     if coordinate[0] >= 0 and coordinate[0] < maze_width and coordinate[1] >= 0 and coordinate[1] < maze_height: 
@@ -216,7 +411,7 @@ def path_finder_2(maze, start, end, collision_block_char, verbose=False):
 
   target_coordinate = closest_coordinate(start, target_coordinates)
 
-  path = path_finder(maze, start, target_coordinate, collision_block_char, verbose=False)
+  path = path_finder(grid, start, target_coordinate, collision_block_char, verbose=False)
   return path
 
 
@@ -41,6 +41,10 @@ def execute(persona, maze, personas, plan):
     # <target_tiles> is a list of tile coordinates where the persona may go 
     # to execute the current action. The goal is to pick one of them.
     target_tiles = None
+    # <path> is set directly when we can read it off the maze's distance 
+    # field for the target address. Otherwise it stays None and we fall back
+    # to sampling target tiles and running path_finder on each. 
+    path = None
 
     print ('aldhfoaf/????')
     print (plan)
@@ -49,18 +53,18 @@ def execute(persona, maze, personas, plan):
       # Executing persona-persona interaction.
       target_p_tile = (personas[plan.split("<persona>")[-1].strip()]
                        .scratch.curr_tile)
-      potential_path = path_finder(maze.collision_maze, 
+      potential_path = path_finder(maze.path_grid, 
                                    persona.scratch.curr_tile, 
                                    target_p_tile, 
                                    collision_block_id)
       if len(potential_path) <= 2: 
         target_tiles = [potential_path[0]]
       else: 
-        potential_1 = path_finder(maze.collision_maze, 
+        potential_1 = path_finder(maze.path_grid, 
                                 persona.scratch.curr_tile, 
                                 potential_path[int(len(potential_path)/2)], 
                                 collision_block_id)
-        potential_2 = path_finder(maze.collision_maze, 
+        potential_2 = path_finder(maze.path_grid, 
                                 persona.scratch.curr_tile, 
                                 potential_path[int(len(potential_path)/2)+1], 
                                 collision_block_id)
@@ -92,53 +96,11 @@ def execute(persona, maze, personas, plan):
         maze.address_tiles["Johnson Park:park:park garden"] #ERRORRRRRRR
       else: 
         target_tiles = maze.address_tiles[plan]
+        path = path_to_nearest_address_tile(persona, maze, personas, plan)
 
-    # There are sometimes more than one tile returned from this (e.g., a tabe
-    # may stretch many coordinates). So, we sample a few here. And from that 
-    # random sample, we will take the closest ones. 
-    if len(target_tiles) < 4: 
-      target_tiles = random.sample(list(target_tiles), len(target_tiles))
-    else:
-      target_tiles = random.sample(list(target_tiles), 4)
-    # If possible, we want personas to occupy different tiles when they are 
-    # headed to the same location on the maze. It is ok if they end up on the 
-    # same time, but we try to lower that probability. 
-    # We take care of that overlap here.  
-    persona_name_set = set(personas.keys())
-    new_target_tiles = []
-    for i in target_tiles: 
-      curr_event_set = maze.access_tile(i)["events"]
-      pass_curr_tile = False
-      for j in curr_event_set: 
-        if j[0] in persona_name_set: 
-          pass_curr_tile = True
-      if not pass_curr_tile: 
-        new_target_tiles += [i]
-    if len(new_target_tiles) == 0: 
-      new_target_tiles = target_tiles
-    target_tiles = new_target_tiles
-
-    # Now that we've identified the target tile, we find the shortest path to
-    # one of the target tiles. 
-    curr_tile = persona.scratch.curr_tile
-    collision_maze = maze.collision_maze
-    closest_target_tile = None
-    path = None
-    for i in target_tiles: 
-      # path_finder takes a collision_mze and the curr_tile coordinate as 
-      # an input, and returns a list of coordinate tuples that becomes the
-      # path. 
-      # e.g., [(0, 1), (1, 1), (1, 2), (1, 3), (1, 4)...]
-      curr_path = path_finder(maze.collision_maze, 
-                              curr_tile, 
-                              i, 
-                              collision_block_id)
-      if not closest_target_tile: 
-        closest_target_tile = i
-        path = curr_path
-      elif len(curr_path) < len(path): 
-        closest_target_tile = i
-        path = curr_path
+    if path is None: 
+      path = path_to_sampled_target_tile(persona, maze, personas, 
+                                         target_tiles)
 
     # Actually setting the <planned_path> and <act_path_set>. We cut the 
     # first element in the planned_path because it includes the curr_tile. 
@@ -159,16 +121,103 @@ def execute(persona, maze, personas, plan):
   return execution
 
 
+def path_to_nearest_address_tile(persona, maze, personas, address): 
+  """
+  Finds the path to the closest tile of an address using the maze's cached
+  distance field for that address. If possible, we want personas to occupy 
+  different tiles when they are headed to the same location, so if the 
+  closest tile already has another persona on it, we search outward from 
+  the persona's tile for the nearest free tile of the address instead. 
 
+  INPUT: 
+    persona: Current <Persona> instance.  
+    maze: An instance of current <Maze>.
+    personas: A dictionary of all personas in the world. 
+    address: A key of maze.address_tiles. 
+  OUTPUT: 
+    A list of (x, y) tuples starting at the persona's current tile, or None
+    if no tile of the address is reachable. 
+  """
+  curr_tile = tuple(persona.scratch.curr_tile)
+  path = maze.find_path_to_address(curr_tile, address)
+  if not path: 
+    return None
+
+  address_tiles = maze.address_tiles[address]
+  occupied = set()
+  for persona_name, other in personas.items(): 
+    if persona_name == persona.name or not other.scratch.curr_tile: 
+      continue
+    other_tile = tuple(other.scratch.curr_tile)
+    if other_tile in address_tiles: 
+      occupied.add(other_tile)
+  if path[-1] not in occupied: 
+    return path
+
+  free_tiles = address_tiles - occupied
+  if not free_tiles: 
+    return path
+  free_path = maze.path_grid.find_path_to_nearest(curr_tile, free_tiles)
+  return free_path or path
+
+
+def path_to_sampled_target_tile(persona, maze, personas, target_tiles): 
+  """
+  Samples up to 4 of the target tiles, and returns the shortest path to one
+  of them. This is used for persona, waiting and random targets, and as the
+  fallback when the distance field for an address cannot reach the persona.
 
-
-
-
-
-
-
-
-
-
-
-
+  INPUT: 
+    persona: Current <Persona> instance.  
+    maze: An instance of current <Maze>.
+    personas: A dictionary of all personas in the world. 
+    target_tiles: A collection of candidate (x, y) tile coordinates. 
+  OUTPUT: 
+    A list of (x, y) tuples starting at the persona's current tile. 
+  """
+  # There are sometimes more than one tile returned from this (e.g., a tabe
+  # may stretch many coordinates). So, we sample a few here. And from that 
+  # random sample, we will take the closest ones. 
+  if len(target_tiles) < 4: 
+    target_tiles = random.sample(list(target_tiles), len(target_tiles))
+  else:
+    target_tiles = random.sample(list(target_tiles), 4)
+  # If possible, we want personas to occupy different tiles when they are 
+  # headed to the same location on the maze. It is ok if they end up on the 
+  # same time, but we try to lower that probability. 
+  # We take care of that overlap here.  
+  persona_name_set = set(personas.keys())
+  new_target_tiles = []
+  for i in target_tiles: 
+    curr_event_set = maze.access_tile(i)["events"]
+    pass_curr_tile = False
+    for j in curr_event_set: 
+      if j[0] in persona_name_set: 
+        pass_curr_tile = True
+    if not pass_curr_tile: 
+      new_target_tiles += [i]
+  if len(new_target_tiles) == 0: 
+    new_target_tiles = target_tiles
+  target_tiles = new_target_tiles
+
+  # Now that we've identified the target tile, we find the shortest path to
+  # one of the target tiles. 
+  curr_tile = persona.scratch.curr_tile
+  closest_target_tile = None
+  path = None
+  for i in target_tiles: 
+    # path_finder takes the maze's path grid and the curr_tile coordinate as
+    # an input, and returns a list of coordinate tuples that becomes the
+    # path. 
+    # e.g., [(0, 1), (1, 1), (1, 2), (1, 3), (1, 4)...]
+    curr_path = path_finder(maze.path_grid, 
+                            curr_tile, 
+                            i, 
+                            collision_block_id)
+    if not closest_target_tile: 
+      closest_target_tile = i
+      path = curr_path
+    elif len(curr_path) < len(path): 
+      closest_target_tile = i
+      path = curr_path
+  return path
@@ -22,6 +22,20 @@ def generate_poig_score(persona, event_type, description):
     return run_gpt_prompt_chat_poignancy(persona, 
                            persona.scratch.act_description)[0]
 
+def generate_poig_scores(persona, event_type, descriptions): 
+  # Like generate_poig_score, for several descriptions at once. The events 
+  # that are not idle are rated together in one prompt with POIGNANCY_BATCH=1. 
+  if event_type != "event": 
+    return [generate_poig_score(persona, event_type, description) 
+            for description in descriptions]
+
+  scores = [1 if "is idle" in desc else None for desc in descriptions]
+  to_rate = [desc for desc in descriptions if "is idle" not in desc]
+  if to_rate: 
+    rated = iter(run_gpt_prompt_event_poignancy_batch(persona, to_rate)[0])
+    scores = [next(rated) if score is None else score for score in scores]
+  return scores
+
 def perceive(persona, maze): 
   """
   Perceives events around the persona and saves it to the memory, both events 
@@ -41,71 +55,36 @@ def perceive(persona, maze):
     ret_events: a list of <ConceptNode> that are perceived and new. 
   """
   # PERCEIVE SPACE
-  # We get the nearby tiles given our current tile and the persona's vision
-  # radius. 
-  nearby_tiles = maze.get_nearby_tiles(persona.scratch.curr_tile, 
-                                       persona.scratch.vision_r)
-
-  # We then store the perceived space. Note that the s_mem of the persona is
-  # in the form of a tree constructed using dictionaries. 
-  for i in nearby_tiles: 
-    i = maze.access_tile(i)
-    if i["world"]: 
-      if (i["world"] not in persona.s_mem.tree): 
-        persona.s_mem.tree[i["world"]] = {}
-    if i["sector"]: 
-      if (i["sector"] not in persona.s_mem.tree[i["world"]]): 
-        persona.s_mem.tree[i["world"]][i["sector"]] = {}
-    if i["arena"]: 
-      if (i["arena"] not in persona.s_mem.tree[i["world"]]
-                                              [i["sector"]]): 
-        persona.s_mem.tree[i["world"]][i["sector"]][i["arena"]] = []
-    if i["game_object"]: 
-      if (i["game_object"] not in persona.s_mem.tree[i["world"]]
-                                                    [i["sector"]]
-                                                    [i["arena"]]): 
-        persona.s_mem.tree[i["world"]][i["sector"]][i["arena"]] += [
-                                                             i["game_object"]]
+  # We get the details of the nearby tiles given our current tile and the 
+  # persona's vision radius (one tile for each distinct address, which is 
+  # all that spatial memory can learn from), and store the perceived space. 
+  # Note that the s_mem of the persona is in the form of a tree constructed
+  # using dictionaries. 
+  for tile_details in maze.get_nearby_tile_details(persona.scratch.curr_tile,
+                                                   persona.scratch.vision_r): 
+    persona.s_mem.add_tile(tile_details)
 
   # PERCEIVE EVENTS. 
   # We will perceive events that take place in the same arena as the
-  # persona's current arena. 
-  curr_arena_path = maze.get_tile_path(persona.scratch.curr_tile, "arena")
-  # We do not perceive the same event twice (this can happen if an object is
-  # extended across multiple tiles).
-  percept_events_set = set()
-  # We will order our percept based on the distance, with the closest ones
-  # getting priorities. 
-  percept_events_list = []
-  # First, we put all events that are occuring in the nearby tiles into the
-  # percept_events_list
-  for tile in nearby_tiles: 
-    tile_details = maze.access_tile(tile)
-    if tile_details["events"]: 
-      if maze.get_tile_path(tile, "arena") == curr_arena_path:  
-        # This calculates the distance between the persona's current tile, 
-        # and the target tile.
-        dist = math.dist([tile[0], tile[1]], 
-                         [persona.scratch.curr_tile[0], 
-                          persona.scratch.curr_tile[1]])
-        # Add any relevant events to our temp set/list with the distant info. 
-        for event in tile_details["events"]: 
-          if event not in percept_events_set: 
-            percept_events_list += [[dist, event]]
-            percept_events_set.add(event)
+  # persona's current arena. The maze indexes its events by arena, so we 
+  # only look at the events in ours, and not at every nearby tile. Each 
+  # event comes once (an object can extend across multiple tiles) with its
+  # distance, and we order our percept on the distance, with the closest 
+  # ones getting priorities. 
+  percept_events_list = maze.get_nearby_events(persona.scratch.curr_tile, 
+                                               persona.scratch.vision_r)
 
   # We sort, and perceive only persona.scratch.att_bandwidth of the closest
   # events. If the bandwidth is larger, then it means the persona can perceive
   # more elements within a small area. 
-  percept_events_list = sorted(percept_events_list, key=itemgetter(0))
+  percept_events_list = sorted(percept_events_list, key=itemgetter(0, 1))
   perceived_events = []
-  for dist, event in percept_events_list[:persona.scratch.att_bandwidth]: 
+  for dist, tile, event in percept_events_list[:persona.scratch.att_bandwidth]: 
     perceived_events += [event]
 
-  # Storing events. 
-  # <ret_events> is a list of <ConceptNode> instances from the persona's 
-  # associative memory. 
-  ret_events = []
+  # We normalize each perceived event into its (s, p, o) summary, its 
+  # description, and the text we embed for it. 
+  normalized_events = []
   for p_event in perceived_events: 
     s, p, o, desc = p_event
     if not p: 
@@ -114,14 +93,49 @@ def perceive(persona, maze):
       o = "idle"
       desc = "idle"
     desc = f"{s.split(':')[-1]} is {desc}"
-    p_event = (s, p, o)
-
-    # We retrieve the latest persona.scratch.retention events. If there is  
-    # something new that is happening (that is, p_event not in latest_events),
-    # then we add that event to the a_mem and return it. 
-    latest_events = persona.a_mem.get_summarized_latest_events(
-                                    persona.scratch.retention)
-    if p_event not in latest_events:
+    desc_embedding_in = desc
+    if "(" in desc: 
+      desc_embedding_in = (desc_embedding_in.split("(")[1]
+                                            .split(")")[0]
+                                            .strip())
+    normalized_events += [((s, p, o), desc, desc_embedding_in)]
+
+  # We embed the texts of all the events that look new (and of the persona's
+  # own chat, if we see it) in one batch, rather than once per event, and 
+  # with POIGNANCY_BATCH=1 likewise rate their poignancy in one prompt. 
+  new_events = [i for i in normalized_events 
+                if not persona.a_mem.is_recent_event(i[0], 
+                                                     persona.scratch.retention)]
+  to_embed = []
+  for p_event, desc, desc_embedding_in in new_events: 
+    to_embed += [desc_embedding_in]
+    if p_event[0] == f"{persona.name}" and p_event[1] == "chat with": 
+      to_embed += [persona.scratch.act_description]
+  to_embed = [i for i in dict.fromkeys(to_embed) 
+              if i not in persona.a_mem.embeddings]
+  fetched_embeddings = dict(zip(to_embed, get_embeddings(to_embed)))
+  to_rate = list(dict.fromkeys(i[2] for i in new_events))
+  rated_poignancy = dict(zip(to_rate, 
+                             generate_poig_scores(persona, "event", to_rate)))
+
+  def _embedding(text): 
+    if text in persona.a_mem.embeddings: 
+      return persona.a_mem.embeddings[text]
+    if text in fetched_embeddings: 
+      return fetched_embeddings[text]
+    return get_embedding(text)
+
+  # Storing events. 
+  # <ret_events> is a list of <ConceptNode> instances from the persona's 
+  # associative memory. 
+  ret_events = []
+  for p_event, desc, desc_embedding_in in normalized_events: 
+    s, p, o = p_event
+
+    # We check p_event against the latest persona.scratch.retention events. 
+    # If there is something new that is happening (that is, p_event is not 
+    # one of them), then we add that event to the a_mem and return it. 
+    if not persona.a_mem.is_recent_event(p_event, persona.scratch.retention):
       # We start by managing keywords. 
       keywords = set()
       sub = p_event[0]
@@ -133,35 +147,23 @@ def perceive(persona, maze):
       keywords.update([sub, obj])
 
       # Get event embedding
-      desc_embedding_in = desc
-      if "(" in desc: 
-        desc_embedding_in = (desc_embedding_in.split("(")[1]
-                                              .split(")")[0]
-                                              .strip())
-      if desc_embedding_in in persona.a_mem.embeddings: 
-        event_embedding = persona.a_mem.embeddings[desc_embedding_in]
-      else: 
-        event_embedding = get_embedding(desc_embedding_in)
-      event_embedding_pair = (desc_embedding_in, event_embedding)
+      event_embedding_pair = (desc_embedding_in, _embedding(desc_embedding_in))
       
       # Get event poignancy. 
-      event_poignancy = generate_poig_score(persona, 
-                                            "event", 
-                                            desc_embedding_in)
+      if desc_embedding_in in rated_poignancy: 
+        event_poignancy = rated_poignancy[desc_embedding_in]
+      else: 
+        event_poignancy = generate_poig_score(persona, 
+                                              "event", 
+                                              desc_embedding_in)
 
       # If we observe the persona's self chat, we include that in the memory
       # of the persona here. 
       chat_node_ids = []
       if p_event[0] == f"{persona.name}" and p_event[1] == "chat with": 
         curr_event = persona.scratch.act_event
-        if persona.scratch.act_description in persona.a_mem.embeddings: 
-          chat_embedding = persona.a_mem.embeddings[
-                             persona.scratch.act_description]
-        else: 
-          chat_embedding = get_embedding(persona.scratch
-                                                .act_description)
         chat_embedding_pair = (persona.scratch.act_description, 
-                               chat_embedding)
+                               _embedding(persona.scratch.act_description))
         chat_poignancy = generate_poig_score(persona, "chat", 
                                              persona.scratch.act_description)
         chat_node = persona.a_mem.add_chat(persona.scratch.curr_time, None,
@@ -6,6 +6,7 @@ Description: This defines the "Plan" module for generative agents.
 """
 import datetime
 import math
+import os
 import random 
 import sys
 import time
@@ -276,6 +277,33 @@ def generate_act_obj_event_triple(act_game_object, act_obj_desc, persona):
   return run_gpt_prompt_act_obj_event_triple(act_game_object, act_obj_desc, persona)[0]
 
 
+def generate_action_resolution(act_desp, persona, maze, act_world): 
+  """
+  Asks for the sector, arena, game object, emojis, event triple and object 
+  state of a new action in one prompt. 
+
+  INPUT: 
+    act_desp: the description of the action (e.g., "sleeping")
+    persona: The Persona class instance 
+    maze: The Maze class instance 
+    act_world: the world the persona is in
+  OUTPUT: 
+    a dict of the fields that came back valid; see 
+    run_gpt_prompt_resolve_action. 
+  EXAMPLE OUTPUT: 
+    {"sector": "Isabella Rodriguez's apartment", "arena": "main room", 
+     "game_object": "bed", "pronunciatio": "😴", 
+     "event": ("Isabella Rodriguez", "is", "sleeping")}
+  """
+  if debug: print ("GNS FUNCTION: <generate_action_resolution>")
+  try: 
+    return run_gpt_prompt_resolve_action(act_desp, persona, maze, act_world)[0]
+  except Exception:
+    import logging
+    logging.exception("generate_action_resolution failed")
+    return dict()
+
+
 def generate_convo(maze, init_persona, target_persona): 
   curr_loc = maze.access_tile(init_persona.scratch.curr_tile)
 
@@ -605,14 +633,14 @@ def _determine_action(persona, maze):
   print ("------")
 
   # 1440
-  x_emergency = 0
-  for i in persona.scratch.f_daily_schedule: 
-    x_emergency += i[1]
+  # We make sure the schedule covers the whole day by padding it with 
+  # sleeping. 
+  x_emergency = persona.scratch.f_daily_schedule.total_minutes()
   # print ("x_emergency", x_emergency)
 
   if 1440 - x_emergency > 0: 
     print ("x_emergency__AAA", x_emergency)
-  persona.scratch.f_daily_schedule += [["sleeping", 1440 - x_emergency]]
+  persona.scratch.f_daily_schedule.fill_to(1440, "sleeping")
   
 
 
@@ -623,21 +651,46 @@ def _determine_action(persona, maze):
 
   # Finding the target location of the action and creating action-related
   # variables.
+  # With FUSED_ACTION=1, we first ask for all of them in one prompt (see 
+  # generate_action_resolution); <fused> holds the fields that came back 
+  # valid, and we only run the separate prompts for the rest. 
   act_world = maze.access_tile(persona.scratch.curr_tile)["world"]
+  fused = dict()
+  if os.environ.get("FUSED_ACTION", "0") == "1": 
+    fused = generate_action_resolution(act_desp, persona, maze, act_world)
   # act_sector = maze.access_tile(persona.scratch.curr_tile)["sector"]
-  act_sector = generate_action_sector(act_desp, persona, maze)
-  act_arena = generate_action_arena(act_desp, persona, maze, act_world, act_sector)
+  act_sector = fused.get("sector")
+  if act_sector is None: 
+    act_sector = generate_action_sector(act_desp, persona, maze)
+  act_arena = fused.get("arena")
+  if act_arena is None: 
+    act_arena = generate_action_arena(act_desp, persona, maze, act_world, 
+                                      act_sector)
   act_address = f"{act_world}:{act_sector}:{act_arena}"
-  act_game_object = generate_action_game_object(act_desp, act_address,
-                                                persona, maze)
+  act_game_object = fused.get("game_object")
+  if act_game_object is None: 
+    act_game_object = generate_action_game_object(act_desp, act_address,
+                                                  persona, maze)
   new_address = f"{act_world}:{act_sector}:{act_arena}:{act_game_object}"
-  act_pron = generate_action_pronunciatio(act_desp, persona)
-  act_event = generate_action_event_triple(act_desp, persona)
+  act_pron = fused.get("pronunciatio")
+  if act_pron is None: 
+    act_pron = generate_action_pronunciatio(act_desp, persona)
+  act_event = fused.get("event")
+  if act_event is None: 
+    act_event = generate_action_event_triple(act_desp, persona)
   # Persona's actions also influence the object states. We set those up here. 
-  act_obj_desp = generate_act_obj_desc(act_game_object, act_desp, persona)
-  act_obj_pron = generate_action_pronunciatio(act_obj_desp, persona)
-  act_obj_event = generate_act_obj_event_triple(act_game_object, 
-                                                act_obj_desp, persona)
+  # The fused object fields are only there if the fused game object was used.
+  act_obj_desp = fused.get("object_description")
+  act_obj_pron = fused.get("object_pronunciatio")
+  if act_obj_desp is None: 
+    act_obj_desp = generate_act_obj_desc(act_game_object, act_desp, persona)
+    act_obj_pron = None
+  if act_obj_pron is None: 
+    act_obj_pron = generate_action_pronunciatio(act_obj_desp, persona)
+  act_obj_event = fused.get("object_event")
+  if act_obj_event is None: 
+    act_obj_event = generate_act_obj_event_triple(act_game_object, 
+                                                  act_obj_desp, persona)
 
   # Adding the action to persona's queue. 
   persona.scratch.add_new_action(new_address, 
@@ -952,6 +1005,24 @@ def plan(persona, maze, personas, new_day, retrieved):
   OUTPUT 
     The target action address of the persona (persona.scratch.act_address).
   """ 
+  plan_own_action(persona, maze, new_day)
+  return plan_reaction(persona, maze, personas, retrieved)
+
+
+def plan_own_action(persona, maze, new_day): 
+  """
+  The part of planning that only looks at the persona itself: the long term
+  planning at the start of a day, and picking the next action once the
+  current one is finished. Since it does not touch other personas, this can 
+  run concurrently for all personas in a step. 
+
+  INPUT: 
+    persona: Current <Persona> instance whose action we are determining. 
+    maze: Current <Maze> instance of the world. 
+    new_day: False, "First day", or "New day" (see plan). 
+  OUTPUT 
+    None
+  """
   # PART 1: Generate the hourly schedule. 
   if new_day: 
     _long_term_planning(persona, new_day)
@@ -960,6 +1031,22 @@ def plan(persona, maze, personas, new_day, retrieved):
   if persona.scratch.act_check_finished(): 
     _determine_action(persona, maze)
 
+
+def plan_reaction(persona, maze, personas, retrieved): 
+  """
+  The part of planning that reacts to what the persona retrieved. This can 
+  read and change the state of other personas (e.g., starting a chat sets 
+  both personas' actions), so it must run one persona at a time. 
+
+  INPUT: 
+    persona: Current <Persona> instance whose action we are determining. 
+    maze: Current <Maze> instance of the world. 
+    personas: A dictionary that contains all persona names as keys, and the 
+              Persona instance as values. 
+    retrieved: dictionary of dictionary (see plan). 
+  OUTPUT 
+    The target action address of the persona (persona.scratch.act_address).
+  """
   # PART 3: If you perceived an event that needs to be responded to (saw 
   # another persona), and retrieved relevant information. 
   # Step 1: Retrieved may have multiple events represented in it. The first 
@@ -86,6 +86,24 @@ def generate_poig_score(persona, event_type, description):
 
 
 
+def generate_poig_scores(persona, event_type, descriptions): 
+  if debug: print ("GNS FUNCTION: <generate_poig_scores>")
+
+  # Like generate_poig_score, for several descriptions at once. The ones that
+  # are not idle are rated together in one prompt with POIGNANCY_BATCH=1. 
+  if event_type != "event" and event_type != "thought": 
+    return [generate_poig_score(persona, event_type, description) 
+            for description in descriptions]
+
+  scores = [1 if "is idle" in desc else None for desc in descriptions]
+  to_rate = [desc for desc in descriptions if "is idle" not in desc]
+  if to_rate: 
+    rated = iter(run_gpt_prompt_event_poignancy_batch(persona, to_rate)[0])
+    scores = [next(rated) if score is None else score for score in scores]
+  return scores
+
+
+
 def generate_planning_thought_on_convo(persona, all_utt):
   if debug: print ("GNS FUNCTION: <generate_planning_thought_on_convo>")
   return run_gpt_prompt_planning_thought_on_convo(persona, all_utt)[0]
@@ -114,24 +132,31 @@ def run_reflect(persona):
   # <retrieved> has keys of focal points, and values of the associated Nodes. 
   retrieved = new_retrieve(persona, focal_points)
 
-  # For each of the focal points, generate thoughts and save it in the 
-  # agent's memory. 
+  # For each of the focal points, generate thoughts. 
+  # <thoughts> is a list of [thought, evidence] pairs across focal points. 
+  thoughts = []
   for focal_pt, nodes in retrieved.items(): 
     xx = [i.embedding_key for i in nodes]
     for xxx in xx: print (xxx)
 
-    thoughts = generate_insights_and_evidence(persona, nodes, 5)
-    for thought, evidence in thoughts.items(): 
-      created = persona.scratch.curr_time
-      expiration = persona.scratch.curr_time + datetime.timedelta(days=30)
-      s, p, o = generate_action_event_triple(thought, persona)
-      keywords = set([s, p, o])
-      thought_poignancy = generate_poig_score(persona, "thought", thought)
-      thought_embedding_pair = (thought, get_embedding(thought))
+    thoughts += list(generate_insights_and_evidence(persona, nodes, 5).items())
 
-      persona.a_mem.add_thought(created, expiration, s, p, o, 
-                                thought, keywords, thought_poignancy, 
-                                thought_embedding_pair, evidence)
+  # Then we embed and rate all of the thoughts in one batch each, and save 
+  # them in the agent's memory. 
+  thought_embeddings = get_embeddings([thought for thought, _ in thoughts])
+  thought_poignancies = generate_poig_scores(persona, "thought", 
+                                             [thought for thought, _ in thoughts])
+  for count, (thought, evidence) in enumerate(thoughts): 
+    created = persona.scratch.curr_time
+    expiration = persona.scratch.curr_time + datetime.timedelta(days=30)
+    s, p, o = generate_action_event_triple(thought, persona)
+    keywords = set([s, p, o])
+    thought_poignancy = thought_poignancies[count]
+    thought_embedding_pair = (thought, thought_embeddings[count])
+
+    persona.a_mem.add_thought(created, expiration, s, p, o, 
+                              thought, keywords, thought_poignancy, 
+                              thought_embedding_pair, evidence)
 
 
 def reflection_trigger(persona): 
@@ -217,13 +242,20 @@ def reflect(persona):
 
       planning_thought = generate_planning_thought_on_convo(persona, all_utt)
       planning_thought = f"For {persona.scratch.name}'s planning: {planning_thought}"
+      memo_thought = generate_memo_on_convo(persona, all_utt)
+      memo_thought = f"{persona.scratch.name} {memo_thought}"
+      # Both thoughts are embedded, and rated, in one batch. 
+      planning_embedding, memo_embedding = get_embeddings([planning_thought, 
+                                                           memo_thought])
+      planning_poignancy, memo_poignancy = generate_poig_scores(
+        persona, "thought", [planning_thought, memo_thought])
 
       created = persona.scratch.curr_time
       expiration = persona.scratch.curr_time + datetime.timedelta(days=30)
       s, p, o = generate_action_event_triple(planning_thought, persona)
       keywords = set([s, p, o])
-      thought_poignancy = generate_poig_score(persona, "thought", planning_thought)
-      thought_embedding_pair = (planning_thought, get_embedding(planning_thought))
+      thought_poignancy = planning_poignancy
+      thought_embedding_pair = (planning_thought, planning_embedding)
 
       persona.a_mem.add_thought(created, expiration, s, p, o, 
                                 planning_thought, keywords, thought_poignancy, 
@@ -231,15 +263,12 @@ def reflect(persona):
 
 
 
-      memo_thought = generate_memo_on_convo(persona, all_utt)
-      memo_thought = f"{persona.scratch.name} {memo_thought}"
-
       created = persona.scratch.curr_time
       expiration = persona.scratch.curr_time + datetime.timedelta(days=30)
       s, p, o = generate_action_event_triple(memo_thought, persona)
       keywords = set([s, p, o])
-      thought_poignancy = generate_poig_score(persona, "thought", memo_thought)
-      thought_embedding_pair = (memo_thought, get_embedding(memo_thought))
+      thought_poignancy = memo_poignancy
+      thought_embedding_pair = (memo_thought, memo_embedding)
 
       persona.a_mem.add_thought(created, expiration, s, p, o, 
                                 memo_thought, keywords, thought_poignancy, 
@@ -9,6 +9,9 @@ sys.path.append('../../')
 
 from global_methods import *
 from persona.prompt_template.gpt_structure import *
+from step_profiler import profiled
+
+import numpy as np
 
 from numpy import dot
 from numpy.linalg import norm
@@ -196,12 +199,64 @@ def extract_relevance(persona, nodes, focal_pt):
   return relevance_out
 
 
+def normalize_array(arr, target_min, target_max): 
+  """
+  Array counterpart of normalize_dict_floats. Scales the values of a 1-D 
+  array to [target_min, target_max], and maps a constant array to the 
+  midpoint value just like normalize_dict_floats does. 
+
+  INPUT: 
+    arr: 1-D numpy array of floats. 
+    target_min: The minimum value to which the values should be scaled.
+    target_max: The maximum value to which the values should be scaled.
+  OUTPUT: 
+    A new numpy array with the normalized values. 
+  """
+  min_val = arr.min()
+  range_val = arr.max() - min_val
+  if range_val == 0: 
+    return np.full(arr.shape, (target_max - target_min)/2)
+  return (arr - min_val) * (target_max - target_min) / range_val + target_min
+
+
+def top_k_positions(scores, positions, k): 
+  """
+  Returns the indices of the k highest scores, highest first. Ties are broken
+  by the lower <positions> value, which matches a stable descending sort of 
+  the scores laid out in <positions> order (as top_highest_x_values does). 
+
+  INPUT: 
+    scores: 1-D numpy array of floats. 
+    positions: 1-D numpy array with the tie-breaking position of each score.
+    k: The number of indices to return. 
+  OUTPUT: 
+    A 1-D numpy array of at most k indices into <scores>. 
+  """
+  n = len(scores)
+  if k <= 0 or n == 0: 
+    return np.zeros(0, dtype=np.int64)
+  if k < n: 
+    # Everything that can possibly be in the top k has a score at least as 
+    # high as the kth highest score. 
+    kth_val = scores[np.argpartition(-scores, k - 1)[k - 1]]
+    candidates = np.flatnonzero(scores >= kth_val)
+  else: 
+    candidates = np.arange(n)
+  order = np.lexsort((positions[candidates], -scores[candidates]))
+  return candidates[order[:k]]
+
+
+@profiled("new_retrieve")
 def new_retrieve(persona, focal_points, n_count=30): 
   """
   Given the current persona and focal points (focal points are events or 
   thoughts for which we are retrieving), we retrieve a set of nodes for each
   of the focal points and return a dictionary. 
 
+  Scoring works off the associative memory's retrieval arrays: the relevance
+  of every node to every focal point is a single matrix product against the
+  embedding matrix, and the top n_count nodes are picked with argpartition.
+
   INPUT: 
     persona: The current persona object whose memory we are retrieving. 
     focal_points: A list of focal points (string description of the events or
@@ -215,70 +270,62 @@ def new_retrieve(persona, focal_points, n_count=30):
     persona = <persona> object 
     focal_points = ["How are you?", "Jane is swimming in the pond"]
   """
+  a_mem = persona.a_mem
   # <retrieved> is the main dictionary that we are returning
   retrieved = dict() 
-  for focal_pt in focal_points: 
-    # Getting all nodes from the agent's memory (both thoughts and events) and
-    # sorting them by the datetime of creation.
-    # You could also imagine getting the raw conversation, but for now. 
-    nodes = [[i.last_accessed, i]
-              for i in persona.a_mem.seq_event + persona.a_mem.seq_thought
-              if "idle" not in i.embedding_key]
-    nodes = sorted(nodes, key=lambda x: x[0])
-    nodes = [i for created, i in nodes]
-
-    # Calculating the component dictionaries and normalizing them.
-    recency_out = extract_recency(persona, nodes)
-    recency_out = normalize_dict_floats(recency_out, 0, 1)
-    importance_out = extract_importance(persona, nodes)
-    importance_out = normalize_dict_floats(importance_out, 0, 1)  
-    relevance_out = extract_relevance(persona, nodes, focal_pt)
-    relevance_out = normalize_dict_floats(relevance_out, 0, 1)
-
-    # Computing the final scores that combines the component values. 
-    # Note to self: test out different weights. [1, 1, 1] tends to work
-    # decently, but in the future, these weights should likely be learned, 
-    # perhaps through an RL-like process.
-    # gw = [1, 1, 1]
-    # gw = [1, 2, 1]
-    gw = [0.5, 3, 2]
-    master_out = dict()
-    for key in recency_out.keys(): 
-      master_out[key] = (persona.scratch.recency_w*recency_out[key]*gw[0] 
-                     + persona.scratch.relevance_w*relevance_out[key]*gw[1] 
-                     + persona.scratch.importance_w*importance_out[key]*gw[2])
-
-    master_out = top_highest_x_values(master_out, len(master_out.keys()))
-    for key, val in master_out.items(): 
-      print (persona.a_mem.id_to_node[key].embedding_key, val)
-      print (persona.scratch.recency_w*recency_out[key]*1, 
-             persona.scratch.relevance_w*relevance_out[key]*1, 
-             persona.scratch.importance_w*importance_out[key]*1)
-
-    # Extracting the highest x values.
-    # <master_out> has the key of node.id and value of float. Once we get the 
-    # highest x values, we want to translate the node.id into nodes and return
-    # the list of nodes.
-    master_out = top_highest_x_values(master_out, n_count)
-    master_nodes = [persona.a_mem.id_to_node[key] 
-                    for key in list(master_out.keys())]
-
-    for n in master_nodes: 
-      n.last_accessed = persona.scratch.curr_time
+
+  # All nodes from the agent's memory (both thoughts and events) that are 
+  # not idle. You could also imagine getting the raw conversation, but for 
+  # now. 
+  rows = a_mem.get_retrieval_rows()
+  if len(rows) == 0 or not focal_points: 
+    for focal_pt in focal_points: 
+      retrieved[focal_pt] = []
+    return retrieved
+
+  # Relevance: the cosine similarity of every node to every focal point, 
+  # computed as one (nodes x dim) by (dim x focal points) product. 
+  focal_embeddings = np.array([get_embedding(focal_pt) 
+                               for focal_pt in focal_points], 
+                              dtype=np.float32)
+  focal_norms = np.linalg.norm(focal_embeddings, axis=1)
+  relevance = a_mem.embedding_matrix[rows] @ focal_embeddings.T
+  relevance = (relevance.astype(np.float64) 
+               / np.outer(a_mem.embedding_norms[rows], focal_norms))
+
+  # Importance does not change between focal points. 
+  importance = normalize_array(a_mem.node_poignancy[rows], 0, 1)
+
+  # Computing the final scores that combines the component values. 
+  # Note to self: test out different weights. [1, 1, 1] tends to work
+  # decently, but in the future, these weights should likely be learned, 
+  # perhaps through an RL-like process.
+  # gw = [1, 1, 1]
+  # gw = [1, 2, 1]
+  gw = [0.5, 3, 2]
+  n = len(rows)
+  decay_vals = persona.scratch.recency_decay ** np.arange(1, n + 1)
+  base_score = persona.scratch.importance_w*importance*gw[2]
+  for count, focal_pt in enumerate(focal_points): 
+    # Recency is assigned by the nodes' order of last access (ties keep the
+    # seq_event + seq_thought order). This has to be redone for each focal 
+    # point since retrieving a node updates its last_accessed. 
+    order = np.argsort(a_mem.node_last_accessed[rows], kind="stable")
+    positions = np.empty(n, dtype=np.int64)
+    positions[order] = np.arange(n)
+    recency = normalize_array(decay_vals[positions], 0, 1)
+
+    master_out = (persona.scratch.recency_w*recency*gw[0] 
+                  + persona.scratch.relevance_w
+                    *normalize_array(relevance[:, count], 0, 1)*gw[1] 
+                  + base_score)
+
+    # Extracting the highest x values and translating the rows back into 
+    # nodes. 
+    top = top_k_positions(master_out, positions, n_count)
+    master_nodes = [a_mem.get_node_by_row(row) for row in rows[top]]
+    a_mem.mark_accessed(master_nodes, persona.scratch.curr_time)
       
     retrieved[focal_pt] = master_nodes
 
   return retrieved
-
-
-
-
-
-
-
-
-
-
-
-
-
@@ -12,8 +12,24 @@ sys.path.append('../../')
 
 import json
 import datetime
+import os
+from collections import Counter, deque
+
+import numpy as np
 
 from global_methods import *
+from persona.memory_structures.embedding_store import EmbeddingStore
+
+
+# Node type codes used in AssociativeMemory.node_types. 
+NODE_TYPE_CODES = {"event": 0, "thought": 1, "chat": 2}
+# last_accessed is stored as seconds since this (naive) epoch so that it can
+# live in a float array without going through local time conversion. 
+_ACCESS_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def datetime_to_seconds(curr_time): 
+  return (curr_time - _ACCESS_EPOCH).total_seconds()
 
 
 class ConceptNode: 
@@ -62,9 +78,41 @@ class AssociativeMemory:
     self.kw_strength_event = dict()
     self.kw_strength_thought = dict()
 
-    self.embeddings = json.load(open(f_saved + "/embeddings.json"))
-
-    nodes_load = json.load(open(f_saved + "/nodes.json"))
+    # RETRIEVAL ARRAYS
+    # Row i of each of these arrays describes the node with node_count i+1, 
+    # so they grow in lockstep with <id_to_node>. They let retrieval score 
+    # every node at once instead of walking the node lists. 
+    # <embedding_matrix> holds the float32 embedding of each node (allocated
+    # once we know the embedding dimension), and <embedding_norms> its L2 
+    # norm. <node_poignancy> and <node_last_accessed> (in seconds, see 
+    # datetime_to_seconds) mirror the ConceptNode fields, <node_types> holds
+    # the NODE_TYPE_CODES value, and <node_idle> marks nodes whose 
+    # embedding key contains "idle". Arrays are over-allocated and doubled as
+    # needed; only the first <node_array_size> rows are valid. 
+    self.node_array_size = 0
+    self.embedding_matrix = None
+    self.embedding_norms = np.zeros(0, dtype=np.float32)
+    self.node_poignancy = np.zeros(0, dtype=np.float64)
+    self.node_last_accessed = np.zeros(0, dtype=np.float64)
+    self.node_types = np.zeros(0, dtype=np.int8)
+    self.node_idle = np.zeros(0, dtype=bool)
+
+    # RECENT EVENTS
+    # <recent_events> holds the spo_summary of the latest 
+    # <recent_events_size> events, newest first, and <recent_event_counts> 
+    # counts each summary in it. add_event keeps both up to date, so 
+    # perception can check whether an event is new without rebuilding a set 
+    # from <seq_event> for every event it perceives (see is_recent_event). 
+    # The window is sized on first use to the persona's retention. 
+    self.recent_events_size = 0
+    self.recent_events = deque()
+    self.recent_event_counts = Counter()
+
+    # <embeddings> maps an embedding key to its vector. It is backed by a 
+    # memory-mapped float32 matrix on disk; see embedding_store.py. 
+    self.embeddings = EmbeddingStore(f_saved)
+
+    nodes_load = load_memory_nodes(f_saved)
     for count in range(len(nodes_load.keys())): 
       node_id = f"node_{str(count+1)}"
       node_details = nodes_load[node_id]
@@ -108,46 +156,112 @@ class AssociativeMemory:
     if kw_strength_load["kw_strength_thought"]: 
       self.kw_strength_thought = kw_strength_load["kw_strength_thought"]
 
+    # CHECKPOINT STATE
+    # Nodes never change once added, so a save only has to write the nodes 
+    # added since the last one. <saved_folder> is the folder we loaded from 
+    # or last saved to, <saved_node_count> the number of nodes saved there, 
+    # and <saved_log_bytes> the committed size of its node log (see 
+    # load_memory_nodes in global_methods.py). <kw_strength_dirty> is set 
+    # when the keyword strengths changed since. 
+    self.saved_folder = os.path.realpath(f_saved)
+    self.saved_node_count = len(self.id_to_node)
+    self.saved_log_bytes = read_memory_nodes_meta(f_saved)["log_bytes"]
+    self.kw_strength_dirty = False
+
     
   def save(self, out_json): 
-    r = dict()
-    for count in range(len(self.id_to_node.keys()), 0, -1): 
-      node_id = f"node_{str(count)}"
-      node = self.id_to_node[node_id]
-
-      r[node_id] = dict()
-      r[node_id]["node_count"] = node.node_count
-      r[node_id]["type_count"] = node.type_count
-      r[node_id]["type"] = node.type
-      r[node_id]["depth"] = node.depth
-
-      r[node_id]["created"] = node.created.strftime('%Y-%m-%d %H:%M:%S')
-      r[node_id]["expiration"] = None
-      if node.expiration: 
-        r[node_id]["expiration"] = (node.expiration
-                                        .strftime('%Y-%m-%d %H:%M:%S'))
+    """
+    Saves the associative memory to <out_json>. Saving back to the folder we
+    loaded from (or last saved to) only appends the new nodes to the node 
+    log, and skips kw_strength.json if it did not change. Otherwise all 
+    nodes are written out as a new nodes.json. Files are replaced through a
+    temp file and a rename, so a save that is cut short leaves the last 
+    one intact. 
+
+    INPUT: 
+      out_json: The associative memory folder. 
+    OUTPUT: 
+      None
+    """
+    incremental = (os.path.realpath(out_json) == self.saved_folder
+                   and read_memory_nodes_meta(out_json)["log_bytes"] 
+                       == self.saved_log_bytes)
+    if incremental: 
+      self._append_nodes(out_json)
+    else: 
+      self._rewrite_nodes(out_json)
 
-      r[node_id]["subject"] = node.subject
-      r[node_id]["predicate"] = node.predicate
-      r[node_id]["object"] = node.object
+    if self.kw_strength_dirty or not incremental: 
+      r = dict()
+      r["kw_strength_event"] = self.kw_strength_event
+      r["kw_strength_thought"] = self.kw_strength_thought
+      write_file_atomic(out_json+"/kw_strength.json", json.dumps(r))
+      self.kw_strength_dirty = False
 
-      r[node_id]["description"] = node.description
-      r[node_id]["embedding_key"] = node.embedding_key
-      r[node_id]["poignancy"] = node.poignancy
-      r[node_id]["keywords"] = list(node.keywords)
-      r[node_id]["filling"] = node.filling
+    self.embeddings.save(out_json)
+    self.saved_folder = os.path.realpath(out_json)
+    self.saved_node_count = len(self.id_to_node)
 
-    with open(out_json+"/nodes.json", "w") as outfile:
-      json.dump(r, outfile)
 
+  def _node_details(self, node): 
+    r = dict()
+    r["node_count"] = node.node_count
+    r["type_count"] = node.type_count
+    r["type"] = node.type
+    r["depth"] = node.depth
+
+    r["created"] = node.created.strftime('%Y-%m-%d %H:%M:%S')
+    r["expiration"] = None
+    if node.expiration: 
+      r["expiration"] = node.expiration.strftime('%Y-%m-%d %H:%M:%S')
+
+    r["subject"] = node.subject
+    r["predicate"] = node.predicate
+    r["object"] = node.object
+
+    r["description"] = node.description
+    r["embedding_key"] = node.embedding_key
+    r["poignancy"] = node.poignancy
+    r["keywords"] = list(node.keywords)
+    r["filling"] = node.filling
+    return r
+
+
+  def _append_nodes(self, out_json): 
+    if self.saved_node_count == len(self.id_to_node): 
+      return
+    lines = []
+    for count in range(self.saved_node_count + 1, len(self.id_to_node) + 1): 
+      node_id = f"node_{str(count)}"
+      node_details = self._node_details(self.id_to_node[node_id])
+      lines += [json.dumps({node_id: node_details}) + "\n"]
+    data = "".join(lines).encode("utf-8")
+
+    log_file = f"{out_json}/{MEMORY_NODES_LOG}"
+    unshare_file(log_file)
+    with open(log_file, "ab") as outfile: 
+      # Drop whatever a save that was cut short left past the committed end.
+      outfile.truncate(self.saved_log_bytes)
+      outfile.write(data)
+    self.saved_log_bytes += len(data)
+    write_file_atomic(f"{out_json}/{MEMORY_NODES_META}", json.dumps(
+      {"version": 1, "log_bytes": self.saved_log_bytes}))
+
+
+  def _rewrite_nodes(self, out_json): 
     r = dict()
-    r["kw_strength_event"] = self.kw_strength_event
-    r["kw_strength_thought"] = self.kw_strength_thought
-    with open(out_json+"/kw_strength.json", "w") as outfile:
-      json.dump(r, outfile)
+    for count in range(len(self.id_to_node.keys()), 0, -1): 
+      node_id = f"node_{str(count)}"
+      r[node_id] = self._node_details(self.id_to_node[node_id])
+    write_file_atomic(f"{out_json}/{MEMORY_NODES_FILE}", json.dumps(r))
 
-    with open(out_json+"/embeddings.json", "w") as outfile:
-      json.dump(self.embeddings, outfile)
+    # The log's nodes are all in the new nodes.json now. If we stop before 
+    # the meta is written, loading them again from the log is harmless. 
+    write_file_atomic(f"{out_json}/{MEMORY_NODES_META}", json.dumps(
+      {"version": 1, "log_bytes": 0}))
+    if os.path.exists(f"{out_json}/{MEMORY_NODES_LOG}"): 
+      os.remove(f"{out_json}/{MEMORY_NODES_LOG}")
+    self.saved_log_bytes = 0
 
 
   def add_event(self, created, expiration, s, p, o, 
@@ -175,6 +289,8 @@ class AssociativeMemory:
 
     # Creating various dictionary cache for fast access. 
     self.seq_event[0:0] = [node]
+    if self.recent_events_size: 
+      self._push_recent_event(node.spo_summary())
     keywords = [i.lower() for i in keywords]
     for kw in keywords: 
       if kw in self.kw_to_event: 
@@ -190,8 +306,10 @@ class AssociativeMemory:
           self.kw_strength_event[kw] += 1
         else: 
           self.kw_strength_event[kw] = 1
+        self.kw_strength_dirty = True
 
     self.embeddings[embedding_pair[0]] = embedding_pair[1]
+    self._append_node_arrays(node, embedding_pair[1])
 
     return node
 
@@ -236,8 +354,10 @@ class AssociativeMemory:
           self.kw_strength_thought[kw] += 1
         else: 
           self.kw_strength_thought[kw] = 1
+        self.kw_strength_dirty = True
 
     self.embeddings[embedding_pair[0]] = embedding_pair[1]
+    self._append_node_arrays(node, embedding_pair[1])
 
     return node
 
@@ -269,15 +389,120 @@ class AssociativeMemory:
     self.id_to_node[node_id] = node 
 
     self.embeddings[embedding_pair[0]] = embedding_pair[1]
+    self._append_node_arrays(node, embedding_pair[1])
         
     return node
 
 
+  def _append_node_arrays(self, node, embedding): 
+    row = self.node_array_size
+    if row >= len(self.node_poignancy): 
+      self._grow_node_arrays(max(64, 2 * len(self.node_poignancy)))
+
+    embedding = np.asarray(embedding, dtype=np.float32)
+    if self.embedding_matrix is None: 
+      self.embedding_matrix = np.zeros((len(self.node_poignancy), 
+                                        embedding.shape[0]), 
+                                       dtype=np.float32)
+    self.embedding_matrix[row] = embedding
+    self.embedding_norms[row] = np.linalg.norm(embedding)
+    self.node_poignancy[row] = node.poignancy
+    self.node_last_accessed[row] = datetime_to_seconds(node.last_accessed)
+    self.node_types[row] = NODE_TYPE_CODES[node.type]
+    self.node_idle[row] = "idle" in node.embedding_key
+    self.node_array_size = row + 1
+
+
+  def _grow_node_arrays(self, capacity): 
+    def grow(arr): 
+      new_arr = np.zeros((capacity,) + arr.shape[1:], dtype=arr.dtype)
+      new_arr[:len(arr)] = arr
+      return new_arr
+
+    if self.embedding_matrix is not None: 
+      self.embedding_matrix = grow(self.embedding_matrix)
+    self.embedding_norms = grow(self.embedding_norms)
+    self.node_poignancy = grow(self.node_poignancy)
+    self.node_last_accessed = grow(self.node_last_accessed)
+    self.node_types = grow(self.node_types)
+    self.node_idle = grow(self.node_idle)
+
+
+  def get_retrieval_rows(self): 
+    """
+    Returns the array rows of the nodes that retrieval scores: all non-idle
+    events followed by all non-idle thoughts, each newest first. This is the 
+    same order as seq_event + seq_thought. 
+
+    OUTPUT: 
+      A 1-D int array of row indices (node_count - 1). 
+    """
+    n = self.node_array_size
+    types = self.node_types[:n]
+    active = ~self.node_idle[:n]
+    rows = np.arange(n)
+    events = rows[active & (types == NODE_TYPE_CODES["event"])][::-1]
+    thoughts = rows[active & (types == NODE_TYPE_CODES["thought"])][::-1]
+    return np.concatenate([events, thoughts])
+
+
+  def get_node_by_row(self, row): 
+    return self.id_to_node[f"node_{row + 1}"]
+
+
+  def mark_accessed(self, nodes, curr_time): 
+    """
+    Sets last_accessed on the given nodes, keeping the retrieval arrays in 
+    sync. 
+
+    INPUT: 
+      nodes: A list of <ConceptNode>. 
+      curr_time: datetime instance of the access. 
+    OUTPUT: 
+      None
+    """
+    seconds = datetime_to_seconds(curr_time)
+    for node in nodes: 
+      node.last_accessed = curr_time
+      self.node_last_accessed[node.node_count - 1] = seconds
+
+
+  def _push_recent_event(self, spo): 
+    self.recent_events.appendleft(spo)
+    self.recent_event_counts[spo] += 1
+    if len(self.recent_events) > self.recent_events_size: 
+      oldest = self.recent_events.pop()
+      self.recent_event_counts[oldest] -= 1
+      if not self.recent_event_counts[oldest]: 
+        del self.recent_event_counts[oldest]
+
+
+  def _resize_recent_events(self, retention): 
+    self.recent_events_size = retention
+    self.recent_events = deque(e_node.spo_summary() 
+                               for e_node in self.seq_event[:retention])
+    self.recent_event_counts = Counter(self.recent_events)
+
+
+  def is_recent_event(self, spo, retention): 
+    """
+    Checks whether an event is among the latest <retention> events. 
+
+    INPUT: 
+      spo: The (subject, predicate, object) summary of the event. 
+      retention: The number of latest events to look at. 
+    OUTPUT: 
+      True if one of the latest <retention> events has the same summary. 
+    """
+    if retention != self.recent_events_size: 
+      self._resize_recent_events(retention)
+    return spo in self.recent_event_counts
+
+
   def get_summarized_latest_events(self, retention): 
-    ret_set = set()
-    for e_node in self.seq_event[:retention]: 
-      ret_set.add(e_node.spo_summary())
-    return ret_set
+    if retention != self.recent_events_size: 
+      self._resize_recent_events(retention)
+    return set(self.recent_event_counts)
 
 
   def get_str_seq_events(self): 
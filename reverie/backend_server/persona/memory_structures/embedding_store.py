@@ -0,0 +1,227 @@
+"""
+File: embedding_store.py
+Description: Defines the EmbeddingStore, the on-disk home of the embeddings
+used by the associative memory.
+
+Embeddings are saved as a raw float32 matrix (embeddings.f32) that is
+memory-mapped at load time, plus a key index with one JSON string per row
+(embeddings_keys.jsonl) and a small meta file (embeddings_meta.json) with the
+vector dimension and the number of committed rows and key bytes. Saving back
+to the folder we loaded from only appends the rows that were added since, so
+a save costs O(new embeddings). A key that is set again gets a new row; on
+load the last row for a key wins.
+
+The meta file is written last, so bytes past its committed lengths are from a
+save that was cut short; they are ignored on load and truncated before the
+next append, as nodes_meta.json does for the node log.
+
+Folders that still hold the legacy embeddings.json are read from it, and are
+migrated to the binary format (and the JSON file removed) on the next save.
+"""
+import json
+import os
+
+from collections.abc import MutableMapping
+
+import numpy as np
+
+from global_methods import unshare_file
+
+EMBEDDING_STORE_VERSION = 2
+MATRIX_FILE = "embeddings.f32"
+KEYS_FILE = "embeddings_keys.jsonl"
+META_FILE = "embeddings_meta.json"
+LEGACY_FILE = "embeddings.json"
+
+
+class EmbeddingStore(MutableMapping):
+  def __init__(self, folder):
+    # <_folder> is the folder whose binary files back <_base>.
+    # <_base> is the memory-mapped matrix (None while empty), <_index> maps
+    # a key to its row in <_base>, <_persisted_rows> is the number of rows
+    # of <_base>, and <_keys_bytes> the committed size of the key index.
+    # <_pending> holds embeddings set since the last save, in insertion
+    # order. <_needs_rewrite> is set when rows need to be dropped, which an
+    # append cannot express.
+    self.dim = None
+    self._folder = None
+    self._base = None
+    self._index = dict()
+    self._persisted_rows = 0
+    self._keys_bytes = 0
+    self._pending = dict()
+    self._needs_rewrite = False
+
+    if os.path.exists(f"{folder}/{META_FILE}"):
+      self._open(folder)
+    elif os.path.exists(f"{folder}/{LEGACY_FILE}"):
+      with open(f"{folder}/{LEGACY_FILE}") as json_file:
+        for key, val in json.load(json_file).items():
+          self[key] = val
+
+
+  def _open(self, folder):
+    with open(f"{folder}/{META_FILE}") as json_file:
+      meta = json.load(json_file)
+    self.dim = meta["dim"]
+    self._folder = os.path.realpath(folder)
+    self._index = dict()
+    self._base = None
+    self._persisted_rows = 0
+    self._keys_bytes = 0
+    if not self.dim:
+      return
+
+    with open(f"{folder}/{KEYS_FILE}", "rb") as keys_file:
+      data = keys_file.read()
+    if "keys_bytes" in meta:
+      data = data[:meta["keys_bytes"]]
+    else:
+      # Version 1 folders have no committed lengths, so we only trust the
+      # complete lines, and rows that have both their bytes and their key.
+      data = data[:data.rfind(b"\n") + 1]
+    lines = data.splitlines(keepends=True)
+    row_bytes = 4 * self.dim
+    n_rows = min(len(lines),
+                 meta.get("rows", len(lines)),
+                 os.path.getsize(f"{folder}/{MATRIX_FILE}") // row_bytes)
+    keys = [json.loads(line) for line in lines[:n_rows]]
+    if n_rows:
+      self._base = np.memmap(f"{folder}/{MATRIX_FILE}", dtype=np.float32,
+                             mode="r", shape=(n_rows, self.dim))
+    for row in range(n_rows):
+      self._index[keys[row]] = row
+    self._persisted_rows = n_rows
+    self._keys_bytes = sum(len(line) for line in lines[:n_rows])
+
+
+  def __getitem__(self, key):
+    if key in self._pending:
+      return self._pending[key]
+    return self._base[self._index[key]]
+
+
+  def __setitem__(self, key, embedding):
+    embedding = np.asarray(embedding, dtype=np.float32)
+    if self.dim is None:
+      self.dim = embedding.shape[0]
+    elif embedding.shape != (self.dim,):
+      raise ValueError(f"embedding for {key!r} has shape {embedding.shape}, "
+                       f"expected ({self.dim},)")
+
+    if key in self and np.array_equal(self[key], embedding):
+      return
+    self._pending[key] = embedding
+
+
+  def __delitem__(self, key):
+    if key not in self:
+      raise KeyError(key)
+    self._pending.pop(key, None)
+    if key in self._index:
+      del self._index[key]
+      self._needs_rewrite = True
+
+
+  def __contains__(self, key):
+    return key in self._pending or key in self._index
+
+
+  def __iter__(self):
+    for key in self._index:
+      if key not in self._pending:
+        yield key
+    yield from self._pending
+
+
+  def __len__(self):
+    return len(self._index) + sum(1 for key in self._pending
+                                  if key not in self._index)
+
+
+  def save(self, folder):
+    """
+    Saves the embeddings to <folder>. If this is the folder we loaded from
+    and its meta is as we left it, only the pending rows are appended.
+    Otherwise the whole store is written out, via temp files and rename.
+
+    INPUT:
+      folder: The associative memory folder.
+    OUTPUT:
+      None
+    """
+    if (not self._needs_rewrite
+        and os.path.realpath(folder) == self._folder
+        and self._on_disk_rows(folder) == self._persisted_rows):
+      if not self._pending:
+        return
+      self._append(folder)
+    else:
+      self._rewrite(folder)
+
+    legacy = f"{folder}/{LEGACY_FILE}"
+    if os.path.exists(legacy):
+      os.remove(legacy)
+    self._pending = dict()
+    self._needs_rewrite = False
+    self._open(folder)
+
+
+  def _on_disk_rows(self, folder):
+    """
+    Returns the number of rows committed in <folder>'s meta file, or None if
+    it has none (or predates the committed lengths).
+    """
+    if not os.path.exists(f"{folder}/{META_FILE}"):
+      return None
+    with open(f"{folder}/{META_FILE}") as json_file:
+      meta = json.load(json_file)
+    if not meta.get("dim"):
+      return 0
+    return meta.get("rows")
+
+
+  def _append(self, folder):
+    keys = list(self._pending.keys())
+    matrix = np.stack([self._pending[key] for key in keys])
+    # The files may be hard linked with a fork's (see forkanything).
+    unshare_file(f"{folder}/{MATRIX_FILE}")
+    unshare_file(f"{folder}/{KEYS_FILE}")
+    keys_data = "".join(json.dumps(key) + "\n" for key in keys).encode("utf-8")
+    # Drop whatever a save that was cut short left past the committed ends.
+    with open(f"{folder}/{MATRIX_FILE}", "ab") as outfile:
+      outfile.truncate(self._persisted_rows * 4 * self.dim)
+      outfile.write(matrix.tobytes())
+    with open(f"{folder}/{KEYS_FILE}", "ab") as outfile:
+      outfile.truncate(self._keys_bytes)
+      outfile.write(keys_data)
+    self._write_meta(folder, self._persisted_rows + len(keys),
+                     self._keys_bytes + len(keys_data))
+
+
+  def _rewrite(self, folder):
+    keys = list(self)
+    tmp_matrix = f"{folder}/{MATRIX_FILE}.tmp"
+    with open(tmp_matrix, "wb") as outfile:
+      for key in keys:
+        outfile.write(np.asarray(self[key], dtype=np.float32).tobytes())
+    keys_data = "".join(json.dumps(key) + "\n" for key in keys).encode("utf-8")
+    tmp_keys = f"{folder}/{KEYS_FILE}.tmp"
+    with open(tmp_keys, "wb") as outfile:
+      outfile.write(keys_data)
+    os.replace(tmp_matrix, f"{folder}/{MATRIX_FILE}")
+    os.replace(tmp_keys, f"{folder}/{KEYS_FILE}")
+    self._write_meta(folder, len(keys), len(keys_data))
+
+
+  def _write_meta(self, folder, rows, keys_bytes):
+    meta = {"version": EMBEDDING_STORE_VERSION,
+            "dtype": "float32",
+            "dim": self.dim,
+            "rows": rows,
+            "matrix_bytes": rows * 4 * (self.dim or 0),
+            "keys_bytes": keys_bytes}
+    tmp_meta = f"{folder}/{META_FILE}.tmp"
+    with open(tmp_meta, "w") as outfile:
+      json.dump(meta, outfile)
+    os.replace(tmp_meta, f"{folder}/{META_FILE}")
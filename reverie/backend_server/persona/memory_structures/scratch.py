@@ -7,10 +7,132 @@ Description: Defines the short-term memory module for generative agents.
 import datetime
 import json
 import sys
+from bisect import bisect_right
 sys.path.append('../../')
 
 from global_methods import *
 
+class DailySchedule(list): 
+  """
+  A list of [task, duration] rows (durations in minutes) that keeps the 
+  minute of the day at which each row ends, so finding the row for a given 
+  minute is a bisect instead of a walk down the list. 
+
+  The end minutes are kept as a running maximum of the cumulative durations,
+  which makes them non-decreasing (and the bisect exact) even if a row has a
+  negative duration. Any change to the list drops the end minutes from the 
+  first changed row on, and they are recomputed from there on the next 
+  lookup, so splicing a decomposition into the schedule only redoes the rows
+  after it. Rows are replaced rather than edited in place. 
+  """
+  def __init__(self, rows=()): 
+    super().__init__(rows)
+    # <sums> holds the cumulative duration up to and including each row, and
+    # <ends> the running maximum of <sums>. Both are valid for the first 
+    # len(<ends>) rows. 
+    self.sums = []
+    self.ends = []
+
+
+  def _changed_from(self, index): 
+    if index < len(self.ends): 
+      del self.sums[index:]
+      del self.ends[index:]
+
+
+  def _update(self): 
+    n = len(self.ends)
+    if n == len(self): 
+      return
+    total = self.sums[-1] if n else 0
+    end = self.ends[-1] if n else float("-inf")
+    for task, duration in self[n:]: 
+      total += duration
+      end = max(end, total)
+      self.sums.append(total)
+      self.ends.append(end)
+
+
+  def index_at_minute(self, minute): 
+    """
+    Returns the index of the first row that ends after <minute>, or the 
+    length of the schedule if there is none. 
+    """
+    self._update()
+    return bisect_right(self.ends, minute)
+
+
+  def total_minutes(self): 
+    self._update()
+    return self.sums[-1] if self.sums else 0
+
+
+  def fill_to(self, minutes, task): 
+    """
+    Appends a <task> row that brings the total duration to <minutes>, unless
+    the total is already there. 
+    """
+    total = self.total_minutes()
+    if total != minutes: 
+      self.append([task, minutes - total])
+
+
+  def _index_of(self, index): 
+    if isinstance(index, slice): 
+      return index.indices(len(self))[0] if index.step in (None, 1) else 0
+    return index if index >= 0 else index + len(self)
+
+
+  def __setitem__(self, index, value): 
+    self._changed_from(self._index_of(index))
+    super().__setitem__(index, value)
+
+
+  def __delitem__(self, index): 
+    self._changed_from(self._index_of(index))
+    super().__delitem__(index)
+
+
+  def insert(self, index, value): 
+    self._changed_from(max(0, self._index_of(index)))
+    super().insert(index, value)
+
+
+  def pop(self, index=-1): 
+    self._changed_from(self._index_of(index))
+    return super().pop(index)
+
+
+  def remove(self, value): 
+    self._changed_from(self.index(value))
+    super().remove(value)
+
+
+  def __iadd__(self, rows): 
+    super().__iadd__(rows)
+    return self
+
+
+  def __imul__(self, n): 
+    self._changed_from(0)
+    return super().__imul__(n)
+
+
+  def clear(self): 
+    self._changed_from(0)
+    super().clear()
+
+
+  def sort(self, *args, **kwargs): 
+    self._changed_from(0)
+    super().sort(*args, **kwargs)
+
+
+  def reverse(self): 
+    self._changed_from(0)
+    super().reverse()
+
+
 class Scratch: 
   def __init__(self, f_saved): 
     # PERSONA HYPERPARAMETERS
@@ -78,7 +200,9 @@ class Scratch:
     # the persona's daily plan. 
     # Note that we take the long term planning and short term decomposition 
     # appoach, which is to say that we first layout hourly schedules and 
-    # gradually decompose as we go. 
+    # gradually decompose as we go. It is stored as a DailySchedule (a list 
+    # that also keeps each row's end minute; anything assigned here is 
+    # wrapped in one). 
     # Three things to note in the example below: 
     # 1) See how "sleeping" was not decomposed -- some of the common events 
     #    really, just mainly sleeping, are hard coded to be not decomposable.
@@ -158,9 +282,15 @@ class Scratch:
     # e.g., [(50, 10), (49, 10), (48, 10), ...]
     self.planned_path = []
 
+    # <saved> is the (file, content) we were loaded from or last saved. Saving
+    # the same content to the same file again is skipped. 
+    self.saved = None
+
     if check_if_file_exists(f_saved): 
       # If we have a bootstrap file, load that here. 
-      scratch_load = json.load(open(f_saved))
+      with open(f_saved) as json_file: 
+        self.saved = (f_saved, json_file.read())
+      scratch_load = json.loads(self.saved[1])
 
       self.vision_r = scratch_load["vision_r"]
       self.att_bandwidth = scratch_load["att_bandwidth"]
@@ -236,7 +366,7 @@ class Scratch:
 
   def save(self, out_json):
     """
-    Save persona's scratch. 
+    Save persona's scratch. The file is only written if it would change. 
 
     INPUT: 
       out_json: The file where we wil be saving our persona's state. 
@@ -306,8 +436,35 @@ class Scratch:
     scratch["act_path_set"] = self.act_path_set
     scratch["planned_path"] = self.planned_path
 
-    with open(out_json, "w") as outfile:
-      json.dump(scratch, outfile, indent=2) 
+    scratch_str = json.dumps(scratch, indent=2)
+    if self.saved == (out_json, scratch_str): 
+      return
+    write_file_atomic(out_json, scratch_str)
+    self.saved = (out_json, scratch_str)
+
+
+  @property
+  def f_daily_schedule(self): 
+    return self._f_daily_schedule
+
+
+  @f_daily_schedule.setter
+  def f_daily_schedule(self, rows): 
+    if not isinstance(rows, DailySchedule): 
+      rows = DailySchedule(rows)
+    self._f_daily_schedule = rows
+
+
+  @property
+  def f_daily_schedule_hourly_org(self): 
+    return self._f_daily_schedule_hourly_org
+
+
+  @f_daily_schedule_hourly_org.setter
+  def f_daily_schedule_hourly_org(self, rows): 
+    if not isinstance(rows, DailySchedule): 
+      rows = DailySchedule(rows)
+    self._f_daily_schedule_hourly_org = rows
 
 
   def get_f_daily_schedule_index(self, advance=0):
@@ -333,23 +490,8 @@ class Scratch:
     today_min_elapsed += self.curr_time.minute
     today_min_elapsed += advance
 
-    x = 0
-    for task, duration in self.f_daily_schedule: 
-      x += duration
-    x = 0
-    for task, duration in self.f_daily_schedule_hourly_org: 
-      x += duration
-
-    # We then calculate the current index based on that. 
-    curr_index = 0
-    elapsed = 0
-    for task, duration in self.f_daily_schedule: 
-      elapsed += duration
-      if elapsed > today_min_elapsed: 
-        return curr_index
-      curr_index += 1
-
-    return curr_index
+    # We then look up the current index based on that (see DailySchedule). 
+    return self.f_daily_schedule.index_at_minute(today_min_elapsed)
 
 
   def get_f_daily_schedule_hourly_org_index(self, advance=0):
@@ -368,15 +510,8 @@ class Scratch:
     today_min_elapsed += self.curr_time.hour * 60
     today_min_elapsed += self.curr_time.minute
     today_min_elapsed += advance
-    # We then calculate the current index based on that. 
-    curr_index = 0
-    elapsed = 0
-    for task, duration in self.f_daily_schedule_hourly_org: 
-      elapsed += duration
-      if elapsed > today_min_elapsed: 
-        return curr_index
-      curr_index += 1
-    return curr_index
+    # We then look up the current index based on that. 
+    return self.f_daily_schedule_hourly_org.index_at_minute(today_min_elapsed)
 
 
   def get_str_iss(self): 
@@ -18,6 +18,11 @@ class MemoryTree:
     if check_if_file_exists(f_saved): 
       self.tree = json.load(open(f_saved))
 
+    # <saved_to> is the file the tree was loaded from or last saved to, and 
+    # <dirty> is set when the tree changed since (see add_tile). 
+    self.saved_to = f_saved
+    self.dirty = False
+
 
   def print_tree(self): 
     def _print_tree(tree, depth):
@@ -36,8 +41,41 @@ class MemoryTree:
     
 
   def save(self, out_json):
-    with open(out_json, "w") as outfile:
-      json.dump(self.tree, outfile) 
+    if not self.dirty and out_json == self.saved_to: 
+      return
+    write_file_atomic(out_json, json.dumps(self.tree))
+    self.saved_to = out_json
+    self.dirty = False
+
+
+  def add_tile(self, tile_details): 
+    """
+    Adds the world, sector, arena and game object of a tile to the tree. 
+
+    INPUT
+      tile_details: The details of a tile, as returned by Maze.access_tile. 
+    OUTPUT 
+      None
+    """
+    i = tile_details
+    if i["world"]: 
+      if (i["world"] not in self.tree): 
+        self.tree[i["world"]] = {}
+        self.dirty = True
+    if i["sector"]: 
+      if (i["sector"] not in self.tree[i["world"]]): 
+        self.tree[i["world"]][i["sector"]] = {}
+        self.dirty = True
+    if i["arena"]: 
+      if (i["arena"] not in self.tree[i["world"]][i["sector"]]): 
+        self.tree[i["world"]][i["sector"]][i["arena"]] = []
+        self.dirty = True
+    if i["game_object"]: 
+      if (i["game_object"] not in self.tree[i["world"]]
+                                           [i["sector"]]
+                                           [i["arena"]]): 
+        self.tree[i["world"]][i["sector"]][i["arena"]] += [i["game_object"]]
+        self.dirty = True
 
 
 
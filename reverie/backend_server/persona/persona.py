@@ -15,6 +15,7 @@ import random
 sys.path.append('../')
 
 from global_methods import *
+from step_profiler import step_phase
 
 from persona.memory_structures.spatial_memory import *
 from persona.memory_structures.associative_memory import *
@@ -50,7 +51,9 @@ class Persona:
 
   def save(self, save_folder): 
     """
-    Save persona's current state (i.e., memory). 
+    Save persona's current state (i.e., memory). Each memory only writes 
+    what changed since it was loaded or last saved, so saving a persona that
+    did not change writes nothing. 
 
     INPUT: 
       save_folder: The folder where we wil be saving our persona's state. 
@@ -104,7 +107,8 @@ class Persona:
         See associative_memory.py -- but to get you a sense of what it 
         receives as its input: "s, p, o, desc, persona.scratch.curr_time"
     """
-    return perceive(self, maze)
+    with step_phase("perceive", self.name): 
+      return perceive(self, maze)
 
 
   def retrieve(self, perceived):
@@ -120,7 +124,8 @@ class Persona:
                  while the latter layer specifies the "curr_event", "events", 
                  and "thoughts" that are relevant.
     """
-    return retrieve(self, perceived)
+    with step_phase("retrieve", self.name): 
+      return retrieve(self, perceived)
 
 
   def plan(self, maze, personas, new_day, retrieved):
@@ -145,7 +150,8 @@ class Persona:
     OUTPUT 
       The target action address of the persona (persona.scratch.act_address).
     """
-    return plan(self, maze, personas, new_day, retrieved)
+    with step_phase("plan", self.name): 
+      return plan(self, maze, personas, new_day, retrieved)
 
 
   def execute(self, maze, personas, plan):
@@ -167,7 +173,8 @@ class Persona:
         writing her next novel (editing her novel) 
         @ double studio:double studio:common room:sofa
     """
-    return execute(self, maze, personas, plan)
+    with step_phase("execute", self.name): 
+      return execute(self, maze, personas, plan)
 
 
   def reflect(self):
@@ -179,7 +186,8 @@ class Persona:
     OUTPUT: 
       None
     """
-    reflect(self)
+    with step_phase("reflect", self.name): 
+      reflect(self)
 
 
   def move(self, maze, personas, curr_tile, curr_time):
@@ -201,6 +209,33 @@ class Persona:
         writing her next novel (editing her novel) 
         @ double studio:double studio:common room:sofa
     """
+    new_day = self.start_step(curr_tile, curr_time)
+
+    # Main cognitive sequence begins here. 
+    perceived = self.perceive(maze)
+    retrieved = self.retrieve(perceived)
+    plan = self.plan(maze, personas, new_day, retrieved)
+    self.reflect()
+
+    # <execution> is a triple set that contains the following components: 
+    # <next_tile> is a x,y coordinate. e.g., (58, 9)
+    # <pronunciatio> is an emoji. e.g., "\ud83d\udca4"
+    # <description> is a string description of the movement. e.g., 
+    #   writing her next novel (editing her novel) 
+    #   @ double studio:double studio:common room:sofa
+    return self.execute(maze, personas, plan)
+
+
+  def start_step(self, curr_tile, curr_time): 
+    """
+    Updates the persona's scratch with the tile and time of the new step. 
+
+    INPUT: 
+      curr_tile: A tuple that designates the persona's current tile location.
+      curr_time: datetime instance that indicates the game's current time. 
+    OUTPUT: 
+      new_day: False, "First day", or "New day" (see plan). 
+    """
     # Updating persona's scratch memory with <curr_tile>. 
     self.scratch.curr_tile = curr_tile
 
@@ -215,20 +250,44 @@ class Persona:
           != curr_time.strftime('%A %B %d')):
       new_day = "New day"
     self.scratch.curr_time = curr_time
+    return new_day
 
-    # Main cognitive sequence begins here. 
+
+  def think(self, maze, new_day): 
+    """
+    The first half of move that only reads the maze and changes the persona's
+    own state: perceive, retrieve, and plan its own next action. The server 
+    runs this concurrently for all personas (see ReverieServer.move_personas).
+
+    INPUT: 
+      maze: The Maze class of the current world. 
+      new_day: False, "First day", or "New day" (see plan). 
+    OUTPUT: 
+      retrieved: dictionary of dictionary (see retrieve). 
+    """
     perceived = self.perceive(maze)
     retrieved = self.retrieve(perceived)
-    plan = self.plan(maze, personas, new_day, retrieved)
-    self.reflect()
+    with step_phase("plan", self.name): 
+      plan_own_action(self, maze, new_day)
+    return retrieved
 
-    # <execution> is a triple set that contains the following components: 
-    # <next_tile> is a x,y coordinate. e.g., (58, 9)
-    # <pronunciatio> is an emoji. e.g., "\ud83d\udca4"
-    # <description> is a string description of the movement. e.g., 
-    #   writing her next novel (editing her novel) 
-    #   @ double studio:double studio:common room:sofa
-    return self.execute(maze, personas, plan)
+
+  def react(self, maze, personas, retrieved): 
+    """
+    The part of planning that reacts to the retrieved events. Reactions such
+    as chats change other personas' state, so the server calls this for one
+    persona at a time, in the order of its personas dictionary. 
+
+    INPUT: 
+      maze: The Maze class of the current world. 
+      personas: A dictionary that contains all persona names as keys, and the 
+                Persona instance as values. 
+      retrieved: dictionary of dictionary (see retrieve). 
+    OUTPUT: 
+      The target action address of the persona (persona.scratch.act_address).
+    """
+    with step_phase("plan", self.name): 
+      return plan_reaction(self, maze, personas, retrieved)
 
 
   def open_convo_session(self, convo_mode): 
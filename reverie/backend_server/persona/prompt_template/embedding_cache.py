@@ -0,0 +1,209 @@
+"""Persistent, content-addressed embedding cache.
+
+Embeddings are keyed on (model, text) by a SHA-256 digest and stored as
+float32 blobs in a SQLite database, so identical strings (e.g. "bed is idle")
+are embedded once across personas, forks and runs. A small in-process LRU
+sits in front of the database, and the database is trimmed back under a byte
+budget by evicting the least recently used rows. Hits do not write to the
+database; their last-used times are kept in memory and written with the next
+put, every TOUCH_FLUSH_EVERY hits, or on close.
+
+The cache is opt-in. Set `EMBEDDING_CACHE_PATH` to a database file, or set
+`EMBEDDING_CACHE=1` to use the default path next to the Copilot token cache.
+`EMBEDDING_CACHE_MAX_MB` (default 512) bounds the database size and
+`EMBEDDING_CACHE_LRU_SIZE` (default 4096) the number of in-process entries.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+_TRUTHY = ("1", "true", "yes", "on")
+TOUCH_FLUSH_EVERY = 256
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    last_used REAL NOT NULL
+)
+"""
+
+
+def embedding_cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+def resolve_embedding_cache_path(env: Optional[Dict[str, str]] = None) -> str:
+    env = env or os.environ
+    cache_dir = env.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    path = os.path.join(cache_dir, "generative_agents")
+    os.makedirs(path, exist_ok=True)
+    return os.path.join(path, "embeddings.sqlite3")
+
+
+class EmbeddingCache:
+    """SQLite-backed embedding store with an in-process LRU in front of it."""
+
+    def __init__(
+        self, path: str, max_bytes: int = 512 * 1024 * 1024, lru_size: int = 4096
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lru_size = lru_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lru: "OrderedDict[str, List[float]]" = OrderedDict()
+        # key -> last-used time of the hits not yet written to the database
+        self._touched: Dict[str, float] = dict()
+        self._lock = threading.Lock()
+
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+        row = self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+        ).fetchone()
+        self._total_bytes = row[0]
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        key = embedding_cache_key(model, text)
+        with self._lock:
+            vector = self._lru.get(key)
+            if vector is not None:
+                self._lru.move_to_end(key)
+                self._touch(key)
+                self.hits += 1
+                return list(vector)
+
+            row = self._conn.execute(
+                "SELECT vector FROM embeddings WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._touch(key)
+            vector = array("f")
+            vector.frombytes(row[0])
+            vector = vector.tolist()
+            self._remember(key, vector)
+            self.hits += 1
+            return list(vector)
+
+    def put(self, model: str, text: str, embedding: List[float]) -> None:
+        key = embedding_cache_key(model, text)
+        blob = array("f", embedding).tobytes()
+        with self._lock:
+            self._flush_touched()
+            old = self._conn.execute(
+                "SELECT LENGTH(vector) FROM embeddings WHERE key = ?", (key,)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, last_used) "
+                "VALUES (?, ?, ?, ?)",
+                (key, model, blob, time.time()),
+            )
+            self._total_bytes += len(blob) - (old[0] if old else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+            self._remember(key, array("f", embedding).tolist())
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            entries = self._conn.execute(
+                "SELECT COUNT(*) FROM embeddings"
+            ).fetchone()[0]
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+                "evictions": self.evictions,
+                "entries": entries,
+                "bytes": self._total_bytes,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush_touched()
+            self._conn.commit()
+            self._conn.close()
+
+    def _touch(self, key: str) -> None:
+        self._touched[key] = time.time()
+        if len(self._touched) >= TOUCH_FLUSH_EVERY:
+            self._flush_touched()
+            self._conn.commit()
+
+    def _flush_touched(self) -> None:
+        if not self._touched:
+            return
+        self._conn.executemany(
+            "UPDATE embeddings SET last_used = ? WHERE key = ?",
+            [(used, key) for key, used in self._touched.items()],
+        )
+        self._touched.clear()
+
+    def _remember(self, key: str, vector: List[float]) -> None:
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def _evict(self) -> None:
+        # Trim to 90% of the budget so we do not evict on every insert.
+        self._flush_touched()
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute(
+            "SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_used ASC"
+        )
+        doomed = []
+        for key, size in rows:
+            if self._total_bytes <= target:
+                break
+            doomed.append((key,))
+            self._total_bytes -= size
+            self._lru.pop(key, None)
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", doomed)
+        self.evictions += len(doomed)
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache(
+    env: Optional[Dict[str, str]] = None,
+) -> Optional[EmbeddingCache]:
+    """Return the process-wide cache, or None when caching is not enabled."""
+    global _cache
+    env = env or os.environ
+    path = env.get("EMBEDDING_CACHE_PATH")
+    if not path and env.get("EMBEDDING_CACHE", "").lower() not in _TRUTHY:
+        return None
+
+    with _cache_lock:
+        path = path or resolve_embedding_cache_path(env)
+        if _cache is None or _cache.path != path:
+            max_mb = float(env.get("EMBEDDING_CACHE_MAX_MB", "512"))
+            lru_size = int(env.get("EMBEDDING_CACHE_LRU_SIZE", "4096"))
+            _cache = EmbeddingCache(
+                path, max_bytes=int(max_mb * 1024 * 1024), lru_size=lru_size
+            )
+        return _cache
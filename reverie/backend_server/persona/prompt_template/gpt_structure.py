@@ -10,8 +10,18 @@ import random
 import os
 import time
 import logging
+from array import array
 import openai
-import requests
+
+from persona.prompt_template.llm_client import get_llm_client
+from persona.prompt_template.llm_metrics import report_usage, start_call
+from persona.prompt_template.llm_transcript import (
+    TranscriptMiss,
+    get_llm_transcript,
+    transcribed,
+)
+from persona.prompt_template.prompt_registry import get_prompt_registry
+from step_profiler import profiled
 
 # Backends: 'openai' (default), 'ollama', 'copilot'
 LLM_BACKEND = os.environ.get("LLM_BACKEND", "openai").lower()
@@ -21,6 +31,8 @@ COPILOT_API_URL = os.environ.get("COPILOT_API_URL")
 COPILOT_API_KEY = os.environ.get("COPILOT_API_KEY")
 # Default model to use for GitHub Copilot backend when none is specified
 COPILOT_DEFAULT_MODEL = os.environ.get("COPILOT_DEFAULT_MODEL", "grok-code-fast-1")
+# Largest number of texts sent in one embeddings request by get_embeddings.
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "64"))
 
 # Legacy: attempt to import openai_api_key from utils (keeps backward compatibility).
 # Preferred: set OPENAI_API_KEY in your environment (see README and .env.example).
@@ -39,29 +51,50 @@ else:
     )
 
 
-# Helper: call OpenAI with exponential backoff for transient errors
-def _openai_with_backoff(callable_func, repeat=3, backoff_factor=1, *args, **kwargs):
-    last_exc = None
-    for i in range(repeat):
-        try:
-            return callable_func(*args, **kwargs)
-        except Exception as e:
-            last_exc = e
-            logging.warning(f"OpenAI call failed (attempt {i+1}/{repeat}): {e}")
-            if i < repeat - 1:
-                time.sleep(backoff_factor * (2**i))
-    # re-raise the last exception for callers to handle
-    raise last_exc
+# Helper: call OpenAI with jittered exponential backoff for transient errors
+# (see LLMClient.call_with_backoff).
+def _openai_with_backoff(callable_func, repeat=3, backoff_factor=None, *args, **kwargs):
+    return get_llm_client().call_with_backoff(
+        callable_func, repeat, backoff_factor, *args, **kwargs
+    )
+
+
+def _limited(func):
+    """Wrap `func` so that each call holds one of the client's request slots."""
+
+    def _call(*args, **kwargs):
+        with get_llm_client().slot():
+            return func(*args, **kwargs)
+
+    return _call
+
+
+def _report_usage(usage):
+    """Passes the token counts of an OpenAI-style `usage` object to llm_metrics."""
+    if usage:
+        report_usage(usage.get("prompt_tokens"), usage.get("completion_tokens"))
+
+
+def _raise_transcript_miss(key):
+    raise TranscriptMiss(key)
+
+
+def _embedding_text(text):
+    text = text.replace("\n", " ")
+    if not text:
+        text = "this is blank"
+    return text
 
 
 def temp_sleep(seconds=0.1):
+    # No longer called before requests; the client's concurrency limit and
+    # backoff take care of rate limiting. Kept for scripts that import it.
     time.sleep(seconds)
 
 
+@profiled("llm:chat")
 def ChatGPT_single_request(prompt):
-    temp_sleep()
-
-    completion = openai.ChatCompletion.create(
+    completion = _limited(openai.ChatCompletion.create)(
         model="gpt-3.5-turbo", messages=[{"role": "user", "content": prompt}]
     )
     return completion["choices"][0]["message"]["content"]
@@ -72,18 +105,23 @@ def ChatGPT_single_request(prompt):
 # ============================================================================
 
 
-def GPT4_request(prompt, timeout=20, repeat=3):
+@profiled("llm:gpt4")
+@transcribed(
+    "gpt4",
+    lambda prompt, *a, **kw: ("gpt-4", prompt),
+    lambda key: "ChatGPT ERROR",
+)
+def GPT4_request(prompt, timeout=None, repeat=3):
     """Given a prompt, make a GPT-4 request with retries and timeout."""
-    temp_sleep()
     try:
         completion = _openai_with_backoff(
-            lambda **kw: openai.ChatCompletion.create(**kw),
+            _limited(lambda **kw: openai.ChatCompletion.create(**kw)),
             repeat=repeat,
-            backoff_factor=1,
             model="gpt-4",
             messages=[{"role": "user", "content": prompt}],
-            request_timeout=timeout,
+            request_timeout=timeout or get_llm_client().timeout("openai", 20),
         )
+        _report_usage(completion.get("usage"))
         return completion["choices"][0]["message"]["content"]
     except Exception:
         logging.exception("GPT4 request failed")
@@ -100,6 +138,7 @@ def _ollama_parse_response(resp):
 
     # Try common shapes
     if isinstance(body, dict):
+        report_usage(body.get("prompt_eval_count"), body.get("eval_count"))
         if "results" in body and isinstance(body["results"], list):
             first = body["results"][0]
             # content nested in different keys depending on Ollama version
@@ -118,22 +157,25 @@ def _ollama_parse_response(resp):
     return str(body)
 
 
-def Ollama_request(prompt, model=None, timeout=20, repeat=3):
+def Ollama_request(prompt, model=None, timeout=None, repeat=3):
     """Call an Ollama HTTP endpoint and return the generated text.
 
     This implementation is intentionally permissive about the exact JSON
-    shape returned by different Ollama versions; tests mock `requests.post`.
+    shape returned by different Ollama versions; tests mock the pooled
+    client's `session.post`.
     """
     url = os.environ.get("OLLAMA_API_URL", OLLAMA_API_URL)
+    client = get_llm_client()
+    timeout = timeout or client.timeout("ollama", 20)
 
     def _call():
         payload = {"model": model or os.environ.get("OLLAMA_MODEL", OLLAMA_MODEL), "prompt": prompt}
-        r = requests.post(url, json=payload, timeout=timeout)
+        r = client.post(url, json=payload, timeout=timeout)
         r.raise_for_status()
         return r
 
     try:
-        resp = _openai_with_backoff(lambda **kw: _call(), repeat=repeat, backoff_factor=1)
+        resp = _openai_with_backoff(lambda **kw: _call(), repeat=repeat)
         return _ollama_parse_response(resp)
     except Exception:
         logging.exception("Ollama request failed")
@@ -141,9 +183,11 @@ def Ollama_request(prompt, model=None, timeout=20, repeat=3):
 
 
 from persona.prompt_template.copilot_token import resolve_copilot_api_token
+from persona.prompt_template.embedding_cache import get_embedding_cache
+from persona.prompt_template.prompt_cache import get_prompt_cache, prompt_cache_key
 
 
-def Copilot_request(prompt, model=None, timeout=20, repeat=3):
+def Copilot_request(prompt, model=None, timeout=None, repeat=3):
     """Call a configured Copilot HTTP endpoint.
 
     Two modes:
@@ -156,6 +200,8 @@ def Copilot_request(prompt, model=None, timeout=20, repeat=3):
     # 1) explicit override
     explicit_url = os.environ.get("COPILOT_API_URL")
     headers = {}
+    client = get_llm_client()
+    timeout = timeout or client.timeout("copilot", 20)
 
     if explicit_url:
         url = explicit_url
@@ -173,14 +219,15 @@ def Copilot_request(prompt, model=None, timeout=20, repeat=3):
         # If model is not provided, default to the configured Copilot default model
         _model = model or os.environ.get("COPILOT_DEFAULT_MODEL", COPILOT_DEFAULT_MODEL)
         payload = {"prompt": prompt, "model": _model}
-        r = requests.post(url, json=payload, headers=headers, timeout=timeout)
+        r = client.post(url, json=payload, headers=headers, timeout=timeout)
         r.raise_for_status()
         return r
 
     try:
-        resp = _openai_with_backoff(lambda **kw: _call(), repeat=repeat, backoff_factor=1)
+        resp = _openai_with_backoff(lambda **kw: _call(), repeat=repeat)
         try:
             body = resp.json()
+            _report_usage(body.get("usage"))
             return body.get("result") or body.get("output") or body.get("text") or json.dumps(body)
         except Exception:
             return resp.text
@@ -189,7 +236,13 @@ def Copilot_request(prompt, model=None, timeout=20, repeat=3):
         return "ChatGPT ERROR"
 
 
-def ChatGPT_request(prompt, timeout=15, repeat=3):
+@profiled("llm:chat")
+@transcribed(
+    "chat",
+    lambda prompt, *a, **kw: (*_chat_backend_and_model(), prompt),
+    lambda key: "ChatGPT ERROR",
+)
+def ChatGPT_request(prompt, timeout=None, repeat=3):
     """Make a ChatGPT (gpt-3.5-turbo) request with retries and timeout.
 
     If environment `LLM_BACKEND` is set to `ollama` or `copilot`, dispatch to
@@ -203,19 +256,88 @@ def ChatGPT_request(prompt, timeout=15, repeat=3):
 
     try:
         completion = _openai_with_backoff(
-            lambda **kw: openai.ChatCompletion.create(**kw),
+            _limited(lambda **kw: openai.ChatCompletion.create(**kw)),
             repeat=repeat,
-            backoff_factor=1,
             model="gpt-3.5-turbo",
             messages=[{"role": "user", "content": prompt}],
-            request_timeout=timeout,
+            request_timeout=timeout or get_llm_client().timeout("openai", 15),
         )
+        _report_usage(completion.get("usage"))
         return completion["choices"][0]["message"]["content"]
     except Exception:
         logging.exception("ChatGPT request failed")
         return "ChatGPT ERROR"
 
 
+class RenderedPrompt(str):
+    """A prompt string that remembers the template file it was rendered from.
+
+    generate_prompt returns these so the safe_generate_response functions can
+    tell which template a prompt came from (see prompt_cache.py). Anything
+    that builds a new string from it gets a plain str back.
+    """
+
+    def __new__(cls, text, template=None):
+        obj = super().__new__(cls, text)
+        obj.template = template
+        return obj
+
+
+_CACHE_MISS = object()
+
+
+def _chat_backend_and_model():
+    backend = os.environ.get("LLM_BACKEND", "openai").lower()
+    if backend == "ollama":
+        return backend, os.environ.get("OLLAMA_MODEL", OLLAMA_MODEL)
+    if backend == "copilot":
+        return backend, os.environ.get("COPILOT_DEFAULT_MODEL", COPILOT_DEFAULT_MODEL)
+    return "openai", "gpt-3.5-turbo"
+
+
+def _parse_json_output(response):
+    end_index = response.rfind("}") + 1
+    return json.loads(response[:end_index])["output"]
+
+
+def _prompt_cache_entry(template, prompt, backend, model, gpt_param=None):
+    """Returns (cache, key) for a prompt, or (None, None) if it is not cached."""
+    cache = get_prompt_cache()
+    if not cache or not cache.is_cacheable(template, gpt_param):
+        return None, None
+    return cache, prompt_cache_key(backend, model, str(prompt), gpt_param)
+
+
+def _from_prompt_cache(
+    cache, key, template, prompt, parse, func_validate, func_clean_up
+):
+    """Returns the cleaned up cached output, or _CACHE_MISS.
+
+    The raw response is validated again, and dropped from the cache if it no
+    longer passes (e.g. after a change to the validation function).
+    """
+    if not cache:
+        return _CACHE_MISS
+    raw_response = cache.get(key, template)
+    if raw_response is None:
+        return _CACHE_MISS
+    try:
+        curr_gpt_response = parse(raw_response)
+        if func_validate(curr_gpt_response, prompt=prompt):
+            return func_clean_up(curr_gpt_response, prompt=prompt)
+    except Exception:
+        logging.exception("cached response failed to parse")
+    cache.discard(key)
+    return _CACHE_MISS
+
+
+def _to_prompt_cache(cache, key, template, raw_response):
+    # Never cache the error strings the request functions return on failure,
+    # even when a lenient validator accepted them.
+    if cache and raw_response not in ("ChatGPT ERROR", "TOKEN LIMIT EXCEEDED"):
+        cache.put(key, template, raw_response)
+
+
 def GPT4_safe_generate_response(
     prompt,
     example_output,
@@ -226,6 +348,7 @@ def GPT4_safe_generate_response(
     func_clean_up=None,
     verbose=False,
 ):
+    template = getattr(prompt, "template", None)
     prompt = 'GPT-3 Prompt:\n"""\n' + prompt + '\n"""\n'
     prompt += (
         f"Output the response to the prompt above in json. {special_instruction}\n"
@@ -237,16 +360,28 @@ def GPT4_safe_generate_response(
         print("CHAT GPT PROMPT")
         print(prompt)
 
+    call = start_call(template, "openai:gpt-4")
+    cache, key = _prompt_cache_entry(template, prompt, "openai", "gpt-4")
+    output = _from_prompt_cache(
+        cache, key, template, prompt, _parse_json_output, func_validate, func_clean_up
+    )
+    if output is not _CACHE_MISS:
+        call.cache_hit()
+        return output
+
     for i in range(repeat):
+        raw_response = None
 
         try:
-            curr_gpt_response = GPT4_request(prompt).strip()
-            end_index = curr_gpt_response.rfind("}") + 1
-            curr_gpt_response = curr_gpt_response[:end_index]
-            curr_gpt_response = json.loads(curr_gpt_response)["output"]
+            raw_response = GPT4_request(prompt).strip()
+            curr_gpt_response = _parse_json_output(raw_response)
 
             if func_validate(curr_gpt_response, prompt=prompt):
-                return func_clean_up(curr_gpt_response, prompt=prompt)
+                _to_prompt_cache(cache, key, template, raw_response)
+                output = func_clean_up(curr_gpt_response, prompt=prompt)
+                call.request(prompt, raw_response, True)
+                call.finish()
+                return output
 
             if verbose:
                 print("---- repeat count: \n", i, curr_gpt_response)
@@ -256,7 +391,9 @@ def GPT4_safe_generate_response(
         except Exception:
             logging.exception("GPT4_safe_generate_response parse/validation error")
             pass
+        call.request(prompt, raw_response, False)
 
+    call.finish(fail_safe=True)
     return False
 
 
@@ -270,6 +407,7 @@ def ChatGPT_safe_generate_response(
     func_clean_up=None,
     verbose=False,
 ):
+    template = getattr(prompt, "template", None)
     # prompt = 'GPT-3 Prompt:\n"""\n' + prompt + '\n"""\n'
     prompt = '"""\n' + prompt + '\n"""\n'
     prompt += (
@@ -282,20 +420,33 @@ def ChatGPT_safe_generate_response(
         print("CHAT GPT PROMPT")
         print(prompt)
 
+    backend, model = _chat_backend_and_model()
+    call = start_call(template, f"{backend}:{model}")
+    cache, key = _prompt_cache_entry(template, prompt, backend, model)
+    output = _from_prompt_cache(
+        cache, key, template, prompt, _parse_json_output, func_validate, func_clean_up
+    )
+    if output is not _CACHE_MISS:
+        call.cache_hit()
+        return output
+
     for i in range(repeat):
+        raw_response = None
 
         try:
-            curr_gpt_response = ChatGPT_request(prompt).strip()
-            end_index = curr_gpt_response.rfind("}") + 1
-            curr_gpt_response = curr_gpt_response[:end_index]
-            curr_gpt_response = json.loads(curr_gpt_response)["output"]
+            raw_response = ChatGPT_request(prompt).strip()
+            curr_gpt_response = _parse_json_output(raw_response)
 
             # print ("---ashdfaf")
             # print (curr_gpt_response)
             # print ("000asdfhia")
 
             if func_validate(curr_gpt_response, prompt=prompt):
-                return func_clean_up(curr_gpt_response, prompt=prompt)
+                _to_prompt_cache(cache, key, template, raw_response)
+                output = func_clean_up(curr_gpt_response, prompt=prompt)
+                call.request(prompt, raw_response, True)
+                call.finish()
+                return output
 
             if verbose:
                 print("---- repeat count: \n", i, curr_gpt_response)
@@ -305,7 +456,9 @@ def ChatGPT_safe_generate_response(
         except Exception:
             logging.exception("ChatGPT_safe_generate_response parse/validation error")
             pass
+        call.request(prompt, raw_response, False)
 
+    call.finish(fail_safe=True)
     return False
 
 
@@ -321,11 +474,18 @@ def ChatGPT_safe_generate_response_OLD(
         print("CHAT GPT PROMPT")
         print(prompt)
 
+    call = start_call(
+        getattr(prompt, "template", None), ":".join(_chat_backend_and_model())
+    )
     for i in range(repeat):
+        curr_gpt_response = None
         try:
             curr_gpt_response = ChatGPT_request(prompt).strip()
             if func_validate(curr_gpt_response, prompt=prompt):
-                return func_clean_up(curr_gpt_response, prompt=prompt)
+                output = func_clean_up(curr_gpt_response, prompt=prompt)
+                call.request(prompt, curr_gpt_response, True)
+                call.finish()
+                return output
             if verbose:
                 print(f"---- repeat count: {i}")
                 print(curr_gpt_response)
@@ -334,7 +494,9 @@ def ChatGPT_safe_generate_response_OLD(
         except Exception:
             logging.exception("ChatGPT_safe_generate_response_OLD parse/validation error")
             pass
+        call.request(prompt, curr_gpt_response, False)
     print("FAIL SAFE TRIGGERED")
+    call.finish(fail_safe=True)
     return fail_safe_response
 
 
@@ -343,6 +505,12 @@ def ChatGPT_safe_generate_response_OLD(
 # ============================================================================
 
 
+@profiled("llm:gpt")
+@transcribed(
+    "gpt",
+    lambda prompt, gpt_parameter: (prompt, gpt_parameter),
+    lambda key: "TOKEN LIMIT EXCEEDED",
+)
 def GPT_request(prompt, gpt_parameter):
     """
     Given a prompt and a dictionary of GPT parameters, make a request to OpenAI
@@ -355,9 +523,8 @@ def GPT_request(prompt, gpt_parameter):
     RETURNS:
       a str of GPT-3's response.
     """
-    temp_sleep()
     try:
-        response = openai.Completion.create(
+        response = _limited(openai.Completion.create)(
             model=gpt_parameter["engine"],
             prompt=prompt,
             temperature=gpt_parameter["temperature"],
@@ -368,6 +535,7 @@ def GPT_request(prompt, gpt_parameter):
             stream=gpt_parameter["stream"],
             stop=gpt_parameter["stop"],
         )
+        _report_usage(getattr(response, "usage", None))
         return response.choices[0].text
     except Exception:
         logging.exception("TOKEN LIMIT EXCEEDED")
@@ -392,14 +560,9 @@ def generate_prompt(curr_input, prompt_lib_file):
         curr_input = [curr_input]
     curr_input = [str(i) for i in curr_input]
 
-    f = open(prompt_lib_file, "r")
-    prompt = f.read()
-    f.close()
-    for count, i in enumerate(curr_input):
-        prompt = prompt.replace(f"!<INPUT {count}>!", i)
-    if "<commentblockmarker>###</commentblockmarker>" in prompt:
-        prompt = prompt.split("<commentblockmarker>###</commentblockmarker>")[1]
-    return prompt.strip()
+    # Templates are read and parsed once; see prompt_registry.py.
+    prompt = get_prompt_registry().render(prompt_lib_file, curr_input)
+    return RenderedPrompt(prompt, prompt_lib_file)
 
 
 def safe_generate_response(
@@ -414,18 +577,45 @@ def safe_generate_response(
     if verbose:
         print(prompt)
 
+    template = getattr(prompt, "template", None)
+    call = start_call(template, f"openai:{gpt_parameter.get('engine')}")
+    cache, key = _prompt_cache_entry(
+        template, prompt, "openai", gpt_parameter.get("engine"), gpt_parameter
+    )
+    output = _from_prompt_cache(
+        cache, key, template, prompt, lambda raw: raw, func_validate, func_clean_up
+    )
+    if output is not _CACHE_MISS:
+        call.cache_hit()
+        return output
+
     for i in range(repeat):
         curr_gpt_response = GPT_request(prompt, gpt_parameter)
-        if func_validate(curr_gpt_response, prompt=prompt):
-            return func_clean_up(curr_gpt_response, prompt=prompt)
+        valid = func_validate(curr_gpt_response, prompt=prompt)
+        call.request(prompt, curr_gpt_response, valid)
+        if valid:
+            _to_prompt_cache(cache, key, template, curr_gpt_response)
+            output = func_clean_up(curr_gpt_response, prompt=prompt)
+            call.finish()
+            return output
         if verbose:
             print("---- repeat count: ", i, curr_gpt_response)
             print(curr_gpt_response)
             print("~~~~")
+    call.finish(fail_safe=True)
     return fail_safe_response
 
 
-def Copilot_get_embedding(text, model=None, timeout=10, resolve_func=None):
+@profiled("llm:embedding")
+@transcribed(
+    "copilot_embedding",
+    lambda text, model=None, *a, **kw: (
+        model or os.environ.get("COPILOT_DEFAULT_MODEL"),
+        _embedding_text(text),
+    ),
+    _raise_transcript_miss,
+)
+def Copilot_get_embedding(text, model=None, timeout=None, resolve_func=None):
     """Attempt to obtain an embedding from Copilot if the provider exposes an
     embeddings endpoint. Fallback to OpenAI embeddings when unavailable.
 
@@ -435,9 +625,19 @@ def Copilot_get_embedding(text, model=None, timeout=10, resolve_func=None):
     - Otherwise, try to derive baseUrl using resolve_copilot_api_token and call
       baseUrl + "/v1/embeddings". If both fail, fallback to OpenAI.
     """
-    text = text.replace("\n", " ")
-    if not text:
-        text = "this is blank"
+    text = _embedding_text(text)
+
+    # Copilot vectors are cached under their own model key; if we end up
+    # falling back to OpenAI, get_embedding caches that result separately.
+    cache = get_embedding_cache()
+    cache_model = f"copilot:{model or os.environ.get('COPILOT_DEFAULT_MODEL')}"
+    if cache:
+        cached = cache.get(cache_model, text)
+        if cached is not None:
+            return cached
+
+    client = get_llm_client()
+    timeout = timeout or client.timeout("copilot", 10)
 
     # Allow injection of a resolver for testability
     resolve_func = resolve_func or (lambda: resolve_copilot_api_token())
@@ -448,14 +648,15 @@ def Copilot_get_embedding(text, model=None, timeout=10, resolve_func=None):
             info = resolve_func()
             headers = {"Authorization": f"Bearer {info['token']}"}
             payload = {"input": text, "model": model or os.environ.get("COPILOT_DEFAULT_MODEL")}
-            r = requests.post(emb_url, json=payload, headers=headers, timeout=timeout)
+            r = client.post(emb_url, json=payload, headers=headers, timeout=timeout)
             r.raise_for_status()
             body = r.json()
             # Accept various shapes
             if isinstance(body, dict) and "data" in body:
-                return body["data"][0]["embedding"]
+                embedding = body["data"][0]["embedding"]
+                return _cache_embedding(cache, cache_model, text, embedding)
             if isinstance(body, dict) and "embedding" in body:
-                return body["embedding"]
+                return _cache_embedding(cache, cache_model, text, body["embedding"])
         except Exception:
             logging.exception("Copilot embeddings call failed; falling back to OpenAI")
 
@@ -467,13 +668,14 @@ def Copilot_get_embedding(text, model=None, timeout=10, resolve_func=None):
             url = base.rstrip("/") + "/v1/embeddings"
             headers = {"Authorization": f"Bearer {info['token']}"}
             payload = {"input": text, "model": model or os.environ.get("COPILOT_DEFAULT_MODEL")}
-            r = requests.post(url, json=payload, headers=headers, timeout=timeout)
+            r = client.post(url, json=payload, headers=headers, timeout=timeout)
             r.raise_for_status()
             body = r.json()
             if isinstance(body, dict) and "data" in body:
-                return body["data"][0]["embedding"]
+                embedding = body["data"][0]["embedding"]
+                return _cache_embedding(cache, cache_model, text, embedding)
             if isinstance(body, dict) and "embedding" in body:
-                return body["embedding"]
+                return _cache_embedding(cache, cache_model, text, body["embedding"])
     except Exception:
         logging.exception("Copilot embeddings derived baseUrl failed; falling back to OpenAI")
 
@@ -481,11 +683,123 @@ def Copilot_get_embedding(text, model=None, timeout=10, resolve_func=None):
     return get_embedding(text, model=(model or "text-embedding-ada-002"))
 
 
+def _cache_embedding(cache, model, text, embedding):
+    # Hits come back as float32, so round misses the same way; otherwise a
+    # text's vector would depend on whether the cache was warm.
+    if cache:
+        cache.put(model, text, embedding)
+        return array("f", embedding).tolist()
+    return embedding
+
+
+@profiled("llm:embedding")
+@transcribed(
+    "embedding",
+    lambda text, model="text-embedding-ada-002": (model, _embedding_text(text)),
+    _raise_transcript_miss,
+)
 def get_embedding(text, model="text-embedding-ada-002"):
-    text = text.replace("\n", " ")
-    if not text:
-        text = "this is blank"
-    return openai.Embedding.create(input=[text], model=model)["data"][0]["embedding"]
+    text = _embedding_text(text)
+
+    # Shared across personas and simulations when EMBEDDING_CACHE(_PATH) is
+    # set; see embedding_cache.py.
+    cache = get_embedding_cache()
+    if cache:
+        cached = cache.get(model, text)
+        if cached is not None:
+            return cached
+
+    response = _limited(openai.Embedding.create)(input=[text], model=model)
+    embedding = response["data"][0]["embedding"]
+    return _cache_embedding(cache, model, text, embedding)
+
+
+@profiled("llm:embedding")
+def get_embeddings(texts, model="text-embedding-ada-002", batch_size=None):
+    """Embed several texts, returning their vectors in the same order.
+
+    Identical texts are embedded once, cached vectors are reused, and the rest
+    are sent in requests of at most `batch_size` (default EMBEDDING_BATCH_SIZE)
+    inputs each. A batch whose request fails or comes back malformed is retried
+    one text at a time through get_embedding, as is everything while an LLM
+    transcript is recording or replaying (transcripts hold one entry per text).
+    """
+    texts = [_embedding_text(text) for text in texts]
+    unique = list(dict.fromkeys(texts))
+    if get_llm_transcript() is not None:
+        vectors = {text: get_embedding(text, model=model) for text in unique}
+        return [vectors[text] for text in texts]
+
+    cache = get_embedding_cache()
+    vectors = dict()
+    missing = []
+    for text in unique:
+        cached = cache.get(model, text) if cache else None
+        if cached is not None:
+            vectors[text] = cached
+        else:
+            missing.append(text)
+
+    batch_size = batch_size or EMBEDDING_BATCH_SIZE
+    for start in range(0, len(missing), batch_size):
+        batch = missing[start:start + batch_size]
+        try:
+            data = _limited(openai.Embedding.create)(input=batch, model=model)["data"]
+            data = sorted(data, key=lambda item: item.get("index", 0))
+            if len(data) != len(batch):
+                raise ValueError(f"expected {len(batch)} embeddings, got {len(data)}")
+            for text, item in zip(batch, data):
+                vectors[text] = _cache_embedding(cache, model, text, item["embedding"])
+        except Exception:
+            logging.exception(
+                "batched embeddings call failed; embedding one text at a time"
+            )
+            for text in batch:
+                vectors[text] = get_embedding(text, model=model)
+    return [vectors[text] for text in texts]
+
+
+# ============================================================================
+# #######################[SECTION 3: ASYNC ENTRY POINTS] #####################
+# ============================================================================
+# These run the blocking functions above on the pooled client's worker
+# threads, so callers on an event loop can await them (and asyncio.gather
+# several) without blocking the loop. Retries back off inside the worker
+# thread, and the client's concurrency limit still applies.
+
+
+async def ChatGPT_request_async(prompt, timeout=None, repeat=3):
+    return await get_llm_client().run_async(
+        ChatGPT_request, prompt, timeout=timeout, repeat=repeat
+    )
+
+
+async def GPT4_request_async(prompt, timeout=None, repeat=3):
+    return await get_llm_client().run_async(
+        GPT4_request, prompt, timeout=timeout, repeat=repeat
+    )
+
+
+async def GPT_request_async(prompt, gpt_parameter):
+    return await get_llm_client().run_async(GPT_request, prompt, gpt_parameter)
+
+
+async def get_embedding_async(text, model="text-embedding-ada-002"):
+    return await get_llm_client().run_async(get_embedding, text, model=model)
+
+
+async def get_embeddings_async(texts, model="text-embedding-ada-002"):
+    return await get_llm_client().run_async(get_embeddings, texts, model=model)
+
+
+async def run_prompt_async(prompt_func, *args, **kwargs):
+    """Await any blocking prompt function, e.g. a `run_gpt_prompt_*` function.
+
+    Example:
+      await asyncio.gather(run_prompt_async(run_gpt_prompt_pronunciatio, act, p),
+                           run_prompt_async(run_gpt_prompt_event_triple, act, p))
+    """
+    return await get_llm_client().run_async(prompt_func, *args, **kwargs)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,191 @@
+"""Pooled HTTP client shared by the LLM backends.
+
+One `LLMClient` per process holds:
+- a keep-alive `requests.Session` with a sized connection pool, so Ollama and
+  Copilot calls reuse TCP/TLS connections instead of handshaking every time
+- a concurrency limit on in-flight requests, which matters once personas think
+  in parallel (see `ReverieServer.move_personas`)
+- per-backend timeouts
+- retries with jittered exponential backoff, with a sync entry point
+  (`call_with_backoff`) and an async one (`acall_with_backoff`) that waits
+  with `asyncio.sleep` so the event loop is never blocked
+- `run_async`, which runs any blocking prompt function (e.g. the
+  `run_gpt_prompt_*` functions) on the client's worker threads so they can be
+  awaited and gathered
+
+Settings come from the environment: `LLM_MAX_CONCURRENCY` (default 8),
+`LLM_POOL_SIZE` (default 16), `LLM_BACKOFF_BASE` / `LLM_BACKOFF_MAX` in seconds
+(default 1 / 30), and `LLM_TIMEOUT_OPENAI`, `LLM_TIMEOUT_OLLAMA`,
+`LLM_TIMEOUT_COPILOT` in seconds, which override the timeout defaults of the
+request functions in gpt_structure.py.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from persona.prompt_template.llm_metrics import count_backoff_retry
+
+BACKENDS = ("openai", "ollama", "copilot")
+
+
+class LLMClient:
+    """Keep-alive session, concurrency limit, timeouts and backoff for LLM calls."""
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        pool_size: int = 16,
+        timeouts: Optional[Dict[str, float]] = None,
+        backoff_base: float = 1.0,
+        backoff_max: float = 30.0,
+    ):
+        self.max_concurrency = max_concurrency
+        self.timeouts = dict(timeouts or {})
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """Hold one of the `max_concurrency` request slots."""
+        with self._slots:
+            yield
+
+    def timeout(self, backend: str, default: float) -> float:
+        return self.timeouts.get(backend, default)
+
+    def post(self, url: str, **kwargs: Any) -> requests.Response:
+        with self.slot():
+            return self.session.post(url, **kwargs)
+
+    def backoff_delay(
+        self, attempt: int, backoff_factor: Optional[float] = None
+    ) -> float:
+        """Full-jitter delay before retry number `attempt + 1`."""
+        base = self.backoff_base if backoff_factor is None else backoff_factor
+        return random.uniform(0, min(self.backoff_max, base * (2 ** attempt)))
+
+    def call_with_backoff(
+        self,
+        func: Callable[..., Any],
+        repeat: int = 3,
+        backoff_factor: Optional[float] = None,
+        *args: Any,
+        **kwargs: Any,
+    ) -> Any:
+        last_exc = None
+        for i in range(repeat):
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                last_exc = e
+                logging.warning(f"LLM call failed (attempt {i+1}/{repeat}): {e}")
+                if i < repeat - 1:
+                    count_backoff_retry()
+                    time.sleep(self.backoff_delay(i, backoff_factor))
+        # re-raise the last exception for callers to handle
+        raise last_exc
+
+    async def acall_with_backoff(
+        self,
+        func: Callable[..., Any],
+        repeat: int = 3,
+        backoff_factor: Optional[float] = None,
+        *args: Any,
+        **kwargs: Any,
+    ) -> Any:
+        last_exc = None
+        for i in range(repeat):
+            try:
+                return await self.run_async(func, *args, **kwargs)
+            except Exception as e:
+                last_exc = e
+                logging.warning(f"LLM call failed (attempt {i+1}/{repeat}): {e}")
+                if i < repeat - 1:
+                    await asyncio.sleep(self.backoff_delay(i, backoff_factor))
+        raise last_exc
+
+    async def run_async(
+        self, func: Callable[..., Any], *args: Any, **kwargs: Any
+    ) -> Any:
+        """Run a blocking function on the client's worker threads and await it."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._get_executor(), functools.partial(func, *args, **kwargs)
+        )
+
+    def close(self) -> None:
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+        self.session.close()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # Prompt functions wait on a request slot, so a few more threads than
+        # slots keeps the slots busy while other threads parse responses.
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=2 * self.max_concurrency, thread_name_prefix="llm"
+                )
+            return self._executor
+
+
+def client_settings_from_env(env: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    env = env or os.environ
+    timeouts = {}
+    for backend in BACKENDS:
+        value = env.get(f"LLM_TIMEOUT_{backend.upper()}")
+        if value:
+            timeouts[backend] = float(value)
+    return {
+        "max_concurrency": max(1, int(env.get("LLM_MAX_CONCURRENCY", "8"))),
+        "pool_size": max(1, int(env.get("LLM_POOL_SIZE", "16"))),
+        "timeouts": timeouts,
+        "backoff_base": float(env.get("LLM_BACKOFF_BASE", "1")),
+        "backoff_max": float(env.get("LLM_BACKOFF_MAX", "30")),
+    }
+
+
+_client: Optional[LLMClient] = None
+_client_lock = threading.Lock()
+
+
+def get_llm_client() -> LLMClient:
+    """Return the process-wide client, creating it from the environment on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LLMClient(**client_settings_from_env())
+        return _client
+
+
+def reset_llm_client() -> None:
+    """Drop the process-wide client so the next call re-reads the environment."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
@@ -0,0 +1,280 @@
+"""Per-template metrics for the safe_generate_response functions.
+
+Every call to `safe_generate_response`, `ChatGPT_safe_generate_response`,
+`ChatGPT_safe_generate_response_OLD` and `GPT4_safe_generate_response` is
+counted under its prompt template (the file generate_prompt rendered it from)
+and backend (e.g. "openai:gpt-3.5-turbo" or "ollama:llama3.1:8b"). For each
+pair we keep:
+
+- calls, prompt cache hits, and requests actually sent to the backend;
+- retries (requests after the first one of a call) and backoff retries (failed
+  HTTP attempts retried inside a request by LLMClient.call_with_backoff);
+- validation failures (responses that did not parse or validate), error
+  responses ("ChatGPT ERROR", "TOKEN LIMIT EXCEEDED") and fail-safe fallbacks;
+- prompt and completion tokens, as reported by the backend or estimated at
+  about four characters per token when it does not report them (e.g. replayed
+  transcripts), with a count of the estimated requests;
+- a histogram of the wall time of the calls that missed the prompt cache.
+
+The metrics are kept in memory for the life of the process. `print llm
+metrics` in the server prompt shows them, and `dump llm metrics [path]` (also
+run on every save) writes them to a .json or .csv file. Set `LLM_METRICS=0`
+to turn them off.
+"""
+
+from __future__ import annotations
+
+import csv
+import json
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+_FALSY = ("0", "false", "no", "off")
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket
+# holds everything slower.
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60)
+ERROR_RESPONSES = ("ChatGPT ERROR", "TOKEN LIMIT EXCEEDED")
+UNTEMPLATED = "<untemplated>"
+
+_COUNTERS = (
+    "calls",
+    "cache_hits",
+    "requests",
+    "retries",
+    "backoff_retries",
+    "validation_failures",
+    "errors",
+    "fail_safes",
+    "prompt_tokens",
+    "completion_tokens",
+    "estimated_requests",
+)
+
+# Token usage reported by the last request on this thread; see report_usage.
+_local = threading.local()
+
+
+def estimate_tokens(text: Any) -> int:
+    return math.ceil(len(str(text)) / 4)
+
+
+def report_usage(
+    prompt_tokens: Optional[int], completion_tokens: Optional[int]
+) -> None:
+    """Called by the request functions with the token counts the backend reported."""
+    if prompt_tokens is not None and completion_tokens is not None:
+        _local.usage = (int(prompt_tokens), int(completion_tokens))
+
+
+def count_backoff_retry() -> None:
+    """Called by LLMClient.call_with_backoff before it retries a failed request."""
+    _local.backoff_retries = getattr(_local, "backoff_retries", 0) + 1
+
+
+def _take_request_state() -> Tuple[Optional[Tuple[int, int]], int]:
+    usage = getattr(_local, "usage", None)
+    backoff_retries = getattr(_local, "backoff_retries", 0)
+    _local.usage = None
+    _local.backoff_retries = 0
+    return usage, backoff_retries
+
+
+def template_name(template: Optional[str]) -> str:
+    """Shortens a template path to its part below prompt_template/."""
+    if not template:
+        return UNTEMPLATED
+    template = template.replace(os.sep, "/")
+    return template.split("prompt_template/")[-1]
+
+
+class LLMCall:
+    """Tracks one safe_generate_response call; see LLMMetrics.start."""
+
+    def __init__(self, metrics: "LLMMetrics", template: str, backend: str):
+        self.metrics = metrics
+        self.template = template
+        self.backend = backend
+        self.counts = dict.fromkeys(_COUNTERS, 0)
+        self.counts["calls"] = 1
+        self.start = time.perf_counter()
+        _take_request_state()
+
+    def cache_hit(self) -> None:
+        self.counts["cache_hits"] = 1
+        self.metrics._add(self, None)
+
+    def request(self, prompt: str, response: Any, valid: bool) -> None:
+        """Counts one request to the backend and whether its response validated."""
+        usage, backoff_retries = _take_request_state()
+        counts = self.counts
+        if counts["requests"]:
+            counts["retries"] += 1
+        counts["requests"] += 1
+        counts["backoff_retries"] += backoff_retries
+        if response in ERROR_RESPONSES:
+            counts["errors"] += 1
+        if not valid:
+            counts["validation_failures"] += 1
+        if usage is None:
+            usage = (estimate_tokens(prompt), estimate_tokens(response or ""))
+            counts["estimated_requests"] += 1
+        counts["prompt_tokens"] += usage[0]
+        counts["completion_tokens"] += usage[1]
+
+    def finish(self, fail_safe: bool = False) -> None:
+        self.counts["fail_safes"] = int(fail_safe)
+        self.metrics._add(self, time.perf_counter() - self.start)
+
+
+class _NoCall:
+    """Stands in for LLMCall when the metrics are off."""
+
+    def cache_hit(self) -> None:
+        pass
+
+    def request(self, prompt: str, response: Any, valid: bool) -> None:
+        pass
+
+    def finish(self, fail_safe: bool = False) -> None:
+        pass
+
+
+class LLMMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (template, backend) -> counters and "latency" histogram
+        self._entries: Dict[Tuple[str, str], Dict[str, Any]] = dict()
+
+    def start(self, template: Optional[str], backend: str) -> LLMCall:
+        return LLMCall(self, template_name(template), backend)
+
+    def _add(self, call: LLMCall, seconds: Optional[float]) -> None:
+        with self._lock:
+            entry = self._entries.get((call.template, call.backend))
+            if entry is None:
+                entry = dict.fromkeys(_COUNTERS, 0)
+                entry.update(
+                    latency=[0] * (len(LATENCY_BUCKETS) + 1),
+                    seconds=0.0,
+                    max_seconds=0.0,
+                )
+                self._entries[(call.template, call.backend)] = entry
+            for key, val in call.counts.items():
+                entry[key] += val
+            if seconds is not None:
+                bucket = sum(1 for bound in LATENCY_BUCKETS if seconds > bound)
+                entry["latency"][bucket] += 1
+                entry["seconds"] += seconds
+                entry["max_seconds"] = max(entry["max_seconds"], seconds)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """One dict per (template, backend), slowest in total first."""
+        with self._lock:
+            rows = [
+                {
+                    "template": template,
+                    "backend": backend,
+                    **entry,
+                    "latency": entry["latency"].copy(),
+                }
+                for (template, backend), entry in self._entries.items()
+            ]
+        for row in rows:
+            timed = row["calls"] - row["cache_hits"]
+            row["mean_seconds"] = row["seconds"] / timed if timed else 0.0
+        rows.sort(key=lambda row: (-row["seconds"], row["template"], row["backend"]))
+        return rows
+
+    def stats(self) -> Dict[str, Any]:
+        rows = self.rows()
+        totals = {key: sum(row[key] for row in rows) for key in _COUNTERS}
+        totals["seconds"] = sum(row["seconds"] for row in rows)
+        return {
+            "latency_buckets": list(LATENCY_BUCKETS),
+            "totals": totals,
+            "templates": rows,
+        }
+
+    def summary(self, limit: Optional[int] = None) -> str:
+        """A table of the templates for the server prompt, slowest first."""
+        stats = self.stats()
+        totals = stats["totals"]
+        lines = [
+            f"{totals['calls']} calls ({totals['cache_hits']} cached), "
+            f"{totals['requests']} requests, {totals['retries']} retries, "
+            f"{totals['fail_safes']} fail-safes, {totals['seconds']:.1f}s, "
+            f"{totals['prompt_tokens']}+{totals['completion_tokens']} tokens"
+        ]
+        for row in stats["templates"][:limit]:
+            estimated = "~" if row["estimated_requests"] else ""
+            lines.append(
+                f"  {row['template']} [{row['backend']}]: {row['calls']} calls, "
+                f"{row['cache_hits']} cached, {row['seconds']:.1f}s "
+                f"(mean {row['mean_seconds']:.2f}s, "
+                f"max {row['max_seconds']:.2f}s), "
+                f"{row['retries']} retries, "
+                f"{row['backoff_retries']} backoff retries, "
+                f"{row['validation_failures']} invalid, "
+                f"{row['fail_safes']} fail-safes, "
+                f"{estimated}{row['prompt_tokens']}+{row['completion_tokens']} tokens"
+            )
+        return "\n".join(lines)
+
+    def dump(self, path: str) -> str:
+        """Writes the metrics to `path` as CSV if it ends in .csv, else JSON."""
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        if path.lower().endswith(".csv"):
+            bucket_names = [f"le_{bound}s" for bound in LATENCY_BUCKETS]
+            bucket_names.append(f"gt_{LATENCY_BUCKETS[-1]}s")
+            with open(tmp_path, "w", newline="") as outfile:
+                writer = csv.writer(outfile)
+                columns = [
+                    "template",
+                    "backend",
+                    *_COUNTERS,
+                    "seconds",
+                    "mean_seconds",
+                    "max_seconds",
+                ]
+                writer.writerow(columns + bucket_names)
+                for row in self.rows():
+                    writer.writerow([row[key] for key in columns] + row["latency"])
+        else:
+            with open(tmp_path, "w") as outfile:
+                json.dump(self.stats(), outfile, indent=2)
+        os.replace(tmp_path, path)
+        return path
+
+
+_metrics: Optional[LLMMetrics] = None
+_metrics_lock = threading.Lock()
+
+
+def get_llm_metrics(env: Optional[Dict[str, str]] = None) -> Optional[LLMMetrics]:
+    """Return the process-wide metrics, or None when LLM_METRICS=0."""
+    global _metrics
+    env = env or os.environ
+    if env.get("LLM_METRICS", "").lower() in _FALSY:
+        return None
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = LLMMetrics()
+        return _metrics
+
+
+def start_call(template: Optional[str], backend: str):
+    """Starts tracking a call, or returns a no-op tracker when LLM_METRICS=0."""
+    metrics = get_llm_metrics()
+    if metrics is None:
+        return _NoCall()
+    return metrics.start(template, backend)
@@ -0,0 +1,196 @@
+"""Record/replay transcripts of LLM and embedding calls.
+
+In record mode every response that passes through `ChatGPT_request`,
+`GPT4_request`, `GPT_request`, `get_embedding` and `Copilot_get_embedding` is
+appended to a transcript file, one JSON object per line:
+
+    {"kind": "chat", "key": "<sha256>", "response": "..."}
+    {"kind": "embedding", "key": "<sha256>", "vector": "<base64 float32>"}
+
+The key is a digest of the call kind, backend/model and the request itself
+(prompt, gpt_parameter, or embedded text), so transcripts stay compact and do
+not store the prompts. In replay mode the same calls are answered from the
+transcript without touching the network or sleeping. A key that was recorded
+several times is replayed in the recorded order (the last response repeats
+once they run out), and a key that was never recorded counts as a miss and is
+answered like a failed request. Responses served by the prompt cache never
+reach these functions, so replay with the same prompt cache settings that were
+used when recording. The embedding cache is looked up inside the embedding
+functions, so every embedding is recorded whether or not it was cached, and
+replay answers from the transcript without consulting the embedding cache.
+
+Set `LLM_TRANSCRIPT=record` or `LLM_TRANSCRIPT=replay`, and optionally
+`LLM_TRANSCRIPT_PATH` (default ~/.cache/generative_agents/llm_transcript.jsonl).
+"""
+
+from __future__ import annotations
+
+import base64
+import functools
+import hashlib
+import json
+import logging
+import os
+import threading
+from array import array
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional
+
+MODES = ("record", "replay")
+
+
+class TranscriptMiss(KeyError):
+    """Raised in replay mode for an embedding that was never recorded."""
+
+
+def transcript_key(kind: str, *parts: Any) -> str:
+    payload = json.dumps([kind, *parts], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def resolve_transcript_path(env: Optional[Dict[str, str]] = None) -> str:
+    env = env or os.environ
+    cache_dir = env.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    path = os.path.join(cache_dir, "generative_agents")
+    os.makedirs(path, exist_ok=True)
+    return os.path.join(path, "llm_transcript.jsonl")
+
+
+def _encode_vector(vector: List[float]) -> str:
+    return base64.b64encode(array("f", vector).tobytes()).decode("ascii")
+
+
+def _decode_vector(data: str) -> List[float]:
+    vector = array("f")
+    vector.frombytes(base64.b64decode(data))
+    return vector.tolist()
+
+
+class LLMTranscript:
+    def __init__(self, path: str, mode: str):
+        if mode not in MODES:
+            raise ValueError(
+                f"unknown transcript mode {mode!r}, expected one of {MODES}"
+            )
+        self.path = path
+        self.mode = mode
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # key -> recorded entries, and key -> index of the next one to replay
+        self._entries: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._cursor: Dict[str, int] = defaultdict(int)
+        self._file = None
+
+        if mode == "replay":
+            with open(path) as infile:
+                for line in infile:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries[entry["key"]].append(entry)
+        else:
+            parent = os.path.dirname(os.path.abspath(path))
+            os.makedirs(parent, exist_ok=True)
+            self._file = open(path, "a")
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def record(self, kind: str, key: str, response: Any) -> None:
+        entry = {"kind": kind, "key": key}
+        if kind.endswith("embedding"):
+            entry["vector"] = _encode_vector(response)
+        else:
+            entry["response"] = response
+        with self._lock:
+            self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._file.flush()
+            self.recorded += 1
+
+    def replay(self, key: str) -> Any:
+        """Returns the next recorded response for `key`, or raises TranscriptMiss."""
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                self.misses += 1
+                raise TranscriptMiss(key)
+            index = min(self._cursor[key], len(entries) - 1)
+            self._cursor[key] += 1
+            self.replayed += 1
+        entry = entries[index]
+        if "vector" in entry:
+            return _decode_vector(entry["vector"])
+        return entry["response"]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "path": self.path,
+                "recorded": self.recorded,
+                "replayed": self.replayed,
+                "misses": self.misses,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+_transcript: Optional[LLMTranscript] = None
+_transcript_lock = threading.Lock()
+
+
+def get_llm_transcript(env: Optional[Dict[str, str]] = None) -> Optional[LLMTranscript]:
+    """Return the process-wide transcript, or None when LLM_TRANSCRIPT is unset."""
+    global _transcript
+    env = env or os.environ
+    mode = env.get("LLM_TRANSCRIPT", "").lower()
+    if not mode:
+        return None
+
+    with _transcript_lock:
+        path = env.get("LLM_TRANSCRIPT_PATH") or resolve_transcript_path(env)
+        if _transcript is None or _transcript.path != path or _transcript.mode != mode:
+            if _transcript is not None:
+                _transcript.close()
+            _transcript = LLMTranscript(path, mode)
+        return _transcript
+
+
+def transcribed(kind: str, key_func: Callable[..., tuple], on_miss: Callable[..., Any]):
+    """Decorator that records or replays a request function's responses.
+
+    key_func maps the call's arguments to the parts of its transcript key, and
+    on_miss gives the result for a replay miss (e.g. the function's usual
+    error string, or raising TranscriptMiss).
+    """
+
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            transcript = get_llm_transcript()
+            if transcript is None:
+                return func(*args, **kwargs)
+
+            key = transcript_key(kind, *key_func(*args, **kwargs))
+            if transcript.replaying:
+                try:
+                    return transcript.replay(key)
+                except TranscriptMiss:
+                    logging.warning(f"no recorded {kind} response for {key[:12]}")
+                    return on_miss(key)
+
+            response = func(*args, **kwargs)
+            transcript.record(kind, key, response)
+            return response
+
+        return wrapper
+
+    return decorate
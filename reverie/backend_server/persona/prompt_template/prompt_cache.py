@@ -0,0 +1,255 @@
+"""Persistent prompt/response cache for the safe_generate_response functions.
+
+Responses are keyed on a SHA-256 digest of (backend, model, rendered prompt,
+gpt_param) and stored in a SQLite database, so a prompt that recurs across
+steps, personas and forks (e.g. the pronunciatio of "sleeping", or the
+poignancy of "bed is idle") only reaches the model once.
+
+Only deterministic calls are cached: prompts sent with `temperature` 0, or
+rendered from a whitelisted template (the ChatGPT-style calls do not pass a
+temperature, so they are only cached when whitelisted). We store the raw model
+response and re-run the caller's validation and clean up on a hit, so a
+response that no longer validates is dropped rather than returned.
+
+The cache is opt-in. Set `PROMPT_CACHE_PATH` to a database file, or set
+`PROMPT_CACHE=1` to use the default path next to the embedding cache.
+`PROMPT_CACHE_MAX_MB` (default 256) bounds the database size, evicting the
+least recently used rows, and `PROMPT_CACHE_TTL_HOURS` (default 0, never)
+expires old rows. `PROMPT_CACHE_TEMPLATES` is a comma separated list of
+template paths (or path suffixes) to cache regardless of temperature; it
+defaults to `DEFAULT_CACHEABLE_TEMPLATES`.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional
+
+_TRUTHY = ("1", "true", "yes", "on")
+
+# Short, near-deterministic ChatGPT prompts whose answers depend only on the
+# rendered prompt.
+DEFAULT_CACHEABLE_TEMPLATES = (
+    "v3_ChatGPT/generate_pronunciatio_v1.txt",
+    "v3_ChatGPT/generate_obj_event_v1.txt",
+    "v3_ChatGPT/poignancy_event_v1.txt",
+    "v3_ChatGPT/poignancy_event_batch_v1.txt",
+    "v3_ChatGPT/poignancy_thought_v1.txt",
+    "v3_ChatGPT/poignancy_chat_v1.txt",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    template TEXT,
+    response TEXT NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL
+)
+"""
+
+
+def prompt_cache_key(
+    backend: str, model: str, prompt: str, gpt_param: Optional[Dict[str, Any]] = None
+) -> str:
+    payload = json.dumps(
+        [backend, model, prompt, gpt_param], sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def resolve_prompt_cache_path(env: Optional[Dict[str, str]] = None) -> str:
+    env = env or os.environ
+    cache_dir = env.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    path = os.path.join(cache_dir, "generative_agents")
+    os.makedirs(path, exist_ok=True)
+    return os.path.join(path, "prompts.sqlite3")
+
+
+class PromptCache:
+    """SQLite-backed response store with TTL and LRU eviction."""
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 256 * 1024 * 1024,
+        ttl_seconds: Optional[float] = None,
+        templates: Iterable[str] = DEFAULT_CACHEABLE_TEMPLATES,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.templates = tuple(templates)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.rejections = 0
+        # template -> {"hits": int, "misses": int}
+        self.template_stats: Dict[str, Dict[str, int]] = dict()
+        self._lock = threading.Lock()
+
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+        row = self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(response)), 0) FROM responses"
+        ).fetchone()
+        self._total_bytes = row[0]
+
+    def is_cacheable(
+        self, template: Optional[str], gpt_param: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        if gpt_param is not None and gpt_param.get("temperature") == 0:
+            return True
+        if not template:
+            return False
+        template = template.replace(os.sep, "/")
+        return any(template.endswith(entry) for entry in self.templates)
+
+    def get(self, key: str, template: Optional[str] = None) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            now = time.time()
+            expired = self.ttl_seconds and row and now - row[1] > self.ttl_seconds
+            if expired:
+                self._delete(key, row[0])
+                self.expirations += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                self._count(template, "misses")
+                return None
+
+            self._conn.execute(
+                "UPDATE responses SET last_used = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+            self._count(template, "hits")
+            return row[0]
+
+    def put(self, key: str, template: Optional[str], response: str) -> None:
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute(
+                "SELECT LENGTH(response) FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses "
+                "(key, template, response, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, template, response, now, now),
+            )
+            self._total_bytes += len(response) - (old[0] if old else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def discard(self, key: str) -> None:
+        """Drop a cached response that the caller could not use."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                self._delete(key, row[0])
+                self.rejections += 1
+                self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._conn.execute(
+                "SELECT COUNT(*) FROM responses"
+            ).fetchone()[0]
+            total = self.hits + self.misses
+            templates = dict()
+            for template, counts in sorted(self.template_stats.items()):
+                template_total = counts["hits"] + counts["misses"]
+                hit_rate = counts["hits"] / template_total
+                templates[template] = dict(counts, hit_rate=hit_rate)
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "rejections": self.rejections,
+                "entries": entries,
+                "bytes": self._total_bytes,
+                "templates": templates,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _count(self, template: Optional[str], field: str) -> None:
+        counts = self.template_stats.setdefault(
+            template or "<untemplated>", {"hits": 0, "misses": 0}
+        )
+        counts[field] += 1
+
+    def _delete(self, key: str, response: str) -> None:
+        self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+        self._total_bytes -= len(response)
+
+    def _evict(self) -> None:
+        # Trim to 90% of the budget so we do not evict on every insert.
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute(
+            "SELECT key, LENGTH(response) FROM responses ORDER BY last_used ASC"
+        )
+        doomed = []
+        for key, size in rows:
+            if self._total_bytes <= target:
+                break
+            doomed.append((key,))
+            self._total_bytes -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+        self.evictions += len(doomed)
+
+
+_cache: Optional[PromptCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_prompt_cache(env: Optional[Dict[str, str]] = None) -> Optional[PromptCache]:
+    """Return the process-wide cache, or None when caching is not enabled."""
+    global _cache
+    env = env or os.environ
+    path = env.get("PROMPT_CACHE_PATH")
+    if not path and env.get("PROMPT_CACHE", "").lower() not in _TRUTHY:
+        return None
+
+    with _cache_lock:
+        path = path or resolve_prompt_cache_path(env)
+        if _cache is None or _cache.path != path:
+            max_mb = float(env.get("PROMPT_CACHE_MAX_MB", "256"))
+            ttl_hours = float(env.get("PROMPT_CACHE_TTL_HOURS", "0"))
+            templates = DEFAULT_CACHEABLE_TEMPLATES
+            if "PROMPT_CACHE_TEMPLATES" in env:
+                templates = [
+                    t.strip()
+                    for t in env["PROMPT_CACHE_TEMPLATES"].split(",")
+                    if t.strip()
+                ]
+            _cache = PromptCache(
+                path,
+                max_bytes=int(max_mb * 1024 * 1024),
+                ttl_seconds=(ttl_hours * 3600) or None,
+                templates=templates,
+            )
+        return _cache
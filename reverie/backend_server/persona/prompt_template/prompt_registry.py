@@ -0,0 +1,127 @@
+"""Pre-parsed prompt templates for generate_prompt.
+
+A template file is read once and compiled into a list of literal segments and
+`!<INPUT n>!` placeholder indices, taken from the part after the
+`<commentblockmarker>###</commentblockmarker>` line. Rendering is then a
+single join over the segments instead of reading the file and running one
+`str.replace` per input on every call.
+
+The first use compiles every template shipped next to this module (v1, v2,
+v3_ChatGPT, safety); templates elsewhere are compiled the first time they are
+rendered. Rendering matches the old generate_prompt: a placeholder without a
+matching input is left as is, extra inputs are ignored, and the result is
+stripped. Passing fewer inputs than a template uses is logged once per
+template.
+
+Set `PROMPT_TEMPLATE_RELOAD=1` while editing templates to pick up changes to
+the files without restarting.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Sequence, Union
+
+_TRUTHY = ("1", "true", "yes", "on")
+
+COMMENT_BLOCK_MARKER = "<commentblockmarker>###</commentblockmarker>"
+_PLACEHOLDER = re.compile(r"!<INPUT (\d+)>!")
+TEMPLATE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class PromptTemplate:
+    """A template body split into literal segments and input indices."""
+
+    def __init__(self, path: str, text: str, mtime_ns: int = 0):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        if COMMENT_BLOCK_MARKER in text:
+            text = text.split(COMMENT_BLOCK_MARKER)[1]
+        pieces = _PLACEHOLDER.split(text)
+        # <segments> alternates literal text (even positions) and input
+        # indices (odd positions), e.g. ["Hi ", 0, ", how is ", 1, "?"]
+        self.segments: List[Union[str, int]] = [
+            int(piece) if count % 2 else piece for count, piece in enumerate(pieces)
+        ]
+        self.input_count = max(self.segments[1::2], default=-1) + 1
+
+    def render(self, inputs: Sequence[str]) -> str:
+        parts = self.segments.copy()
+        n = len(inputs)
+        for count in range(1, len(parts), 2):
+            index = parts[count]
+            parts[count] = inputs[index] if index < n else f"!<INPUT {index}>!"
+        return "".join(parts).strip()
+
+
+class PromptRegistry:
+    def __init__(self, reload: bool = False):
+        self.reload = reload
+        self._templates: Dict[str, PromptTemplate] = dict()
+        self._short_inputs: set = set()
+        self._lock = threading.Lock()
+
+    def load_directory(self, folder: str) -> int:
+        """Compiles every .txt template under `folder`; returns how many."""
+        count = 0
+        for root, _, files in os.walk(folder):
+            for name in sorted(files):
+                if name.endswith(".txt"):
+                    self.get(os.path.join(root, name))
+                    count += 1
+        return count
+
+    def get(self, path: str) -> PromptTemplate:
+        template = self._templates.get(path)
+        if template is not None and not self.reload:
+            return template
+        key = os.path.abspath(path)
+        template = self._templates.get(key)
+        if template is not None and not self.reload:
+            self._templates[path] = template
+            return template
+
+        mtime_ns = os.stat(key).st_mtime_ns
+        if template is not None and template.mtime_ns == mtime_ns:
+            return template
+        with open(key, "r") as infile:
+            template = PromptTemplate(path, infile.read(), mtime_ns)
+        with self._lock:
+            self._templates[key] = template
+            if path != key:
+                self._templates[path] = template
+        return template
+
+    def render(self, path: str, inputs: Sequence[str]) -> str:
+        template = self.get(path)
+        short = len(inputs) < template.input_count
+        if short and template.path not in self._short_inputs:
+            self._short_inputs.add(template.path)
+            logging.warning(
+                f"{template.path} uses {template.input_count} inputs "
+                f"but got {len(inputs)}"
+            )
+        return template.render(inputs)
+
+    def __len__(self) -> int:
+        return len(set(map(id, self._templates.values())))
+
+
+_registry: Optional[PromptRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_prompt_registry(env: Optional[Dict[str, str]] = None) -> PromptRegistry:
+    """Return the process-wide registry, compiling the templates on first use."""
+    global _registry
+    env = env or os.environ
+    reload = env.get("PROMPT_TEMPLATE_RELOAD", "").lower() in _TRUTHY
+    with _registry_lock:
+        if _registry is None:
+            _registry = PromptRegistry(reload=reload)
+            _registry.load_directory(TEMPLATE_DIR)
+        _registry.reload = reload
+        return _registry
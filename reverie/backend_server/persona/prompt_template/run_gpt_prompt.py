@@ -27,6 +27,7 @@ from persona.prompt_template.print_prompt import print_run_prompts
 import random
 import string
 import json
+import os
 
 # Ensure a module-level 'debug' symbol exists (helps static analysis and avoids
 # NameError when code references 'debug' through star imports in some setups).
@@ -1182,6 +1183,183 @@ def run_gpt_prompt_act_obj_event_triple(
     return output, [output, prompt, gpt_param, prompt_input, fail_safe]
 
 
+def run_gpt_prompt_resolve_action(
+    action_description, persona, maze, act_world, test_input=None, verbose=False
+):
+    """
+    Resolves a new action's address, emojis, event triple and object state
+    with one prompt, instead of the separate action_sector, action_arena,
+    action_game_object, pronunciatio, event_triple, act_obj_desc and
+    act_obj_event_triple prompts.
+
+    The sectors, arenas and game objects offered to the model come from the
+    persona's spatial memory, and each field of the answer is checked on its
+    own. Only the fields that pass are returned, so the caller can fall back
+    to the separate prompts for the rest.
+
+    INPUT:
+      action_description: the description of the action (e.g., "sleeping")
+      persona: The Persona class instance
+      maze: The Maze class instance
+      act_world: the world the persona is in
+    OUTPUT:
+      a dict with any of the keys "sector", "arena", "game_object",
+      "pronunciatio", "event", "object_description", "object_pronunciatio"
+      and "object_event"
+    """
+
+    def accessible_places(persona, act_world):
+        # Mirrors the filtering of run_gpt_prompt_action_sector and
+        # run_gpt_prompt_action_arena: other people's houses and rooms are
+        # left out.
+        places = dict()
+        for sector, arenas in persona.s_mem.tree.get(act_world, dict()).items():
+            if not sector:
+                continue
+            if "'s house" in sector and persona.scratch.last_name not in sector:
+                continue
+            places[sector] = dict()
+            for arena, game_objects in arenas.items():
+                if not arena:
+                    continue
+                if "'s room" in arena and persona.scratch.last_name not in arena:
+                    continue
+                places[sector][arena] = [i for i in game_objects if i]
+        return places
+
+    def create_prompt_input(action_description, persona, maze, places, test_input=None):
+        curr_sector = maze.access_tile(persona.scratch.curr_tile)["sector"]
+        places_str = ""
+        for sector, arenas in places.items():
+            places_str += f"- {sector}\n"
+            for arena, game_objects in arenas.items():
+                places_str += f"  - {arena}: {', '.join(game_objects)}\n"
+
+        action_description_1 = action_description
+        action_description_2 = action_description
+        if "(" in action_description:
+            action_description_1 = action_description.split("(")[0].strip()
+            action_description_2 = action_description.split("(")[-1][:-1]
+
+        prompt_input = [
+            persona.scratch.get_str_name(),
+            persona.scratch.living_area.split(":")[1],
+            curr_sector,
+            persona.scratch.get_str_daily_plan_req(),
+            places_str,
+            persona.scratch.get_str_name(),
+            action_description_1,
+            action_description_2,
+        ]
+        return prompt_input
+
+    def __chat_func_clean_up(gpt_response, prompt=""):  ############
+        if isinstance(gpt_response, str):
+            gpt_response = json.loads(gpt_response)
+        return dict(gpt_response)
+
+    def __chat_func_validate(gpt_response, prompt=""):  ############
+        try:
+            __chat_func_clean_up(gpt_response, prompt)
+            return True
+        except:
+            return False
+
+    def get_fail_safe():
+        return dict()
+
+    def clean_text(value):
+        if not isinstance(value, str) or not value.strip():
+            return None
+        return value.strip()
+
+    def clean_pair(value):
+        if not isinstance(value, (list, tuple)) or len(value) != 2:
+            return None
+        if not all(isinstance(i, str) and i.strip() for i in value):
+            return None
+        return [i.strip() for i in value]
+
+    places = accessible_places(persona, act_world)
+    gpt_param = {
+        "engine": "text-davinci-002",
+        "max_tokens": 150,
+        "temperature": 0,
+        "top_p": 1,
+        "stream": False,
+        "frequency_penalty": 0,
+        "presence_penalty": 0,
+        "stop": None,
+    }
+    prompt_template = "persona/prompt_template/v3_ChatGPT/resolve_action_v1.txt"
+    prompt_input = create_prompt_input(action_description, persona, maze, places)
+    prompt = generate_prompt(prompt_input, prompt_template)
+    example_output = (
+        '{"sector": "Hobbs Cafe", "arena": "cafe", "game_object": "cafe customer seating", '
+        '"pronunciatio": "☕🍰", "event": ["eating", "breakfast"], '
+        '"object_description": "being used by a customer", '
+        '"object_pronunciatio": "🪑", "object_event": ["is", "being used"]}'
+    )
+    special_instruction = (
+        "The output should be ONE json object with exactly the fields listed above. "
+        "The sector, arena and game_object must be copied verbatim from the lists above."
+    )
+    fail_safe = get_fail_safe()
+    response = ChatGPT_safe_generate_response(
+        prompt,
+        example_output,
+        special_instruction,
+        3,
+        fail_safe,
+        __chat_func_validate,
+        __chat_func_clean_up,
+        True,
+    )
+    if response == False:
+        response = dict()
+
+    # Each field is only kept if it fits the fields it depends on.
+    output = dict()
+    sector = response.get("sector")
+    if sector in places:
+        output["sector"] = sector
+        arena = response.get("arena")
+        if arena in places[sector]:
+            output["arena"] = arena
+            game_object = response.get("game_object")
+            if game_object in places[sector][arena]:
+                output["game_object"] = game_object
+
+    pronunciatio = clean_text(response.get("pronunciatio"))
+    if pronunciatio:
+        output["pronunciatio"] = pronunciatio[:3]
+    event = clean_pair(response.get("event"))
+    if event:
+        output["event"] = (persona.name, event[0], event[1])
+
+    # The object's state only makes sense for the object the model chose.
+    if "game_object" in output:
+        game_object = output["game_object"]
+        object_description = clean_text(response.get("object_description"))
+        if object_description:
+            if object_description[-1] == ".":
+                object_description = object_description[:-1]
+            output["object_description"] = object_description
+            object_pronunciatio = clean_text(response.get("object_pronunciatio"))
+            if object_pronunciatio:
+                output["object_pronunciatio"] = object_pronunciatio[:3]
+        object_event = clean_pair(response.get("object_event"))
+        if object_event:
+            output["object_event"] = (game_object, object_event[0], object_event[1])
+
+    if debug or verbose:
+        print_run_prompts(
+            prompt_template, persona, gpt_param, prompt_input, prompt, output
+        )
+
+    return output, [output, prompt, gpt_param, prompt_input, fail_safe]
+
+
 def run_gpt_prompt_new_decomp_schedule(
     persona,
     main_act_dur,
@@ -2110,6 +2288,107 @@ def run_gpt_prompt_event_poignancy(
     # return output, [output, prompt, gpt_param, prompt_input, fail_safe]
 
 
+def run_gpt_prompt_event_poignancy_batch(
+    persona, event_descriptions, test_input=None, verbose=False
+):
+    """
+    Rates the poignancy of several events for the persona. With
+    POIGNANCY_BATCH=1 they are rated with one prompt; otherwise (the default)
+    each event is rated on its own with run_gpt_prompt_event_poignancy.
+
+    In batch mode the model answers with a list of integers, one per event.
+    Items that are missing or out of range, and every item if the whole
+    response fails, are rated one by one; so is a single event.
+
+    INPUT:
+      persona: The Persona class instance
+      event_descriptions: a list of event descriptions
+    OUTPUT:
+      a list of integer scores in the order of event_descriptions
+    """
+
+    def create_prompt_input(persona, event_descriptions, test_input=None):
+        numbered = "".join(
+            f"{count + 1}) {desc}\n" for count, desc in enumerate(event_descriptions)
+        )
+        prompt_input = [
+            persona.scratch.name,
+            persona.scratch.get_str_iss(),
+            persona.scratch.name,
+            numbered,
+            str(len(event_descriptions)),
+        ]
+        return prompt_input
+
+    def __chat_func_clean_up(gpt_response, prompt=""):  ############
+        if isinstance(gpt_response, str):
+            gpt_response = json.loads(gpt_response)
+        ret = []
+        for score in gpt_response:
+            try:
+                score = int(score)
+            except (TypeError, ValueError):
+                score = None
+            if score is not None and not 1 <= score <= 10:
+                score = None
+            ret += [score]
+        return ret
+
+    def __chat_func_validate(gpt_response, prompt=""):  ############
+        try:
+            return len(__chat_func_clean_up(gpt_response)) == len(event_descriptions)
+        except:
+            return False
+
+    def get_fail_safe():
+        return [None] * len(event_descriptions)
+
+    output = get_fail_safe()
+    prompt = prompt_input = None
+    gpt_param = {
+        "engine": "text-davinci-002",
+        "max_tokens": 15,
+        "temperature": 0,
+        "top_p": 1,
+        "stream": False,
+        "frequency_penalty": 0,
+        "presence_penalty": 0,
+        "stop": None,
+    }
+    if len(event_descriptions) > 1 and os.environ.get("POIGNANCY_BATCH", "0") == "1":
+        prompt_template = "persona/prompt_template/v3_ChatGPT/poignancy_event_batch_v1.txt"
+        prompt_input = create_prompt_input(persona, event_descriptions)
+        prompt = generate_prompt(prompt_input, prompt_template)
+        example_output = "[5, 2, 8]"
+        special_instruction = (
+            f"The output should ONLY contain a list of {len(event_descriptions)} "
+            "integer values on the scale of 1 to 10, one for each event, in order."
+        )
+        batch_output = ChatGPT_safe_generate_response(
+            prompt,
+            example_output,
+            special_instruction,
+            3,
+            get_fail_safe(),
+            __chat_func_validate,
+            __chat_func_clean_up,
+            True,
+        )
+        if batch_output != False:
+            output = batch_output
+
+    for count, score in enumerate(output):
+        if score is None:
+            output[count] = run_gpt_prompt_event_poignancy(persona, event_descriptions[count])[0]
+
+    if debug or verbose:
+        print_run_prompts(
+            "poignancy_event_batch_v1.txt", persona, gpt_param, prompt_input, prompt, output
+        )
+
+    return output, [output, prompt, gpt_param, prompt_input, get_fail_safe()]
+
+
 def run_gpt_prompt_thought_poignancy(
     persona, event_description, test_input=None, verbose=False
 ):
@@ -35,7 +35,7 @@ def test_copilot_uses_default_model_when_explicit_url(monkeypatch):
 
     monkeypatch.setenv("COPILOT_API_URL", "http://example/api")
     monkeypatch.setenv("COPILOT_DEFAULT_MODEL", "grok-code-fast-1")
-    monkeypatch.setattr(gs.requests, "post", fake_post)
+    monkeypatch.setattr(gs.get_llm_client().session, "post", fake_post)
 
     out = gs.Copilot_request("hello")
     assert captured['payload']['model'] == "grok-code-fast-1"
@@ -57,7 +57,7 @@ def test_copilot_uses_default_model_when_token_exchange(monkeypatch):
     monkeypatch.delenv("COPILOT_API_URL", raising=False)
     monkeypatch.setenv("COPILOT_DEFAULT_MODEL", "grok-code-fast-1")
     monkeypatch.setattr(gs, "resolve_copilot_api_token", fake_resolve)
-    monkeypatch.setattr(gs.requests, "post", fake_post)
+    monkeypatch.setattr(gs.get_llm_client().session, "post", fake_post)
 
     out = gs.Copilot_request("hello")
     assert captured['payload']['model'] == "grok-code-fast-1"
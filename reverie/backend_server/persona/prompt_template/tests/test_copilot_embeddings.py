@@ -34,7 +34,7 @@ def test_copilot_embeddings_via_custom_url(monkeypatch):
 
     monkeypatch.setenv("COPILOT_EMBEDDINGS_URL", "http://emb.test/v1/embeddings")
     monkeypatch.setattr(gs, "resolve_copilot_api_token", fake_resolve)
-    monkeypatch.setattr(gs.requests, "post", fake_post)
+    monkeypatch.setattr(gs.get_llm_client().session, "post", fake_post)
 
     emb = gs.Copilot_get_embedding("hello")
     assert emb == [1, 2, 3]
@@ -49,7 +49,7 @@ def test_copilot_embeddings_fallback_to_openai(monkeypatch):
         raise Exception("nope")
 
     monkeypatch.setattr(gs, "resolve_copilot_api_token", fake_resolve)
-    monkeypatch.setattr(gs.requests, "post", fake_post_fail)
+    monkeypatch.setattr(gs.get_llm_client().session, "post", fake_post_fail)
 
     class FakeEmb:
         @staticmethod
@@ -0,0 +1,118 @@
+# flake8: noqa: E402
+import sys
+import pathlib
+ROOT = str(pathlib.Path(__file__).resolve().parents[3])
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import sqlite3
+
+import persona.prompt_template.gpt_structure as gs
+from persona.prompt_template.embedding_cache import EmbeddingCache, get_embedding_cache
+
+
+def test_cache_roundtrip_is_model_keyed(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "emb.sqlite3"))
+    assert cache.get("m1", "bed is idle") is None
+    cache.put("m1", "bed is idle", [0.5, 0.25, 1.0])
+    assert cache.get("m1", "bed is idle") == [0.5, 0.25, 1.0]
+    assert cache.get("m2", "bed is idle") is None
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+    assert stats["entries"] == 1
+
+
+def test_cache_persists_across_instances(tmp_path):
+    path = str(tmp_path / "emb.sqlite3")
+    EmbeddingCache(path).put("m", "hello", [1.0, 2.0])
+    assert EmbeddingCache(path).get("m", "hello") == [1.0, 2.0]
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    # each 2-float vector is 8 bytes; allow room for two of them
+    cache = EmbeddingCache(str(tmp_path / "emb.sqlite3"), max_bytes=16, lru_size=0)
+    cache.put("m", "a", [1.0, 1.0])
+    cache.put("m", "b", [2.0, 2.0])
+    cache.put("m", "c", [3.0, 3.0])
+    assert cache.get("m", "a") is None
+    assert cache.get("m", "c") == [3.0, 3.0]
+    assert cache.stats()["evictions"] >= 1
+
+
+def test_cache_disabled_by_default():
+    assert get_embedding_cache(env={"HOME": "/tmp"}) is None
+
+
+def test_get_embedding_uses_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("EMBEDDING_CACHE_PATH", str(tmp_path / "emb.sqlite3"))
+    calls = {"n": 0}
+
+    class FakeEmb:
+        @staticmethod
+        def create(input, model):
+            calls["n"] += 1
+            return {"data": [{"embedding": [0.5, 0.5]}]}
+
+    monkeypatch.setattr(gs.openai, "Embedding", FakeEmb)
+
+    assert gs.get_embedding("bed is idle") == [0.5, 0.5]
+    assert gs.get_embedding("bed is idle") == [0.5, 0.5]
+    assert calls["n"] == 1
+
+
+def test_get_embeddings_batches_dedupes_and_falls_back(tmp_path, monkeypatch):
+    monkeypatch.setenv("EMBEDDING_CACHE_PATH", str(tmp_path / "emb.sqlite3"))
+    monkeypatch.delenv("LLM_TRANSCRIPT", raising=False)
+    requests = []
+
+    class FakeEmb:
+        @staticmethod
+        def create(input, model):
+            requests.append(list(input))
+            if "broken" in input and len(input) > 1:
+                raise RuntimeError("bad batch")
+            # answer out of order; the index says which input each one is for
+            data = [{"index": i, "embedding": [float(len(text))]} for i, text in enumerate(input)]
+            return {"data": data[::-1]}
+
+    monkeypatch.setattr(gs.openai, "Embedding", FakeEmb)
+    gs.get_embedding("bed is idle")
+    requests.clear()
+
+    texts = ["a", "bb", "a", "bed\nis idle", "ccc"]
+    assert gs.get_embeddings(texts, batch_size=2) == [[1.0], [2.0], [1.0], [11.0], [3.0]]
+    assert requests == [["a", "bb"], ["ccc"]]
+
+    requests.clear()
+    assert gs.get_embeddings(["broken", "dddd"]) == [[6.0], [4.0]]
+    assert requests == [["broken", "dddd"], ["broken"], ["dddd"]]
+    assert gs.get_embeddings([]) == []
+
+
+def test_hits_defer_last_used_writes(tmp_path):
+    path = str(tmp_path / "emb.sqlite3")
+    EmbeddingCache(path).put("m", "a", [1.0])
+    reader = sqlite3.connect(path)
+    before = reader.execute("SELECT last_used FROM embeddings").fetchone()[0]
+
+    cache = EmbeddingCache(path)
+    assert cache.get("m", "a") == [1.0]
+    assert reader.execute("SELECT last_used FROM embeddings").fetchone()[0] == before
+    cache.close()
+    assert reader.execute("SELECT last_used FROM embeddings").fetchone()[0] > before
+
+
+def test_misses_are_rounded_like_hits(tmp_path, monkeypatch):
+    monkeypatch.setenv("EMBEDDING_CACHE_PATH", str(tmp_path / "emb.sqlite3"))
+    monkeypatch.delenv("LLM_TRANSCRIPT", raising=False)
+
+    class FakeEmb:
+        @staticmethod
+        def create(input, model):
+            return {"data": [{"embedding": [0.1, 0.2]}]}
+
+    monkeypatch.setattr(gs.openai, "Embedding", FakeEmb)
+    cold = gs.get_embedding("bed is idle")
+    assert cold != [0.1, 0.2]
+    assert gs.get_embedding("bed is idle") == cold
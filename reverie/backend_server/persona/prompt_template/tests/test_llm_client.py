@@ -0,0 +1,129 @@
+# flake8: noqa: E402
+import os
+import sys
+
+# Ensure reverie/backend_server is importable for tests
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+import persona.prompt_template.gpt_structure as gs
+from persona.prompt_template.llm_client import LLMClient, client_settings_from_env
+
+
+def test_settings_from_env():
+    settings = client_settings_from_env(
+        {"LLM_MAX_CONCURRENCY": "2", "LLM_TIMEOUT_OLLAMA": "45", "LLM_BACKOFF_MAX": "5"}
+    )
+    client = LLMClient(**settings)
+    assert client.max_concurrency == 2
+    assert client.timeout("ollama", 20) == 45.0
+    assert client.timeout("copilot", 20) == 20
+    assert client.backoff_max == 5.0
+
+
+def test_backoff_is_jittered_and_capped():
+    client = LLMClient(backoff_base=1, backoff_max=3)
+    delays = [client.backoff_delay(attempt) for attempt in range(6) for _ in range(20)]
+    assert all(0 <= d <= 3 for d in delays)
+    assert len(set(delays)) > 1
+
+
+def test_concurrency_limit():
+    client = LLMClient(max_concurrency=2)
+    lock = threading.Lock()
+    state = {"now": 0, "peak": 0}
+
+    def work():
+        with client.slot():
+            with lock:
+                state["now"] += 1
+                state["peak"] = max(state["peak"], state["now"])
+            time.sleep(0.02)
+            with lock:
+                state["now"] -= 1
+
+    threads = [threading.Thread(target=work) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert state["peak"] == 2
+
+
+def test_async_backoff_retries_without_blocking_loop():
+    client = LLMClient(backoff_base=0.01)
+    calls = {"n": 0}
+
+    def flaky():
+        calls["n"] += 1
+        if calls["n"] < 3:
+            raise RuntimeError("busy")
+        return "ok"
+
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0)
+
+        task = asyncio.ensure_future(ticker())
+        out = await client.acall_with_backoff(flaky, repeat=3)
+        task.cancel()
+        return out, ticks
+
+    out, ticks = asyncio.run(main())
+    assert out == "ok"
+    assert calls["n"] == 3
+    assert ticks > 0
+
+    def always_fails():
+        raise RuntimeError("down")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(client.acall_with_backoff(always_fails, repeat=2))
+
+
+def test_chatgpt_request_async_gathers(monkeypatch):
+    monkeypatch.setattr(gs, "ChatGPT_request", lambda prompt, timeout=None, repeat=3: prompt.upper())
+
+    async def main():
+        return await asyncio.gather(gs.ChatGPT_request_async("a"), gs.run_prompt_async(str.lower, "B"))
+
+    assert asyncio.run(main()) == ["A", "b"]
+
+
+def test_requests_back_off_by_llm_backoff_base(monkeypatch):
+    import persona.prompt_template.llm_client as llm_client
+
+    monkeypatch.setenv("LLM_BACKOFF_BASE", "0.25")
+    monkeypatch.delenv("LLM_BACKEND", raising=False)
+    monkeypatch.delenv("LLM_TRANSCRIPT", raising=False)
+    llm_client.reset_llm_client()
+    sleeps = []
+    monkeypatch.setattr(llm_client.time, "sleep", sleeps.append)
+    # take the top of the jitter range, i.e. base * 2 ** attempt
+    monkeypatch.setattr(llm_client.random, "uniform", lambda low, high: high)
+    answers = iter([RuntimeError("rate limited"), RuntimeError("rate limited"), "ok"])
+
+    def flaky_create(**kw):
+        answer = next(answers)
+        if isinstance(answer, Exception):
+            raise answer
+        return {"choices": [{"message": {"content": answer}}]}
+
+    monkeypatch.setattr(gs.openai.ChatCompletion, "create", flaky_create)
+    try:
+        assert gs.ChatGPT_request("hello") == "ok"
+    finally:
+        llm_client.reset_llm_client()
+    assert sleeps == [0.25, 0.5]
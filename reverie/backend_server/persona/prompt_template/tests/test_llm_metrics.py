@@ -0,0 +1,96 @@
+# flake8: noqa: E402
+import sys
+import pathlib
+ROOT = str(pathlib.Path(__file__).resolve().parents[3])
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import csv
+import json
+
+import persona.prompt_template.gpt_structure as gs
+from persona.prompt_template.llm_metrics import LLMMetrics, get_llm_metrics
+
+
+GPT_PARAM = {"engine": "text-davinci-002", "max_tokens": 15, "temperature": 0.5,
+             "top_p": 1, "stream": False, "frequency_penalty": 0,
+             "presence_penalty": 0, "stop": None}
+
+
+def _row(template, backend):
+    for row in get_llm_metrics().rows():
+        if row["template"] == template and row["backend"] == backend:
+            return row
+
+
+def test_chat_calls_count_retries_tokens_and_fail_safes(monkeypatch):
+    monkeypatch.delenv("LLM_BACKEND", raising=False)
+    monkeypatch.delenv("PROMPT_CACHE", raising=False)
+    monkeypatch.delenv("PROMPT_CACHE_PATH", raising=False)
+    monkeypatch.delenv("LLM_TRANSCRIPT", raising=False)
+    get_llm_metrics().reset()
+    responses = iter(["not json", '{"output": "7"}', "ChatGPT ERROR", "ChatGPT ERROR"])
+
+    def fake_create(**kw):
+        content = next(responses)
+        usage = {"prompt_tokens": 40, "completion_tokens": 3}
+        return {"choices": [{"message": {"content": content}}], "usage": usage}
+
+    monkeypatch.setattr(gs.openai.ChatCompletion, "create", fake_create)
+    prompt = gs.RenderedPrompt("rate it", "persona/prompt_template/v3_ChatGPT/poignancy_event_v1.txt")
+    validate = lambda response, prompt="": response.isdigit()
+    clean_up = lambda response, prompt="": int(response)
+    assert gs.ChatGPT_safe_generate_response(prompt, "5", "", 2, 4, validate, clean_up) == 7
+    assert gs.ChatGPT_safe_generate_response(prompt, "5", "", 2, 4, validate, clean_up) is False
+
+    row = _row("v3_ChatGPT/poignancy_event_v1.txt", "openai:gpt-3.5-turbo")
+    assert row["calls"] == 2
+    assert row["requests"] == 4
+    assert row["retries"] == 2
+    assert row["validation_failures"] == 3
+    assert row["errors"] == 2
+    assert row["fail_safes"] == 1
+    assert row["prompt_tokens"] == 160
+    assert row["completion_tokens"] == 12
+    assert row["estimated_requests"] == 0
+    assert sum(row["latency"]) == 2
+
+
+def test_legacy_calls_estimate_tokens_and_count_cache_hits(tmp_path, monkeypatch):
+    monkeypatch.setenv("PROMPT_CACHE_PATH", str(tmp_path / "p.sqlite3"))
+    get_llm_metrics().reset()
+    monkeypatch.setattr(gs, "GPT_request", lambda prompt, gpt_parameter: "sleeping")
+    prompt = gs.RenderedPrompt("x" * 40, "persona/prompt_template/v2/generate_event_triple_v1.txt")
+    valid = lambda response, prompt="": True
+    for _ in range(2):
+        gs.safe_generate_response(prompt, dict(GPT_PARAM, temperature=0), 5, "x", valid, lambda r, prompt="": r)
+
+    row = _row("v2/generate_event_triple_v1.txt", "openai:text-davinci-002")
+    assert (row["calls"], row["cache_hits"], row["requests"]) == (2, 1, 1)
+    assert (row["prompt_tokens"], row["completion_tokens"]) == (10, 2)
+    assert row["estimated_requests"] == 1
+    # cache hits are left out of the latency histogram
+    assert sum(row["latency"]) == 1
+
+
+def test_dump_json_and_csv(tmp_path):
+    metrics = LLMMetrics()
+    call = metrics.start("persona/prompt_template/v2/a.txt", "ollama:llama2")
+    call.request("prompt", "ChatGPT ERROR", False)
+    call.finish(fail_safe=True)
+    metrics.start(None, "ollama:llama2").cache_hit()
+
+    stats = json.loads(open(metrics.dump(str(tmp_path / "m.json"))).read())
+    assert stats["totals"]["calls"] == 2
+    assert [row["template"] for row in stats["templates"]] == ["v2/a.txt", "<untemplated>"]
+
+    with open(metrics.dump(str(tmp_path / "m.csv"))) as infile:
+        rows = list(csv.DictReader(infile))
+    assert rows[0]["fail_safes"] == "1"
+    assert rows[0]["errors"] == "1"
+    assert "gt_60s" in rows[0]
+    assert "v2/a.txt [ollama:llama2]: 1 calls" in metrics.summary()
+
+
+def test_metrics_can_be_turned_off():
+    assert get_llm_metrics(env={"LLM_METRICS": "0"}) is None
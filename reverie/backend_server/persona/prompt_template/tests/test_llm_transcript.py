@@ -0,0 +1,81 @@
+# flake8: noqa: E402
+import sys
+import pathlib
+ROOT = str(pathlib.Path(__file__).resolve().parents[3])
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import pytest
+
+import persona.prompt_template.gpt_structure as gs
+from persona.prompt_template.llm_transcript import TranscriptMiss, get_llm_transcript
+
+
+def test_record_then_replay_chat_and_embeddings(tmp_path, monkeypatch):
+    path = str(tmp_path / "t.jsonl")
+    monkeypatch.setenv("LLM_TRANSCRIPT", "record")
+    monkeypatch.setenv("LLM_TRANSCRIPT_PATH", path)
+    monkeypatch.delenv("LLM_BACKEND", raising=False)
+    monkeypatch.delenv("EMBEDDING_CACHE", raising=False)
+    monkeypatch.delenv("EMBEDDING_CACHE_PATH", raising=False)
+
+    answers = iter(["first", "second"])
+
+    def fake_create(**kw):
+        return {"choices": [{"message": {"content": next(answers)}}]}
+
+    class FakeEmb:
+        @staticmethod
+        def create(input, model):
+            return {"data": [{"embedding": [0.25, 0.5]}]}
+
+    monkeypatch.setattr(gs.openai.ChatCompletion, "create", fake_create)
+    monkeypatch.setattr(gs.openai, "Embedding", FakeEmb)
+    assert gs.ChatGPT_request("hello") == "first"
+    assert gs.ChatGPT_request("hello") == "second"
+    assert gs.get_embedding("bed\nis idle") == [0.25, 0.5]
+    assert get_llm_transcript().stats()["recorded"] == 3
+
+    # In replay mode nothing reaches the backends.
+    monkeypatch.setenv("LLM_TRANSCRIPT", "replay")
+
+    def no_network(**kw):
+        raise AssertionError("replay must not call the backend")
+
+    monkeypatch.setattr(gs.openai.ChatCompletion, "create", no_network)
+    monkeypatch.setattr(gs.openai, "Embedding", None)
+    assert gs.ChatGPT_request("hello") == "first"
+    assert gs.ChatGPT_request("hello") == "second"
+    # the last response repeats once the recorded ones run out
+    assert gs.ChatGPT_request("hello") == "second"
+    assert gs.get_embedding("bed is idle") == [0.25, 0.5]
+
+    assert gs.ChatGPT_request("never recorded") == "ChatGPT ERROR"
+    with pytest.raises(TranscriptMiss):
+        gs.get_embedding("never recorded")
+    stats = get_llm_transcript().stats()
+    assert stats["replayed"] == 4
+    assert stats["misses"] == 2
+
+
+def test_gpt_request_key_includes_parameters(tmp_path, monkeypatch):
+    path = str(tmp_path / "t.jsonl")
+    monkeypatch.setenv("LLM_TRANSCRIPT", "record")
+    monkeypatch.setenv("LLM_TRANSCRIPT_PATH", path)
+
+    class FakeCompletion:
+        @staticmethod
+        def create(**kw):
+            text = f"t={kw['temperature']}"
+            return type("R", (), {"choices": [type("C", (), {"text": text})()]})()
+
+    monkeypatch.setattr(gs.openai, "Completion", FakeCompletion)
+    param = {"engine": "e", "max_tokens": 5, "temperature": 0, "top_p": 1,
+             "stream": False, "frequency_penalty": 0, "presence_penalty": 0,
+             "stop": None}
+    gs.GPT_request("p", param)
+    gs.GPT_request("p", dict(param, temperature=1))
+
+    monkeypatch.setenv("LLM_TRANSCRIPT", "replay")
+    assert gs.GPT_request("p", dict(param, temperature=1)) == "t=1"
+    assert gs.GPT_request("p", param) == "t=0"
@@ -39,7 +39,7 @@ def test_ollama_request_retries_then_success(monkeypatch):
             raise requests.ConnectionError("connect")
         return DummyResp(json_body={"results": [{"content": "ollama-output"}]})
 
-    monkeypatch.setattr(requests, "post", fake_post)
+    monkeypatch.setattr(gs.get_llm_client().session, "post", fake_post)
     out = gs.Ollama_request("hello", model="foo", timeout=0.1, repeat=3)
     assert out == "ollama-output"
     assert calls["n"] == 2
@@ -52,10 +52,10 @@ def test_ollama_request_parsing_variants(monkeypatch):
     def fake_post_b(url, json, timeout):
         return DummyResp(json_body={"text": "outB"})
 
-    monkeypatch.setattr(requests, "post", fake_post_a)
+    monkeypatch.setattr(gs.get_llm_client().session, "post", fake_post_a)
     assert gs.Ollama_request("p1") == "outA"
 
-    monkeypatch.setattr(requests, "post", fake_post_b)
+    monkeypatch.setattr(gs.get_llm_client().session, "post", fake_post_b)
     assert gs.Ollama_request("p2") == "outB"
 
 
@@ -72,6 +72,6 @@ def test_copilot_request_with_url(monkeypatch):
     def fake_post(url, json, headers, timeout):
         return DummyResp(json_body={"result": "copilot-out"})
 
-    monkeypatch.setattr(requests, "post", fake_post)
+    monkeypatch.setattr(gs.get_llm_client().session, "post", fake_post)
     out = gs.Copilot_request("p")
     assert out == "copilot-out"
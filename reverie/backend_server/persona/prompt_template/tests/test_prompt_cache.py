@@ -0,0 +1,120 @@
+# flake8: noqa: E402
+import sys
+import pathlib
+ROOT = str(pathlib.Path(__file__).resolve().parents[3])
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import time
+
+import persona.prompt_template.gpt_structure as gs
+from persona.prompt_template.prompt_cache import PromptCache, get_prompt_cache, prompt_cache_key
+
+
+GPT_PARAM = {"engine": "text-davinci-002", "max_tokens": 15, "temperature": 0,
+             "top_p": 1, "stream": False, "frequency_penalty": 0,
+             "presence_penalty": 0, "stop": None}
+
+
+def _validate(response, prompt=""):
+    return bool(response.strip())
+
+
+def _clean_up(response, prompt=""):
+    return response.strip()
+
+
+def test_key_depends_on_backend_model_prompt_and_params():
+    base = prompt_cache_key("openai", "m", "p", GPT_PARAM)
+    assert base == prompt_cache_key("openai", "m", "p", dict(GPT_PARAM))
+    assert base != prompt_cache_key("ollama", "m", "p", GPT_PARAM)
+    assert base != prompt_cache_key("openai", "m2", "p", GPT_PARAM)
+    assert base != prompt_cache_key("openai", "m", "p2", GPT_PARAM)
+    assert base != prompt_cache_key("openai", "m", "p", dict(GPT_PARAM, max_tokens=16))
+
+
+def test_only_deterministic_or_whitelisted_prompts_are_cacheable(tmp_path):
+    cache = PromptCache(str(tmp_path / "p.sqlite3"), templates=["v3_ChatGPT/poignancy_event_v1.txt"])
+    assert cache.is_cacheable(None, GPT_PARAM)
+    assert not cache.is_cacheable(None, dict(GPT_PARAM, temperature=0.7))
+    assert not cache.is_cacheable("persona/prompt_template/v3_ChatGPT/agent_chat_v1.txt")
+    assert cache.is_cacheable("persona/prompt_template/v3_ChatGPT/poignancy_event_v1.txt")
+
+
+def test_ttl_and_lru_eviction(tmp_path):
+    cache = PromptCache(str(tmp_path / "p.sqlite3"), max_bytes=10, ttl_seconds=60)
+    cache.put("a", "t", "aaaa")
+    cache.put("b", "t", "bbbb")
+    cache.put("c", "t", "cccc")
+    assert cache.get("a", "t") is None
+    assert cache.get("c", "t") == "cccc"
+    assert cache.stats()["evictions"] >= 1
+
+    cache.ttl_seconds = 1e-9
+    time.sleep(0.01)
+    assert cache.get("c", "t") is None
+    stats = cache.stats()
+    assert stats["expirations"] == 1
+    assert stats["templates"]["t"]["hits"] == 1
+
+
+def test_cache_disabled_by_default():
+    assert get_prompt_cache(env={"HOME": "/tmp"}) is None
+
+
+def test_safe_generate_response_caches_temperature_zero(tmp_path, monkeypatch):
+    monkeypatch.setenv("PROMPT_CACHE_PATH", str(tmp_path / "p.sqlite3"))
+    calls = {"n": 0}
+
+    def fake_request(prompt, gpt_parameter):
+        calls["n"] += 1
+        return " sleeping "
+
+    monkeypatch.setattr(gs, "GPT_request", fake_request)
+    prompt = gs.RenderedPrompt("what is Jane doing?", "v2/generate_event_triple_v1.txt")
+    for _ in range(3):
+        out = gs.safe_generate_response(prompt, GPT_PARAM, 5, "x", _validate, _clean_up)
+        assert out == "sleeping"
+    assert calls["n"] == 1
+
+    # A non-zero temperature is never served from the cache.
+    warm = dict(GPT_PARAM, temperature=0.7)
+    gs.safe_generate_response(prompt, warm, 5, "x", _validate, _clean_up)
+    gs.safe_generate_response(prompt, warm, 5, "x", _validate, _clean_up)
+    assert calls["n"] == 3
+    assert get_prompt_cache().stats()["templates"]["v2/generate_event_triple_v1.txt"]["hits"] == 2
+
+
+def test_chatgpt_safe_generate_response_caches_whitelisted_templates(tmp_path, monkeypatch):
+    monkeypatch.setenv("PROMPT_CACHE_PATH", str(tmp_path / "p.sqlite3"))
+    monkeypatch.delenv("LLM_BACKEND", raising=False)
+    calls = {"n": 0}
+
+    def fake_chat_request(prompt, timeout=None, repeat=3):
+        calls["n"] += 1
+        return '{"output": "4"}'
+
+    monkeypatch.setattr(gs, "ChatGPT_request", fake_chat_request)
+    whitelisted = gs.RenderedPrompt("bed is idle", "persona/prompt_template/v3_ChatGPT/poignancy_event_v1.txt")
+    other = gs.RenderedPrompt("hi", "persona/prompt_template/v3_ChatGPT/agent_chat_v1.txt")
+    for prompt in (whitelisted, whitelisted, other, other):
+        assert gs.ChatGPT_safe_generate_response(prompt, "5", "", 3, "x", _validate, _clean_up) == "4"
+    assert calls["n"] == 3
+
+
+def test_cached_response_that_no_longer_validates_is_dropped(tmp_path, monkeypatch):
+    monkeypatch.setenv("PROMPT_CACHE_PATH", str(tmp_path / "p.sqlite3"))
+    monkeypatch.setattr(gs, "GPT_request", lambda prompt, gpt_parameter: "sleeping")
+    prompt = gs.generate_prompt("x", str(_write_template(tmp_path)))
+    assert gs.safe_generate_response(prompt, GPT_PARAM, 5, "x", _validate, _clean_up) == "sleeping"
+
+    monkeypatch.setattr(gs, "GPT_request", lambda prompt, gpt_parameter: "eating")
+    strict = lambda response, prompt="": response != "sleeping"
+    assert gs.safe_generate_response(prompt, GPT_PARAM, 5, "x", strict, _clean_up) == "eating"
+    assert get_prompt_cache().stats()["rejections"] == 1
+
+
+def _write_template(tmp_path):
+    path = tmp_path / "template.txt"
+    path.write_text("What is !<INPUT 0>! doing?")
+    return path
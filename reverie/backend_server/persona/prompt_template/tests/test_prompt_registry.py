@@ -0,0 +1,50 @@
+# flake8: noqa: E402
+import sys
+import pathlib
+ROOT = str(pathlib.Path(__file__).resolve().parents[3])
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import os
+
+import persona.prompt_template.gpt_structure as gs
+from persona.prompt_template.prompt_registry import PromptRegistry, get_prompt_registry
+
+
+def _write(path, text, mtime_ns):
+    path.write_text(text)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_render_matches_placeholder_semantics(tmp_path):
+    path = tmp_path / "t.txt"
+    _write(path, "!<INPUT 0>! header\n<commentblockmarker>###</commentblockmarker>\n"
+                 "!<INPUT 1>! met !<INPUT 0>! at !<INPUT 2>!.  \n", 1)
+    registry = PromptRegistry()
+    template = registry.get(str(path))
+    assert template.input_count == 3
+    assert registry.render(str(path), ["Jane", "Tom", "the cafe"]) == "Tom met Jane at the cafe."
+    # missing inputs keep their placeholder, extra inputs are ignored
+    assert registry.render(str(path), ["Jane", "Tom"]) == "Tom met Jane at !<INPUT 2>!."
+    assert registry.render(str(path), ["a", "b", "c", "d"]) == "b met a at c."
+
+
+def test_templates_are_read_once_unless_reloading(tmp_path):
+    path = tmp_path / "t.txt"
+    _write(path, "Hello !<INPUT 0>!", 1_000_000_000)
+    registry = PromptRegistry()
+    assert registry.render(str(path), ["Jane"]) == "Hello Jane"
+    _write(path, "Bye !<INPUT 0>!", 2_000_000_000)
+    assert registry.render(str(path), ["Jane"]) == "Hello Jane"
+    registry.reload = True
+    assert registry.render(str(path), ["Jane"]) == "Bye Jane"
+
+
+def test_bundled_templates_are_compiled_up_front():
+    registry = get_prompt_registry(env={})
+    assert len(registry) >= 100
+    prompt = gs.generate_prompt(["Jane", "is cooking", "Jane"],
+                                os.path.join(ROOT, "persona", "prompt_template", "v2",
+                                             "generate_event_triple_v1.txt"))
+    assert prompt.template.endswith("generate_event_triple_v1.txt")
+    assert "!<INPUT" not in prompt
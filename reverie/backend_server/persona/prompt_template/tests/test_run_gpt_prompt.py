@@ -73,3 +73,87 @@ def test_wake_up_hour_with_test_input(monkeypatch):
     out, meta = rgp.run_gpt_prompt_wake_up_hour(persona, test_input="9am")
     assert out == 9
     assert meta[1] == "PROMPT_TEST_INPUT"
+
+
+def test_event_poignancy_batch_falls_back_per_item(monkeypatch):
+    persona = DummyPersona()
+    persona.scratch.name = "Jane Doe"
+    monkeypatch.setenv("POIGNANCY_BATCH", "1")
+    prompts = []
+
+    def fake_generate_prompt(prompt_input, template):
+        prompts.append(prompt_input)
+        return "PROMPT_BATCH"
+
+    def fake_chatgpt(prompt, example_output, special_instruction, repeat, fail_safe, validate, clean_up, verbose):
+        # the model may answer with a list, or with a list inside a string
+        assert validate([3, 11, "x", 7]) and not validate("[3, 4]")
+        return clean_up('[3, 11, "x", 7]')
+
+    singles = []
+
+    def fake_single(persona, description):
+        singles.append(description)
+        return 2, []
+
+    monkeypatch.setattr(rgp, "generate_prompt", fake_generate_prompt)
+    monkeypatch.setattr(rgp, "ChatGPT_safe_generate_response", fake_chatgpt)
+    monkeypatch.setattr(rgp, "run_gpt_prompt_event_poignancy", fake_single)
+
+    events = ["a cat is eating", "the house is on fire", "Jane is sad", "Tom is here"]
+    out, _ = rgp.run_gpt_prompt_event_poignancy_batch(persona, events)
+    assert out == [3, 2, 2, 7]
+    assert singles == ["the house is on fire", "Jane is sad"]
+    assert prompts[0][3] == "".join(f"{i + 1}) {e}\n" for i, e in enumerate(events))
+
+    # a failed batch, and the per-item mode, score everything on its own
+    singles.clear()
+    monkeypatch.setattr(rgp, "ChatGPT_safe_generate_response", lambda *a: False)
+    assert rgp.run_gpt_prompt_event_poignancy_batch(persona, events[:2])[0] == [2, 2]
+    monkeypatch.setenv("POIGNANCY_BATCH", "0")
+    assert rgp.run_gpt_prompt_event_poignancy_batch(persona, events[:2])[0] == [2, 2]
+    # batching is opt-in
+    monkeypatch.delenv("POIGNANCY_BATCH")
+    assert rgp.run_gpt_prompt_event_poignancy_batch(persona, events[:2])[0] == [2, 2]
+    assert len(singles) == 6 and len(prompts) == 2
+
+
+def test_resolve_action_keeps_only_valid_fields(monkeypatch):
+    persona = DummyPersona()
+    persona.scratch.name = "Jane Doe"
+    persona.scratch.last_name = "Doe"
+    persona.scratch.living_area = "the Ville:Doe's house:Jane Doe's room"
+    persona.scratch.curr_tile = (1, 1)
+    persona.scratch.get_str_name = lambda: "Jane Doe"
+    persona.scratch.get_str_daily_plan_req = lambda: ""
+    persona.s_mem = types.SimpleNamespace(tree={"the Ville": {
+        "Doe's house": {"Jane Doe's room": ["bed", "desk"], "kitchen": ["stove"]},
+        "Lee's house": {"Tom Lee's room": ["bed"]},
+        "Hobbs Cafe": {"cafe": ["counter"]},
+    }})
+    maze = types.SimpleNamespace(access_tile=lambda tile: {"sector": "Doe's house"})
+    prompts = []
+    monkeypatch.setattr(rgp, "generate_prompt", lambda prompt_input, template: prompts.append(prompt_input) or "P")
+
+    def answer(response):
+        monkeypatch.setattr(rgp, "ChatGPT_safe_generate_response",
+                            lambda prompt, example, instruction, repeat, fail_safe, validate, clean_up, verbose:
+                            clean_up(response) if validate(response) else False)
+        return rgp.run_gpt_prompt_resolve_action("cooking (making eggs)", persona, maze, "the Ville")[0]
+
+    out = answer('{"sector": "Doe\'s house", "arena": "kitchen", "game_object": "stove", '
+                 '"pronunciatio": "🍳", "event": ["is", "cooking"], '
+                 '"object_description": "heating eggs.", "object_pronunciatio": "🔥", '
+                 '"object_event": ["is", "heating eggs"]}')
+    assert out == {"sector": "Doe's house", "arena": "kitchen", "game_object": "stove",
+                   "pronunciatio": "🍳", "event": ("Jane Doe", "is", "cooking"),
+                   "object_description": "heating eggs", "object_pronunciatio": "🔥",
+                   "object_event": ("stove", "is", "heating eggs")}
+    # other people's houses are not offered
+    assert "Lee's house" not in prompts[0][4] and "- Hobbs Cafe\n  - cafe: counter\n" in prompts[0][4]
+
+    # an object outside the chosen arena drops it and the object's state
+    out = answer({"sector": "Doe's house", "arena": "kitchen", "game_object": "bed",
+                  "pronunciatio": "", "event": ["cooking"], "object_description": "x"})
+    assert out == {"sector": "Doe's house", "arena": "kitchen"}
+    assert answer("not json") == {}
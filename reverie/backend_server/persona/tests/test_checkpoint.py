@@ -0,0 +1,121 @@
+# flake8: noqa: E402
+import os
+import sys
+
+# Make sure reverie/backend_server is importable for tests
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import datetime
+import json
+import shutil
+
+from global_methods import load_memory_nodes
+from persona.memory_structures.associative_memory import AssociativeMemory
+from persona.memory_structures.scratch import Scratch
+from persona.memory_structures.spatial_memory import MemoryTree
+
+SIM_MEMORY = os.path.join(ROOT, "..", "..", "environment", "frontend_server", "storage",
+                        "July1_the_ville_isabella_maria_klaus-step-3-1", "personas",
+                        "Isabella Rodriguez", "bootstrap_memory")
+
+
+def _empty_memory(tmp_path):
+    folder = tmp_path / "associative_memory"
+    folder.mkdir()
+    (folder / "nodes.json").write_text(json.dumps({}))
+    (folder / "kw_strength.json").write_text(json.dumps(
+        {"kw_strength_event": {}, "kw_strength_thought": {}}))
+    return folder
+
+
+def _add(a_mem, desc, minute):
+    t = datetime.datetime(2023, 2, 13, 8, minute, 0)
+    return a_mem.add_event(t, None, "Isabella", "is", desc, desc, {desc},
+                           3, (desc, [1.0, float(minute)]), [])
+
+
+def test_saves_append_new_nodes_only(tmp_path):
+    folder = _empty_memory(tmp_path)
+    a_mem = AssociativeMemory(str(folder))
+    _add(a_mem, "cooking", 0)
+    a_mem.save(str(folder))
+    assert (folder / "nodes.json").read_text() == "{}"
+    _add(a_mem, "reading", 1)
+    a_mem.save(str(folder))
+
+    kw_mtime = os.stat(folder / "kw_strength.json").st_mtime_ns
+    a_mem.save(str(folder))
+    assert os.stat(folder / "kw_strength.json").st_mtime_ns == kw_mtime
+    assert len((folder / "nodes_log.jsonl").read_text().splitlines()) == 2
+
+    # bytes past the committed end of the log are ignored, then overwritten
+    with open(folder / "nodes_log.jsonl", "a") as log_file:
+        log_file.write('{"node_3": {"type": "event"}}\n')
+    assert sorted(load_memory_nodes(str(folder))) == ["node_1", "node_2"]
+
+    reloaded = AssociativeMemory(str(folder))
+    assert [n.description for n in reloaded.seq_event] == ["reading", "cooking"]
+    assert reloaded.kw_strength_event == {"cooking": 1, "reading": 1}
+    _add(reloaded, "painting", 2)
+    reloaded.save(str(folder))
+    nodes = load_memory_nodes(str(folder))
+    assert nodes["node_3"]["description"] == "painting"
+
+
+def test_saving_elsewhere_writes_a_full_snapshot(tmp_path):
+    folder = _empty_memory(tmp_path)
+    a_mem = AssociativeMemory(str(folder))
+    _add(a_mem, "cooking", 0)
+    a_mem.save(str(folder))
+
+    other = tmp_path / "other"
+    other.mkdir()
+    a_mem.save(str(other))
+    assert sorted(json.loads((other / "nodes.json").read_text())) == ["node_1"]
+    assert not (other / "nodes_log.jsonl").exists()
+
+
+def test_scratch_and_spatial_memory_skip_unchanged_saves(tmp_path):
+    shutil.copy(os.path.join(SIM_MEMORY, "scratch.json"), tmp_path / "scratch.json")
+    shutil.copy(os.path.join(SIM_MEMORY, "spatial_memory.json"), tmp_path / "spatial.json")
+    scratch = Scratch(str(tmp_path / "scratch.json"))
+    s_mem = MemoryTree(str(tmp_path / "spatial.json"))
+
+    scratch.save(str(tmp_path / "scratch.json"))
+    s_mem.save(str(tmp_path / "spatial.json"))
+    scratch_mtime = os.stat(tmp_path / "scratch.json").st_mtime_ns
+    spatial_mtime = os.stat(tmp_path / "spatial.json").st_mtime_ns
+    scratch.save(str(tmp_path / "scratch.json"))
+    s_mem.save(str(tmp_path / "spatial.json"))
+    assert os.stat(tmp_path / "scratch.json").st_mtime_ns == scratch_mtime
+    assert os.stat(tmp_path / "spatial.json").st_mtime_ns == spatial_mtime
+
+    scratch.currently = "painting"
+    scratch.save(str(tmp_path / "scratch.json"))
+    assert Scratch(str(tmp_path / "scratch.json")).currently == "painting"
+
+    s_mem.add_tile({"world": "the Ville", "sector": "new sector", "arena": "hall",
+                    "game_object": "bench"})
+    s_mem.save(str(tmp_path / "spatial.json"))
+    tree = MemoryTree(str(tmp_path / "spatial.json")).tree
+    assert tree["the Ville"]["new sector"]["hall"] == ["bench"]
+
+
+def test_recent_events_follow_the_latest_nodes(tmp_path):
+    a_mem = AssociativeMemory(str(_empty_memory(tmp_path)))
+    for minute, desc in enumerate(["cooking", "reading", "cooking", "eating"]):
+        _add(a_mem, desc, minute)
+    latest = lambda n: {e.spo_summary() for e in a_mem.seq_event[:n]}
+    assert a_mem.get_summarized_latest_events(3) == latest(3)
+    assert a_mem.is_recent_event(("Isabella", "is", "cooking"), 3)
+    assert not a_mem.is_recent_event(("Isabella", "is", "sleeping"), 3)
+
+    for minute, desc in enumerate(["sleeping", "eating", "painting"], 10):
+        _add(a_mem, desc, minute)
+        assert a_mem.get_summarized_latest_events(3) == latest(3)
+    # "cooking" is now further back than the retention window
+    assert not a_mem.is_recent_event(("Isabella", "is", "cooking"), 3)
+    assert a_mem.is_recent_event(("Isabella", "is", "cooking"), 6)
+    assert a_mem.get_summarized_latest_events(6) == latest(6)
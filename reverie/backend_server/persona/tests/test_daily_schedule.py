@@ -0,0 +1,67 @@
+# flake8: noqa: E402
+import os
+import sys
+
+# Make sure reverie/backend_server is importable for tests
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import copy
+import datetime
+import pickle
+import random
+
+from persona.memory_structures.scratch import DailySchedule, Scratch
+
+
+def _scan_index(rows, minute):
+    # the walk that get_f_daily_schedule_index used to do
+    elapsed = 0
+    for count, (task, duration) in enumerate(rows):
+        elapsed += duration
+        if elapsed > minute:
+            return count
+    return len(rows)
+
+
+def test_index_matches_a_walk_through_edits():
+    rng = random.Random(7)
+    schedule = DailySchedule([["sleeping", 360], ["working", 480], ["dinner", 600]])
+    for _ in range(300):
+        start = rng.randrange(len(schedule) + 1)
+        end = rng.randrange(start, len(schedule) + 1)
+        op = rng.randrange(4)
+        if op == 0:
+            schedule[start:end] = [[f"task {i}", rng.randrange(-5, 30)] for i in range(rng.randrange(4))]
+        elif op == 1 and schedule:
+            del schedule[min(start, len(schedule) - 1)]
+        elif op == 2:
+            schedule += [["filler", rng.randrange(0, 30)]]
+        else:
+            schedule.insert(start, ["inserted", rng.randrange(1, 30)])
+        for minute in (-1, 0, 59, 360, 719, 1439, 1499):
+            assert schedule.index_at_minute(minute) == _scan_index(schedule, minute)
+        assert schedule.total_minutes() == sum(d for _, d in schedule)
+
+
+def test_fill_to_only_pads_when_short():
+    schedule = DailySchedule([["sleeping", 400], ["working", 1000]])
+    schedule.fill_to(1440, "sleeping")
+    schedule.fill_to(1440, "sleeping")
+    assert schedule == [["sleeping", 400], ["working", 1000], ["sleeping", 40]]
+    assert copy.deepcopy(schedule).index_at_minute(1400) == 2
+    assert pickle.loads(pickle.dumps(schedule)).total_minutes() == 1440
+
+
+def test_scratch_wraps_assigned_schedules(tmp_path):
+    scratch = Scratch(str(tmp_path / "missing.json"))
+    scratch.curr_time = datetime.datetime(2023, 2, 13, 6, 30)
+    scratch.f_daily_schedule = [["sleeping", 360], ["waking up", 60], ["working", 1020]]
+    scratch.f_daily_schedule_hourly_org = scratch.f_daily_schedule[:]
+    assert isinstance(scratch.f_daily_schedule_hourly_org, DailySchedule)
+    assert scratch.get_f_daily_schedule_index() == 1
+    scratch.f_daily_schedule[1:2] = [["stretching", 20], ["brushing teeth", 40]]
+    assert scratch.get_f_daily_schedule_index() == 2
+    assert scratch.get_f_daily_schedule_index(advance=60) == 3
+    assert scratch.get_f_daily_schedule_hourly_org_index(advance=60) == 2
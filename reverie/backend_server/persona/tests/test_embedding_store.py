@@ -0,0 +1,132 @@
+# flake8: noqa: E402
+import os
+import sys
+
+# Make sure reverie/backend_server is importable for tests
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import json
+
+import numpy as np
+
+from persona.memory_structures.embedding_store import EmbeddingStore
+
+
+def test_migrates_legacy_json(tmp_path):
+    (tmp_path / "embeddings.json").write_text(json.dumps(
+        {"bed is idle": [1.0, 0.0], "cooking": [0.5, 0.5]}))
+    store = EmbeddingStore(str(tmp_path))
+    assert set(store) == {"bed is idle", "cooking"}
+
+    store.save(str(tmp_path))
+    assert not (tmp_path / "embeddings.json").exists()
+    assert (tmp_path / "embeddings.f32").stat().st_size == 2 * 2 * 4
+
+    reloaded = EmbeddingStore(str(tmp_path))
+    assert np.allclose(reloaded["cooking"], [0.5, 0.5])
+    assert len(reloaded) == 2
+
+
+def test_save_appends_only_new_rows(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store["a"] = [1.0, 2.0, 3.0]
+    store.save(str(tmp_path))
+    assert (tmp_path / "embeddings.f32").stat().st_size == 12
+
+    store = EmbeddingStore(str(tmp_path))
+    # setting an identical vector again is a no-op
+    store["a"] = [1.0, 2.0, 3.0]
+    store["b"] = [4.0, 5.0, 6.0]
+    store.save(str(tmp_path))
+    assert (tmp_path / "embeddings.f32").stat().st_size == 24
+    lines = (tmp_path / "embeddings_keys.jsonl").read_text().splitlines()
+    assert lines == ['"a"', '"b"']
+
+    # overwriting a key appends a row, and the last row wins on load
+    store["a"] = [7.0, 8.0, 9.0]
+    store.save(str(tmp_path))
+    reloaded = EmbeddingStore(str(tmp_path))
+    assert np.allclose(reloaded["a"], [7.0, 8.0, 9.0])
+    assert len(reloaded) == 2
+
+
+def test_save_to_new_folder_writes_everything(tmp_path):
+    src = tmp_path / "src"
+    dst = tmp_path / "dst"
+    src.mkdir()
+    dst.mkdir()
+    store = EmbeddingStore(str(src))
+    store["a"] = [1.0, 1.0]
+    store.save(str(src))
+    store["b"] = [2.0, 2.0]
+    store.save(str(dst))
+    reloaded = EmbeddingStore(str(dst))
+    assert sorted(reloaded) == ["a", "b"]
+
+
+def test_ignores_rows_without_keys(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store["a"] = [1.0, 1.0]
+    store.save(str(tmp_path))
+    # simulate a save interrupted after the matrix write
+    with open(tmp_path / "embeddings.f32", "ab") as f:
+        f.write(np.array([9.0, 9.0], dtype=np.float32).tobytes())
+    reloaded = EmbeddingStore(str(tmp_path))
+    assert list(reloaded) == ["a"]
+
+
+def test_append_drops_a_torn_matrix_write(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store["a"] = [1.0, 1.0, 1.0]
+    store["b"] = [2.0, 2.0, 2.0]
+    store.save(str(tmp_path))
+    # simulate a save interrupted less than one row into the matrix write
+    with open(tmp_path / "embeddings.f32", "ab") as f:
+        f.write(b"\x00\x00")
+
+    store = EmbeddingStore(str(tmp_path))
+    store["c"] = [3.0, 3.0, 3.0]
+    store.save(str(tmp_path))
+    assert (tmp_path / "embeddings.f32").stat().st_size == 3 * 12
+    reloaded = EmbeddingStore(str(tmp_path))
+    assert np.array_equal(reloaded["c"], [3.0, 3.0, 3.0])
+    assert np.array_equal(reloaded["b"], [2.0, 2.0, 2.0])
+
+
+def test_ignores_a_torn_key_line(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store["a"] = [1.0, 1.0]
+    store.save(str(tmp_path))
+    # simulate a save interrupted in the middle of the key index write
+    with open(tmp_path / "embeddings.f32", "ab") as f:
+        f.write(np.array([9.0, 9.0], dtype=np.float32).tobytes())
+    with open(tmp_path / "embeddings_keys.jsonl", "a") as f:
+        f.write('"b')
+
+    store = EmbeddingStore(str(tmp_path))
+    assert list(store) == ["a"]
+    store["c"] = [3.0, 3.0]
+    store.save(str(tmp_path))
+    lines = (tmp_path / "embeddings_keys.jsonl").read_text().splitlines()
+    assert lines == ['"a"', '"c"']
+    reloaded = EmbeddingStore(str(tmp_path))
+    assert np.array_equal(reloaded["c"], [3.0, 3.0])
+
+
+def test_appending_to_a_fork_leaves_the_origin_alone(tmp_path):
+    from global_methods import forkanything
+
+    origin = tmp_path / "origin"
+    origin.mkdir()
+    store = EmbeddingStore(str(origin))
+    store["a"] = [1.0, 2.0]
+    store.save(str(origin))
+    forkanything(str(origin), str(tmp_path / "fork"))
+
+    store = EmbeddingStore(str(tmp_path / "fork"))
+    store["b"] = [3.0, 4.0]
+    store.save(str(tmp_path / "fork"))
+    assert len(EmbeddingStore(str(tmp_path / "fork"))) == 2
+    assert len(EmbeddingStore(str(origin))) == 1
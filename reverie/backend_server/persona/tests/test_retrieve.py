@@ -0,0 +1,98 @@
+# flake8: noqa: E402
+import os
+import sys
+
+# Make sure reverie/backend_server is importable for tests
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import datetime
+import json
+import types
+
+import persona.cognitive_modules.retrieve as retrieve
+from persona.memory_structures.associative_memory import AssociativeMemory
+
+
+EMBEDDINGS = {
+    "bed is idle": [1.0, 0.0, 0.0],
+    "cooking breakfast": [1.0, 0.1, 0.0],
+    "reading a book": [0.0, 1.0, 0.0],
+    "painting": [0.0, 0.2, 1.0],
+    "the kitchen is nice": [0.9, 0.0, 0.1],
+    "chatting about food": [1.0, 0.0, 0.0],
+}
+
+
+def _make_memory(tmp_path):
+    folder = tmp_path / "associative_memory"
+    folder.mkdir()
+    (folder / "embeddings.json").write_text(json.dumps(EMBEDDINGS))
+    (folder / "nodes.json").write_text(json.dumps({}))
+    (folder / "kw_strength.json").write_text(json.dumps(
+        {"kw_strength_event": {}, "kw_strength_thought": {}}))
+    a_mem = AssociativeMemory(str(folder))
+
+    t = datetime.datetime(2023, 2, 13, 8, 0, 0)
+    for count, (desc, poignancy) in enumerate([("bed is idle", 1),
+                                               ("cooking breakfast", 3),
+                                               ("reading a book", 5),
+                                               ("painting", 2)]):
+        created = t + datetime.timedelta(minutes=count)
+        a_mem.add_event(created, None, "Jane", "is", desc, desc, set(),
+                        poignancy, (desc, EMBEDDINGS[desc]), [])
+    a_mem.add_chat(t, None, "Jane", "chat with", "Tom",
+                   "chatting about food", set(), 4,
+                   ("chatting about food", EMBEDDINGS["chatting about food"]),
+                   [])
+    a_mem.add_thought(t + datetime.timedelta(minutes=10), None,
+                      "Jane", "likes", "kitchen", "the kitchen is nice",
+                      set(), 6, ("the kitchen is nice",
+                                 EMBEDDINGS["the kitchen is nice"]), [])
+    return a_mem
+
+
+def _make_persona(a_mem):
+    scratch = types.SimpleNamespace(
+        recency_decay=0.99, recency_w=1, relevance_w=1, importance_w=1,
+        curr_time=datetime.datetime(2023, 2, 13, 9, 0, 0))
+    return types.SimpleNamespace(a_mem=a_mem, scratch=scratch)
+
+
+def test_retrieval_arrays_follow_added_nodes(tmp_path):
+    a_mem = _make_memory(tmp_path)
+    assert a_mem.node_array_size == 6
+    rows = a_mem.get_retrieval_rows()
+    # non-idle events newest first, then thoughts; no chats, no idle nodes
+    assert [a_mem.get_node_by_row(r).embedding_key for r in rows] == [
+        "painting", "reading a book", "cooking breakfast",
+        "the kitchen is nice"]
+
+
+def test_new_retrieve_ranks_by_combined_score(tmp_path, monkeypatch):
+    a_mem = _make_memory(tmp_path)
+    persona = _make_persona(a_mem)
+    monkeypatch.setattr(retrieve, "get_embedding",
+                        lambda text: [1.0, 0.0, 0.0])
+
+    out = retrieve.new_retrieve(persona, ["food"], n_count=2)
+    keys = [n.embedding_key for n in out["food"]]
+    assert keys == ["the kitchen is nice", "cooking breakfast"]
+
+    # Retrieved nodes are marked as accessed, in both the node and arrays.
+    for node in out["food"]:
+        assert node.last_accessed == persona.scratch.curr_time
+    assert a_mem.node_last_accessed[out["food"][0].node_count - 1] == (
+        a_mem.node_last_accessed[out["food"][1].node_count - 1])
+
+
+def test_new_retrieve_handles_multiple_focal_points(tmp_path, monkeypatch):
+    a_mem = _make_memory(tmp_path)
+    persona = _make_persona(a_mem)
+    focal = {"food": [1.0, 0.0, 0.0], "books": [0.0, 1.0, 0.0]}
+    monkeypatch.setattr(retrieve, "get_embedding", lambda text: focal[text])
+
+    out = retrieve.new_retrieve(persona, ["food", "books"], n_count=10)
+    assert len(out["food"]) == 4
+    assert out["books"][0].embedding_key == "reading a book"
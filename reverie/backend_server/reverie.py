@@ -28,12 +28,17 @@ import os
 import shutil
 import traceback
 
+from concurrent.futures import ThreadPoolExecutor
 from selenium import webdriver
 
 from global_methods import *
 from utils import *
 from maze import *
 from persona.persona import *
+from persona.prompt_template.prompt_cache import get_prompt_cache
+from persona.prompt_template.llm_transcript import get_llm_transcript
+from persona.prompt_template.llm_metrics import get_llm_metrics
+from step_profiler import get_step_profiler
 
 ##############################################################################
 #                                  REVERIE                                   #
@@ -51,18 +56,18 @@ class ReverieServer:
     fork_folder = f"{fs_storage}/{self.fork_sim_code}"
 
     # <sim_code> indicates our current simulation. The first step here is to 
-    # copy everything that's in <fork_sim_code>, but edit its 
-    # reverie/meta/json's fork variable. 
+    # fork everything that's in <fork_sim_code> (the files are hard linked, 
+    # see forkanything), but edit its reverie/meta/json's fork variable. 
     self.sim_code = sim_code
     sim_folder = f"{fs_storage}/{self.sim_code}"
-    copyanything(fork_folder, sim_folder)
+    forkanything(fork_folder, sim_folder)
 
     with open(f"{sim_folder}/reverie/meta.json") as json_file:  
       reverie_meta = json.load(json_file)
 
-    with open(f"{sim_folder}/reverie/meta.json", "w") as outfile: 
-      reverie_meta["fork_sim_code"] = fork_sim_code
-      outfile.write(json.dumps(reverie_meta, indent=2))
+    reverie_meta["fork_sim_code"] = fork_sim_code
+    write_file_atomic(f"{sim_folder}/reverie/meta.json", 
+                      json.dumps(reverie_meta, indent=2))
 
     # LOADING REVERIE'S GLOBAL VARIABLES
     # The start datetime of the Reverie: 
@@ -119,8 +124,7 @@ class ReverieServer:
     # self.persona_convo = dict()
 
     # Loading in all personas. 
-    init_env_file = f"{sim_folder}/environment/{str(self.step)}.json"
-    init_env = json.load(open(init_env_file))
+    init_env = get_step_log(f"{sim_folder}/environment").read(self.step)
     for persona_name in reverie_meta['persona_names']: 
       persona_folder = f"{sim_folder}/personas/{persona_name}"
       p_x = init_env[persona_name]["x"]
@@ -129,13 +133,23 @@ class ReverieServer:
 
       self.personas[persona_name] = curr_persona
       self.personas_tile[persona_name] = (p_x, p_y)
-      self.maze.tiles[p_y][p_x]["events"].add(curr_persona.scratch
-                                              .get_curr_event_and_desc())
+      self.maze.add_event_from_tile(curr_persona.scratch
+                                    .get_curr_event_and_desc(), (p_x, p_y))
 
     # REVERIE SETTINGS PARAMETERS:  
     # <server_sleep> denotes the amount of time that our while loop rests each
     # cycle; this is to not kill our machine. 
     self.server_sleep = 0.1
+    # <persona_workers> is the number of threads used to run the personas' 
+    # cognition concurrently within a step (see move_personas). With 1, the
+    # personas move one after the other as in the original release. 
+    self.persona_workers = max(1, int(os.environ.get("PERSONA_WORKERS", "1")))
+    # <step_channel> is the local socket through which the frontend pushes 
+    # each step's environment to us, and we push each step's movements back
+    # (see StepChannel in global_methods.py). It is opened by start_server. 
+    # With REVERIE_STEP_CHANNEL=0, or if it cannot be opened, we only poll the
+    # step logs as in the original release. 
+    self.step_channel = None
 
     # SIGNALING THE FRONTEND SERVER: 
     # curr_sim_code.json contains the current simulation code, and
@@ -157,7 +171,8 @@ class ReverieServer:
   def save(self): 
     """
     Save all Reverie progress -- this includes Reverie's global state as well
-    as all the personas.  
+    as all the personas. The personas' memories only write what changed since
+    they were loaded or last saved, so frequent saves stay cheap. 
 
     INPUT
       None
@@ -178,14 +193,18 @@ class ReverieServer:
     reverie_meta["persona_names"] = list(self.personas.keys())
     reverie_meta["step"] = self.step
     reverie_meta_f = f"{sim_folder}/reverie/meta.json"
-    with open(reverie_meta_f, "w") as outfile: 
-      outfile.write(json.dumps(reverie_meta, indent=2))
+    write_file_atomic(reverie_meta_f, json.dumps(reverie_meta, indent=2))
 
     # Save the personas.
     for persona_name, persona in self.personas.items(): 
       save_folder = f"{sim_folder}/personas/{persona_name}/bootstrap_memory"
       persona.save(save_folder)
 
+    # Save the per-template LLM metrics of this run. 
+    llm_metrics = get_llm_metrics()
+    if llm_metrics: 
+      llm_metrics.dump(f"{sim_folder}/reverie/llm_metrics.json")
+
 
   def start_path_tester_server(self): 
     """
@@ -278,7 +297,76 @@ class ReverieServer:
       time.sleep(self.server_sleep * 10)
 
 
-  def start_server(self, int_counter): 
+  def move_personas(self): 
+    """
+    Calls on each persona to perceive, plan and act for the current step. 
+
+    With <persona_workers> set to 1, this simply calls persona.move for each
+    persona in turn. Otherwise the step is split into phases: 
+      1) think (perceive, retrieve, and planning the persona's own next 
+         action) runs concurrently for all personas. These only read the 
+         maze and change the persona's own memory. 
+      2) react runs one persona at a time, in the order of <self.personas>. 
+         This is where personas read and change each other's state, e.g., 
+         a chat started by an earlier persona sets the target's action, so 
+         the target sees that it is already chatting and does not start a 
+         second one. 
+      3) reflect runs concurrently, as it only touches the persona's own 
+         memory. 
+      4) execute runs one persona at a time, in order, so that path finding
+         and the maze's distance field cache see the same sequence of calls
+         on every run. 
+    Since the LLM calls mostly happen in phases 1 and 3, a step takes about 
+    as long as its slowest persona instead of the sum of all of them. Chats 
+    are the exception and are still generated one at a time. 
+
+    INPUT 
+      None
+    OUTPUT 
+      A dictionary with persona names as keys, and the execution triple 
+      (next_tile, pronunciatio, description) of persona.move as values. 
+    """
+    if self.persona_workers == 1 or len(self.personas) < 2: 
+      executions = dict()
+      for persona_name, persona in self.personas.items(): 
+        executions[persona_name] = persona.move(
+          self.maze, self.personas, self.personas_tile[persona_name], 
+          self.curr_time)
+      return executions
+
+    new_days = dict()
+    for persona_name, persona in self.personas.items(): 
+      new_days[persona_name] = persona.start_step(
+        self.personas_tile[persona_name], self.curr_time)
+
+    with ThreadPoolExecutor(max_workers=self.persona_workers) as pool: 
+      # We submit all personas before waiting on any of them, and collect the
+      # results in the order of <self.personas>. If a persona fails, the 
+      # exception is raised here, after the other personas are done. 
+      futures = {persona_name: pool.submit(persona.think, self.maze, 
+                                           new_days[persona_name])
+                 for persona_name, persona in self.personas.items()}
+      retrieved = {persona_name: future.result() 
+                   for persona_name, future in futures.items()}
+
+      plans = dict()
+      for persona_name, persona in self.personas.items(): 
+        plans[persona_name] = persona.react(self.maze, self.personas, 
+                                            retrieved[persona_name])
+
+      futures = [pool.submit(persona.reflect) 
+                 for persona in self.personas.values()]
+      for future in futures: 
+        future.result()
+
+    executions = dict()
+    for persona_name, persona in self.personas.items(): 
+      executions[persona_name] = persona.execute(self.maze, self.personas, 
+                                                 plans[persona_name])
+    return executions
+
+
+  def start_server(self, int_counter, headless=False): 
     """
     The main backend server of Reverie. 
     This function retrieves the environment file from the frontend to 
@@ -288,54 +376,80 @@ class ReverieServer:
     INPUT
       int_counter: Integer value for the number of steps left for us to take
                    in this iteration. 
+      headless: If True, we run without the frontend: each persona is placed
+                on its movement tile by appending the next environment record
+                ourselves, and we do not sleep between steps. Together with 
+                LLM_TRANSCRIPT=replay, this runs steps offline at full speed
+                to measure the simulation's own overhead. 
     OUTPUT 
       None
     """
     # <sim_folder> points to the current simulation folder.
     sim_folder = f"{fs_storage}/{self.sim_code}"
-
-    # When a persona arrives at a game object, we give a unique event
-    # to that object. 
-    # e.g., ('double studio[...]:bed', 'is', 'unmade', 'unmade')
-    # Later on, before this cycle ends, we need to return that to its 
-    # initial state, like this: 
-    # e.g., ('double studio[...]:bed', None, None, None)
-    # So we need to keep track of which event we added. 
-    # <game_obj_cleanup> is used for that. 
-    game_obj_cleanup = dict()
+    run_start = time.perf_counter()
+    run_steps = int_counter
+    # <profiler> times the phases of each persona's step when STEP_PROFILE 
+    # is on (see step_profiler.py). 
+    profiler = get_step_profiler()
+
+    # <env_log> holds the environment the frontend reports back after each 
+    # step, and <move_log> the movements we send to the frontend. See 
+    # StepLog in global_methods.py. 
+    env_log = get_step_log(f"{sim_folder}/environment")
+    move_log = get_step_log(f"{sim_folder}/movement")
+    if (not headless and self.step_channel is None 
+        and os.environ.get("REVERIE_STEP_CHANNEL", "1") != "0"): 
+      try: 
+        self.step_channel = StepChannel(fs_temp_storage, move_log)
+      except OSError: 
+        import logging
+        logging.exception("failed to open the step channel; polling instead")
 
     # The main while loop of Reverie. 
     while (True): 
       # Done with this iteration if <int_counter> reaches 0. 
       if int_counter == 0: 
+        if headless and run_steps: 
+          elapsed = time.perf_counter() - run_start
+          print (f"{run_steps} steps in {elapsed:.2f}s "
+                 f"({elapsed / run_steps * 1000:.1f} ms/step)")
+        for curr_file in profiler.write_run(
+                           f"{sim_folder}/reverie/step_profile"): 
+          print (f"Wrote {curr_file}")
         break
 
-      # <curr_env_file> file is the file that our frontend outputs. When the
-      # frontend has done its job and moved the personas, then it will put a 
-      # new environment file that matches our step count. That's when we run 
-      # the content of this for loop. Otherwise, we just wait. 
-      curr_env_file = f"{sim_folder}/environment/{self.step}.json"
-      if check_if_file_exists(curr_env_file):
-        # If we have an environment file, it means we have a new perception
+      # The environment log is what our frontend outputs. When the frontend 
+      # has done its job and moved the personas, then it will append a new 
+      # environment record that matches our step count (and push it to us 
+      # through the step channel). That's when we run the content of this 
+      # for loop. Otherwise, we just wait. 
+      new_env = None
+      if self.step_channel and not headless: 
+        new_env = self.step_channel.pop_environment(self.sim_code, self.step)
+      if new_env is not None or env_log.has_step(self.step):
+        # If we have an environment record, it means we have a new perception
         # input to our personas. So we first retrieve it.
         try: 
           # Try and save block for robustness of the while loop.
-          with open(curr_env_file) as json_file:
-            new_env = json.load(json_file)
-            env_retrieved = True
+          if new_env is None: 
+            new_env = env_log.read(self.step)
+          env_retrieved = True
         except Exception:
           import logging
           logging.exception("failed to read environment file")
           pass
       
         if env_retrieved: 
-          # This is where we go through <game_obj_cleanup> to clean up all 
-          # object actions that were used in this cylce. 
-          for key, val in game_obj_cleanup.items(): 
-            # We turn all object actions to their blank form (with None). 
-            self.maze.turn_event_from_tile_idle(key, val)
-          # Then we initialize game_obj_cleanup for this cycle. 
-          game_obj_cleanup = dict()
+          profiler.begin_step(self.step)
+
+          # When a persona arrives at a game object, we give a unique event
+          # to that object. 
+          # e.g., ('double studio[...]:bed', 'is', 'unmade', 'unmade')
+          # Before the next cycle, we return all of those to their initial 
+          # state, like this: 
+          # e.g., ('double studio[...]:bed', None, None, None)
+          # The maze keeps track of which object events were activated. 
+          self.maze.idle_object_events()
 
           # We first move our personas in the backend environment to match 
           # the frontend environment. 
@@ -356,17 +470,11 @@ class ReverieServer:
             # Now, the persona will travel to get to their destination. *Once*
             # the persona gets there, we activate the object action.
             if not persona.scratch.planned_path: 
-              # We add that new object action event to the backend tile map. 
-              # At its creation, it is stored in the persona's backend. 
-              game_obj_cleanup[persona.scratch
-                               .get_curr_obj_event_and_desc()] = new_tile
-              self.maze.add_event_from_tile(persona.scratch
+              # We add that new object action event to the backend tile map 
+              # in place of the object's temporary blank action. At its 
+              # creation, it is stored in the persona's backend. 
+              self.maze.activate_object_event(persona.scratch
                                      .get_curr_obj_event_and_desc(), new_tile)
-              # We also need to remove the temporary blank action for the 
-              # object that is currently taking the action. 
-              blank = (persona.scratch.get_curr_obj_event_and_desc()[0], 
-                       None, None, None)
-              self.maze.remove_event_from_tile(blank, new_tile)
 
           # Then we need to actually have each of the personas perceive and
           # move. The movement for each of the personas comes in the form of
@@ -374,15 +482,14 @@ class ReverieServer:
           # This is where the core brains of the personas are invoked. 
           movements = {"persona": dict(), 
                        "meta": dict()}
+          executions = self.move_personas()
           for persona_name, persona in self.personas.items(): 
             # <next_tile> is a x,y coordinate. e.g., (58, 9)
             # <pronunciatio> is an emoji. e.g., "\ud83d\udca4"
             # <description> is a string description of the movement. e.g., 
             #   writing her next novel (editing her novel) 
             #   @ double studio:double studio:common room:sofa
-            next_tile, pronunciatio, description = persona.move(
-              self.maze, self.personas, self.personas_tile[persona_name], 
-              self.curr_time)
+            next_tile, pronunciatio, description = executions[persona_name]
             movements["persona"][persona_name] = {}
             movements["persona"][persona_name]["movement"] = next_tile
             movements["persona"][persona_name]["pronunciatio"] = pronunciatio
@@ -395,15 +502,17 @@ class ReverieServer:
           movements["meta"]["curr_time"] = (self.curr_time 
                                              .strftime("%B %d, %Y, %H:%M:%S"))
 
-          # We then write the personas' movements to a file that will be sent 
-          # to the frontend server. 
+          # We then append the personas' movements to the movement log that
+          # will be sent to the frontend server. 
           # Example json output: 
           # {"persona": {"Maria Lopez": {"movement": [58, 9]}},
           #  "persona": {"Klaus Mueller": {"movement": [38, 12]}}, 
           #  "meta": {curr_time: <datetime>}}
-          curr_move_file = f"{sim_folder}/movement/{self.step}.json"
-          with open(curr_move_file, "w") as outfile: 
-            outfile.write(json.dumps(movements, indent=2))
+          move_log.append(self.step, movements)
+          if self.step_channel and not headless: 
+            self.step_channel.publish_movement(self.sim_code, self.step, 
+                                               movements)
+          profiler.end_step()
 
           # After this cycle, the world takes one step forward, and the 
           # current time moves by <sec_per_step> amount. 
@@ -411,9 +520,39 @@ class ReverieServer:
           self.curr_time += datetime.timedelta(seconds=self.sec_per_step)
 
           int_counter -= 1
+
+          if headless: 
+            # Stand in for the frontend, which would walk each persona to its
+            # movement tile and then report the new environment. 
+            next_env = dict()
+            for persona_name, move in movements["persona"].items(): 
+              next_env[persona_name] = {"maze": self.maze.maze_name, 
+                                        "x": move["movement"][0], 
+                                        "y": move["movement"][1]}
+            env_log.append(self.step, next_env)
+            continue
           
-      # Sleep so we don't burn our machines. 
-      time.sleep(self.server_sleep)
+      # Sleep so we don't burn our machines. With the step channel open, we
+      # wake up as soon as the frontend pushes the next environment. 
+      if self.step_channel and not headless: 
+        self.step_channel.poll(self.server_sleep)
+      else: 
+        time.sleep(self.server_sleep)
+
+
+  def close_step_channel(self): 
+    """
+    Closes the step channel so the frontend goes back to polling the step 
+    logs. 
+
+    INPUT 
+      None
+    OUTPUT
+      None
+    """
+    if self.step_channel: 
+      self.step_channel.close()
+      self.step_channel = None
 
 
   def open_server(self): 
@@ -444,6 +583,7 @@ class ReverieServer:
           # Finishes the simulation environment and saves the progress. 
           # Example: fin
           self.save()
+          self.close_step_channel()
           break
 
         elif sim_command.lower() == "start path tester mode": 
@@ -458,6 +598,7 @@ class ReverieServer:
           # and erases all saved data from current simulation. 
           # Example: exit 
           shutil.rmtree(sim_folder) 
+          self.close_step_channel()
           break 
 
         elif sim_command.lower() == "save": 
@@ -466,10 +607,13 @@ class ReverieServer:
           self.save()
 
         elif sim_command[:3].lower() == "run": 
-          # Runs the number of steps specified in the prompt.
+          # Runs the number of steps specified in the prompt. With 
+          # "headless", the steps run without the frontend (see start_server).
           # Example: run 1000
+          # Example: run headless 100
           int_count = int(sim_command.split()[-1])
-          rs.start_server(int_count)
+          rs.start_server(int_count, 
+                          headless="headless" in sim_command.lower())
 
         elif ("print persona schedule" 
               in sim_command[:22].lower()): 
@@ -570,6 +714,87 @@ class ReverieServer:
           for key, val in self.maze.access_tile(cooordinate).items(): 
             ret_str += f"{key}: {val}\n"
 
+        elif ("print prompt cache stats" 
+              in sim_command.lower()): 
+          # Print the hit rates of the prompt/response cache, overall and per
+          # prompt template. 
+          # Ex: print prompt cache stats
+          prompt_cache = get_prompt_cache()
+          if not prompt_cache: 
+            ret_str += "Prompt cache is off (set PROMPT_CACHE=1).\n"
+          else: 
+            stats = prompt_cache.stats()
+            for key, val in stats.items(): 
+              if key != "templates": 
+                ret_str += f"{key}: {val}\n"
+            for template, counts in stats["templates"].items(): 
+              ret_str += (f"  {template}: {counts['hits']} hits, "
+                          f"{counts['misses']} misses "
+                          f"({counts['hit_rate']:.0%})\n")
+
+        elif ("print llm transcript stats" 
+              in sim_command.lower()): 
+          # Print how many LLM responses were recorded or replayed, and the
+          # number of replay misses. 
+          # Ex: print llm transcript stats
+          transcript = get_llm_transcript()
+          if not transcript: 
+            ret_str += "No transcript (set LLM_TRANSCRIPT=record|replay).\n"
+          else: 
+            for key, val in transcript.stats().items(): 
+              ret_str += f"{key}: {val}\n"
+
+        elif ("print llm metrics" 
+              in sim_command[:17].lower()): 
+          # Print the calls, latency, tokens, retries and fail-safes of each
+          # prompt template and backend, slowest first. An optional number 
+          # limits the output to that many templates. 
+          # Ex: print llm metrics
+          # Ex: print llm metrics 10
+          llm_metrics = get_llm_metrics()
+          if not llm_metrics: 
+            ret_str += "LLM metrics are off (unset LLM_METRICS).\n"
+          else: 
+            limit = sim_command[17:].strip()
+            ret_str += llm_metrics.summary(int(limit) if limit else None)
+
+        elif ("dump llm metrics" 
+              in sim_command[:16].lower()): 
+          # Write the LLM metrics to a .json or .csv file. Defaults to 
+          # reverie/llm_metrics.json in the simulation folder. 
+          # Ex: dump llm metrics
+          # Ex: dump llm metrics /tmp/llm_metrics.csv
+          llm_metrics = get_llm_metrics()
+          if not llm_metrics: 
+            ret_str += "LLM metrics are off (unset LLM_METRICS).\n"
+          else: 
+            curr_file = (sim_command[16:].strip() 
+                         or f"{sim_folder}/reverie/llm_metrics.json")
+            ret_str += f"Wrote {llm_metrics.dump(curr_file)}"
+
+        elif ("reset llm metrics" 
+              in sim_command[:17].lower()): 
+          # Clear the LLM metrics, e.g. before measuring a few steps. 
+          # Ex: reset llm metrics
+          llm_metrics = get_llm_metrics()
+          if llm_metrics: 
+            llm_metrics.reset()
+
+        elif ("print step profile" 
+              in sim_command[:18].lower()): 
+          # Print the mean wall, CPU, LLM wait and local time of each 
+          # persona's phases over the last profiled steps. 
+          # Ex: print step profile
+          ret_str += get_step_profiler().summary()
+
+        elif sim_command.lower() in ["start step profile", 
+                                     "stop step profile"]: 
+          # Turn the step profiler on or off for the next runs. Each run 
+          # writes its profile to reverie/step_profile in the simulation 
+          # folder. 
+          # Ex: start step profile
+          get_step_profiler().enabled = sim_command.lower().startswith("start")
+
         elif ("call -- analysis" 
               in sim_command.lower()): 
           # Starts a stateless chat session with the agent. It does not save 
@@ -0,0 +1,296 @@
+"""
+File: step_profiler.py
+Description: An opt-in profiler for the phases of Persona.move.
+
+Each phase of a persona's step (perceive, retrieve, plan, reflect, execute,
+and nested parts such as new_retrieve and path_finder) is timed in wall and
+CPU time, and the time spent waiting on LLM and embedding requests is
+recorded as "llm:<kind>" frames inside the phase, so a phase's wall time
+minus its llm time is local compute. Frames are kept per thread, so this
+works with PERSONA_WORKERS > 1, and only frames under a persona's phase are
+recorded.
+
+The server prompt's "print step profile" shows the rolling per-phase means of
+the last STEP_PROFILE_WINDOW steps (default 20). At the end of every "run",
+the run's frames are written to reverie/step_profile in the simulation
+folder, as a Chrome trace (steps-<first>-<last>.trace.json, for
+chrome://tracing or Perfetto) and as folded stacks (.folded, for
+flamegraph.pl or speedscope).
+
+Set STEP_PROFILE=1 to turn it on, or use "start step profile" / "stop step
+profile" in the server prompt.
+"""
+import functools
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+
+class _Frame:
+  __slots__ = ("name", "persona", "path", "start", "cpu_start", "llm",
+               "children")
+
+  def __init__(self, name, persona, path):
+    self.name = name
+    self.persona = persona
+    self.path = path
+    self.start = time.perf_counter()
+    self.cpu_start = time.thread_time()
+    # <llm> is the wall time of the llm frames below this one, and
+    # <children> the wall time of its direct child frames.
+    self.llm = 0.0
+    self.children = 0.0
+
+
+class _Phase:
+  """
+  Context manager for one frame; see StepProfiler.phase.
+  """
+  __slots__ = ("profiler", "name", "persona", "frame")
+
+  def __init__(self, profiler, name, persona):
+    self.profiler = profiler
+    self.name = name
+    self.persona = persona
+    self.frame = None
+
+
+  def __enter__(self):
+    if self.profiler.enabled:
+      self.frame = self.profiler._push(self.name, self.persona)
+    return self
+
+
+  def __exit__(self, exc_type, exc, tb):
+    if self.frame is not None:
+      self.profiler._pop(self.frame)
+    return False
+
+
+class StepProfiler:
+  def __init__(self, enabled=False, window=20):
+    self.enabled = enabled
+    self.lock = threading.Lock()
+    self.local = threading.local()
+    self.t0 = time.perf_counter()
+    self.step = None
+    self.step_start = None
+    # <events> holds the frames recorded since the last write_run, as
+    # (path, persona, step, start, wall, cpu, llm, self_wall) tuples, and
+    # <steps> the (step, start, wall) of each profiled step.
+    self.events = []
+    self.steps = []
+    # <curr_phases> sums [wall, cpu, llm] per (persona, phase path) for the
+    # current step, and <window> keeps those sums for the last steps.
+    self.curr_phases = defaultdict(lambda: [0.0, 0.0, 0.0])
+    self.window = deque(maxlen=window)
+
+
+  def phase(self, name, persona=None):
+    """
+    Returns a context manager that times <name> as a phase of <persona>'s
+    step. Nested phases inherit the persona of the enclosing one, and a
+    phase outside of any persona's phase is not recorded.
+    """
+    return _Phase(self, name, persona)
+
+
+  def _push(self, name, persona):
+    stack = getattr(self.local, "stack", None)
+    if stack is None:
+      stack = self.local.stack = []
+    if stack:
+      parent = stack[-1]
+      persona = persona or parent.persona
+      # An llm request made by another one is part of the same wait.
+      if name.startswith("llm:") and parent.name.startswith("llm:"):
+        return None
+      path = parent.path + (name,)
+    else:
+      path = (name,)
+    if not persona:
+      return None
+    frame = _Frame(name, persona, path)
+    stack.append(frame)
+    return frame
+
+
+  def _pop(self, frame):
+    end = time.perf_counter()
+    wall = end - frame.start
+    cpu = time.thread_time() - frame.cpu_start
+    stack = self.local.stack
+    stack.pop()
+    llm = wall if frame.name.startswith("llm:") else frame.llm
+    if stack:
+      stack[-1].llm += llm
+      stack[-1].children += wall
+
+    with self.lock:
+      self.events += [(frame.path, frame.persona, self.step,
+                       frame.start - self.t0, wall, cpu, llm,
+                       wall - frame.children)]
+      if not frame.name.startswith("llm:"):
+        totals = self.curr_phases[(frame.persona, "/".join(frame.path))]
+        totals[0] += wall
+        totals[1] += cpu
+        totals[2] += llm
+
+
+  def begin_step(self, step):
+    if not self.enabled:
+      return
+    with self.lock:
+      self.step = step
+      self.step_start = time.perf_counter()
+      self.curr_phases.clear()
+
+
+  def end_step(self):
+    if not self.enabled or self.step_start is None:
+      return
+    with self.lock:
+      wall = time.perf_counter() - self.step_start
+      self.steps += [(self.step, self.step_start - self.t0, wall)]
+      self.window.append((self.step, wall, dict(self.curr_phases)))
+      self.step_start = None
+
+
+  def reset(self):
+    with self.lock:
+      self.events = []
+      self.steps = []
+      self.window.clear()
+      self.curr_phases.clear()
+
+
+  def summary(self):
+    """
+    Returns the mean wall, CPU, LLM wait and local (wall minus LLM) time of
+    each persona's phases over the steps in the window, in milliseconds.
+    """
+    with self.lock:
+      window = list(self.window)
+    if not window:
+      return "No profiled steps (set STEP_PROFILE=1 or start step profile)."
+
+    n_steps = len(window)
+    step_walls = [wall for _, wall, _ in window]
+    phases = defaultdict(lambda: [0.0, 0.0, 0.0])
+    for _, _, step_phases in window:
+      for key, totals in step_phases.items():
+        for i in range(3):
+          phases[key][i] += totals[i]
+
+    ret_str = (f"steps {window[0][0]}-{window[-1][0]}: "
+               f"{sum(step_walls) / n_steps * 1000:.1f} ms/step "
+               f"(max {max(step_walls) * 1000:.1f} ms)\n")
+    curr_persona = None
+    for (persona, path), (wall, cpu, llm) in sorted(phases.items()):
+      if persona != curr_persona:
+        curr_persona = persona
+        ret_str += f"  {persona}\n"
+      ret_str += (f"    {path}: wall {wall / n_steps * 1000:.1f} ms, "
+                  f"cpu {cpu / n_steps * 1000:.1f} ms, "
+                  f"llm {llm / n_steps * 1000:.1f} ms, "
+                  f"local {(wall - llm) / n_steps * 1000:.1f} ms\n")
+    return ret_str
+
+
+  def write_run(self, folder):
+    """
+    Writes the frames recorded since the last call as a Chrome trace and as
+    folded stacks, and clears them.
+    ARGS:
+      folder: the folder to write to, e.g., "{sim_folder}/reverie/step_profile"
+    RETURNS:
+      The paths of the two files, or [] if nothing was recorded.
+    """
+    with self.lock:
+      events, self.events = self.events, []
+      steps, self.steps = self.steps, []
+    if not events:
+      return []
+
+    recorded = [step for _, _, step, _, _, _, _, _ in events
+                if step is not None]
+    first, last = min(recorded, default=0), max(recorded, default=0)
+    if not os.path.exists(folder):
+      os.makedirs(folder)
+    base = f"{folder}/steps-{first}-{last}"
+
+    # One row per persona, and one for the server's steps.
+    tids = {"server": 0}
+    for _, persona, _, _, _, _, _, _ in events:
+      tids.setdefault(persona, len(tids))
+    trace = [{"name": "thread_name", "ph": "M", "pid": 1, "tid": tid,
+              "args": {"name": name}} for name, tid in tids.items()]
+    for step, start, wall in steps:
+      trace += [{"name": f"step {step}", "cat": "step", "ph": "X",
+                 "pid": 1, "tid": 0, "ts": start * 1e6, "dur": wall * 1e6}]
+    for path, persona, step, start, wall, cpu, llm, _ in events:
+      trace += [{"name": path[-1],
+                 "cat": "llm" if path[-1].startswith("llm:") else "phase",
+                 "ph": "X", "pid": 1, "tid": tids[persona],
+                 "ts": start * 1e6, "dur": wall * 1e6,
+                 "args": {"step": step, "cpu_ms": cpu * 1000,
+                          "llm_ms": llm * 1000}}]
+    with open(f"{base}.trace.json", "w") as outfile:
+      json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, outfile)
+
+    # Folded stacks: "step;<persona>;<phase>;...;<frame> <self time in us>".
+    folded = defaultdict(float)
+    for path, persona, _, _, _, _, _, self_wall in events:
+      folded[";".join(("step", persona) + path)] += self_wall
+    with open(f"{base}.folded", "w") as outfile:
+      for stack, self_wall in sorted(folded.items()):
+        outfile.write(f"{stack} {round(self_wall * 1e6)}\n")
+    return [f"{base}.trace.json", f"{base}.folded"]
+
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+def get_step_profiler():
+  """
+  Returns the process-wide step profiler. It starts out enabled if
+  STEP_PROFILE is set to 1.
+  """
+  global _profiler
+  if _profiler is not None:
+    return _profiler
+  with _profiler_lock:
+    if _profiler is None:
+      _profiler = StepProfiler(
+        enabled=os.environ.get("STEP_PROFILE", "0") not in ("", "0"),
+        window=int(os.environ.get("STEP_PROFILE_WINDOW", "20")))
+    return _profiler
+
+
+def step_phase(name, persona=None):
+  """
+  Returns a context manager that times <name> as a phase of <persona>'s step
+  (see StepProfiler.phase).
+  """
+  return get_step_profiler().phase(name, persona)
+
+
+def profiled(name):
+  """
+  Decorator that times every call of the function as the phase <name> of the
+  enclosing persona's step. Use "llm:<kind>" for functions that wait on LLM
+  or embedding requests.
+  """
+  def decorate(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+      profiler = get_step_profiler()
+      if not profiler.enabled:
+        return func(*args, **kwargs)
+      with profiler.phase(name):
+        return func(*args, **kwargs)
+    return wrapper
+  return decorate
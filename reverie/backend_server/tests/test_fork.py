@@ -0,0 +1,45 @@
+# flake8: noqa: E402
+import os
+import sys
+
+# Make sure reverie/backend_server is importable for tests
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from global_methods import StepLog, forkanything, unshare_file
+
+
+def _make_sim(folder):
+    (folder / "reverie").mkdir(parents=True)
+    (folder / "reverie" / "meta.json").write_text('{"step": 1}')
+    log = StepLog(str(folder / "movement"))
+    log.append(0, {"persona": {}})
+    return log
+
+
+def test_fork_links_instead_of_copying(tmp_path):
+    _make_sim(tmp_path / "origin")
+    forkanything(str(tmp_path / "origin"), str(tmp_path / "fork"))
+    meta = tmp_path / "fork" / "reverie" / "meta.json"
+    assert meta.read_text() == '{"step": 1}'
+    assert os.path.samefile(meta, tmp_path / "origin" / "reverie" / "meta.json")
+
+
+def test_writes_to_either_side_do_not_leak(tmp_path):
+    origin_log = _make_sim(tmp_path / "origin")
+    forkanything(str(tmp_path / "origin"), str(tmp_path / "fork"))
+
+    fork_log = StepLog(str(tmp_path / "fork" / "movement"))
+    fork_log.append(1, {"persona": {"fork": 1}})
+    origin_log.append(1, {"persona": {"origin": 1}})
+    assert StepLog(str(tmp_path / "fork" / "movement")).read(1) == {"persona": {"fork": 1}}
+    assert StepLog(str(tmp_path / "origin" / "movement")).read(1) == {"persona": {"origin": 1}}
+
+    meta = tmp_path / "fork" / "reverie" / "meta.json"
+    unshare_file(str(meta))
+    meta.write_text('{"step": 2}')
+    assert (tmp_path / "origin" / "reverie" / "meta.json").read_text() == '{"step": 1}'
+    # unsharing a file that is not shared (or missing) is a no-op
+    unshare_file(str(meta))
+    unshare_file(str(tmp_path / "missing.json"))
@@ -0,0 +1,146 @@
+# flake8: noqa: E402
+import os
+import sys
+
+# Make sure reverie/backend_server is importable for tests
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from collections import OrderedDict
+
+import numpy
+
+from maze import Maze
+from path_finder import PathGrid
+
+
+def _make_maze(rows, address_tiles):
+    # Build a Maze without reading the map files from disk.
+    maze = Maze.__new__(Maze)
+    maze.maze_height = len(rows)
+    maze.maze_width = len(rows[0])
+    maze.collision_maze = [["1" if c == "#" else "0" for c in row]
+                           for row in rows]
+    maze.collision_layer = numpy.array(maze.collision_maze) != "0"
+    maze.tile_events = dict()
+    maze.path_grid = PathGrid(maze.collision_maze, "1")
+    maze.address_tiles = address_tiles
+    maze.distance_field_cache_size = 2
+    maze.distance_fields = OrderedDict()
+    return maze
+
+
+def test_find_path_to_address_picks_nearest_tile():
+    maze = _make_maze(["......",
+                       ".####.",
+                       "......"],
+                      {"w:s:a": {(0, 0), (5, 2)}})
+    path = maze.find_path_to_address((4, 2), "w:s:a")
+    assert path == [(4, 2), (5, 2)]
+
+
+def test_distance_fields_are_lru_bounded():
+    maze = _make_maze(["...."],
+                      {"a": {(0, 0)}, "b": {(1, 0)}, "c": {(2, 0)}})
+    maze.get_distance_field("a")
+    maze.get_distance_field("b")
+    maze.get_distance_field("a")
+    maze.get_distance_field("c")
+    assert list(maze.distance_fields) == ["a", "c"]
+
+
+def test_set_tile_collision_invalidates_fields():
+    maze = _make_maze(["...",
+                       "...",
+                       "..."],
+                      {"a": {(2, 0)}})
+    assert len(maze.find_path_to_address((0, 0), "a")) == 3
+    maze.set_tile_collision((1, 0), True)
+    assert not maze.distance_fields
+    path = maze.find_path_to_address((0, 0), "a")
+    assert (1, 0) not in path
+    assert len(path) == 5
+    assert maze.collision_layer[0, 1]
+
+
+def test_tile_layers_match_addresses(monkeypatch):
+    monkeypatch.setenv("MAZE_CACHE", "0")
+    maze = Maze("the_ville")
+    spawn = next(add for add in maze.address_tiles if add.startswith("<spawn_loc>"))
+    x, y = next(iter(maze.address_tiles[spawn]))
+    details = maze.access_tile((x, y))
+    arena = ":".join([details["world"], details["sector"], details["arena"]])
+    assert maze.get_tile_path((x, y), "arena") == arena
+    assert maze.get_tile_path_id((x, y), "arena") == maze.address_ids[arena]
+    assert (x, y) in maze.address_tiles[arena]
+    # tiles outside any sector still spell out the empty levels
+    assert maze.get_tile_path((0, 0), "arena") == details["world"] + "::"
+
+    event = ("Isabella Rodriguez", "is", "sleeping", "sleeping")
+    maze.add_event_from_tile(event, [x, y])
+    assert event in maze.access_tile((x, y))["events"]
+    maze.remove_subject_events_from_tile("Isabella Rodriguez", (x, y))
+    assert event not in maze.access_tile((x, y))["events"]
+
+
+def test_second_load_comes_from_the_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("MAZE_CACHE_PATH", str(tmp_path))
+    parsed = Maze("the_ville")
+    assert len(os.listdir(tmp_path)) == 1
+
+    monkeypatch.setattr(Maze, "_read_maze_files", None)
+    cached = Maze("the_ville")
+    assert isinstance(cached.arena_path_layer, numpy.memmap)
+    assert cached.address_tiles == parsed.address_tiles
+    assert cached.collision_maze == parsed.collision_maze
+    assert cached.tile_events == parsed.tile_events
+    assert cached.get_tile_path((58, 9), "game_object") == parsed.get_tile_path((58, 9), "game_object")
+
+    # changing a tile does not write through to the cache
+    cached.set_tile_collision((0, 0), not parsed.collision_layer[0, 0])
+    assert Maze("the_ville").collision_layer[0, 0] == parsed.collision_layer[0, 0]
+
+
+def test_nearby_events_come_from_the_arena_index(monkeypatch):
+    monkeypatch.setenv("MAZE_CACHE", "0")
+    maze = Maze("the_ville")
+    bed = "the Ville:Isabella Rodriguez's apartment:main room:bed"
+    tile = min(maze.address_tiles[bed])
+    event = ("Isabella Rodriguez", "is", "sleeping", "sleeping")
+    maze.add_event_from_tile(event, tile)
+
+    nearby = {e: (d, t) for d, t, e in maze.get_nearby_events(tile, 4)}
+    assert nearby[event] == (0.0, tile)
+    assert nearby[(bed, None, None, None)][1] == min(
+        t for t in maze.address_tiles[bed]
+        if t in set(maze.get_nearby_tiles(tile, 4)))
+    # every event we see is in our arena and within the radius
+    arena_id = maze.get_tile_path_id(tile, "arena")
+    for d, t, e in maze.get_nearby_events(tile, 4):
+        assert maze.get_tile_path_id(t, "arena") == arena_id
+        assert e in maze.access_tile(t)["events"]
+
+    maze.turn_event_from_tile_idle((bed, None, None, None), tile)
+    maze.remove_subject_events_from_tile("Isabella Rodriguez", tile)
+    assert event not in {e for _, _, e in maze.get_nearby_events(tile, 4)}
+    assert not maze.arena_events[arena_id].get(event)
+
+
+def test_object_events_are_idled_at_the_end_of_the_step(monkeypatch):
+    monkeypatch.setenv("MAZE_CACHE", "0")
+    maze = Maze("the_ville")
+    bed = "the Ville:Isabella Rodriguez's apartment:main room:bed"
+    tile = min(maze.address_tiles[bed])
+    unmade = (bed, "is", "unmade", "unmade")
+    sleeping = ("Isabella Rodriguez", "is", "sleeping", "sleeping")
+    maze.add_event_from_tile(sleeping, tile)
+    maze.activate_object_event(unmade, tile)
+    assert maze.access_tile(tile)["events"] == {unmade, sleeping}
+    assert maze.subject_events[bed][unmade] == {tile}
+
+    maze.idle_object_events()
+    maze.remove_subject_events_from_tile("Isabella Rodriguez", tile)
+    assert maze.access_tile(tile)["events"] == {(bed, None, None, None)}
+    assert "Isabella Rodriguez" not in maze.subject_events
+    assert maze.active_object_events == dict()
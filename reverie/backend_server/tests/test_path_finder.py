@@ -0,0 +1,107 @@
+# flake8: noqa: E402
+import os
+import sys
+
+# Make sure reverie/backend_server is importable for tests
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from path_finder import PathGrid, path_finder, path_finder_v2, path_finder_2
+
+
+MAZE = [['#', '#', '#', '#', '#', '#', '#', '#', '#', '#', '#', '#', '#'],
+        [' ', ' ', '#', ' ', ' ', ' ', ' ', ' ', '#', ' ', ' ', ' ', '#'],
+        ['#', ' ', '#', ' ', ' ', '#', '#', ' ', ' ', ' ', '#', ' ', '#'],
+        ['#', ' ', '#', ' ', ' ', '#', '#', ' ', '#', ' ', '#', ' ', '#'],
+        ['#', ' ', ' ', ' ', ' ', ' ', ' ', ' ', '#', ' ', ' ', ' ', '#'],
+        ['#', '#', '#', ' ', '#', ' ', '#', '#', '#', ' ', '#', ' ', '#'],
+        ['#', ' ', ' ', ' ', ' ', ' ', ' ', ' ', ' ', ' ', '#', ' ', ' '],
+        ['#', '#', '#', '#', '#', '#', '#', '#', '#', '#', '#', '#', '#']]
+
+
+def _is_valid_walk(maze, path):
+    for x, y in path:
+        assert maze[y][x] != '#'
+    for (ax, ay), (bx, by) in zip(path, path[1:]):
+        assert abs(ax - bx) + abs(ay - by) == 1
+
+
+def test_path_grid_matches_raw_maze_input():
+    grid = PathGrid(MAZE, '#')
+    assert path_finder(grid, (0, 1), (12, 6), '#') == path_finder(
+        MAZE, (0, 1), (12, 6), '#')
+
+
+def test_shortest_path_length_and_endpoints():
+    path = path_finder(PathGrid(MAZE, '#'), (0, 1), (12, 6), '#')
+    assert path[0] == (0, 1)
+    assert path[-1] == (12, 6)
+    # 21 moves is the shortest route through this maze (same as the old
+    # flood fill).
+    assert len(path) == 22
+    _is_valid_walk(MAZE, path)
+
+
+def test_same_tile_and_unreachable_return_end_only():
+    grid = PathGrid(MAZE, '#')
+    assert path_finder(grid, (3, 1), (3, 1), '#') == [(3, 1)]
+    # (2, 1) is a collision block, so there is no path into it.
+    assert path_finder(grid, (0, 1), (2, 1), '#') == [(2, 1)]
+
+
+def test_path_finder_v2_uses_row_col_order():
+    path = path_finder_v2(MAZE, (1, 0), (6, 12), '#')
+    assert path[0] == (1, 0)
+    assert path[-1] == (6, 12)
+    assert [(c, r) for r, c in path] == path_finder(MAZE, (0, 1), (12, 6), '#')
+
+
+def test_long_paths_are_not_capped():
+    # The old flood fill gave up after 150 steps of distance.
+    width = 400
+    maze = [[' '] * width]
+    path = path_finder(PathGrid(maze, '#'), (0, 0), (width - 1, 0), '#')
+    assert len(path) == width
+
+
+def test_path_finder_2_stops_next_to_target():
+    path = path_finder_2(PathGrid(MAZE, '#'), (0, 1), (11, 4), '#')
+    end = path[-1]
+    assert abs(end[0] - 11) + abs(end[1] - 4) == 1
+    _is_valid_walk(MAZE, path)
+
+
+def test_distance_field_descends_to_nearest_source():
+    grid = PathGrid(MAZE, '#')
+    # (1, 1) is 2 moves from start, (12, 6) is much further.
+    field = grid.distance_field([(12, 6), (1, 1)])
+    path = grid.descend(field, (1, 3))
+    assert path == [(1, 3), (1, 2), (1, 1)]
+    assert field[6 * grid.width + 12] == 0
+
+
+def test_distance_field_skips_blocked_sources_and_unreachable_starts():
+    grid = PathGrid(MAZE, '#')
+    field = grid.distance_field([(0, 0), (3, 1)])
+    # (0, 0) is a collision block, so only (3, 1) seeds the field.
+    assert field[0] == -1
+    assert grid.descend(field, (3, 1)) == [(3, 1)]
+    assert grid.descend(grid.distance_field([]), (3, 1)) is None
+
+
+def test_find_path_to_nearest_stops_at_closest_target():
+    grid = PathGrid(MAZE, '#')
+    targets = {(12, 6), (1, 1), (0, 0)}
+    path = grid.find_path_to_nearest((1, 3), targets)
+    assert path == [(1, 3), (1, 2), (1, 1)]
+    # same length as descending the full distance field
+    field = grid.distance_field(targets)
+    for start in [(3, 1), (7, 4), (11, 6), (5, 6)]:
+        path = grid.find_path_to_nearest(start, targets)
+        _is_valid_walk(MAZE, path)
+        assert path[-1] in targets
+        assert len(path) == len(grid.descend(field, start))
+    assert grid.find_path_to_nearest((1, 1), targets) == [(1, 1)]
+    assert grid.find_path_to_nearest((1, 3), {(0, 0)}) is None
+    assert grid.find_path_to_nearest((1, 3), set()) is None
@@ -0,0 +1,88 @@
+# flake8: noqa: E402
+import os
+import sys
+
+# Make sure reverie/backend_server is importable for tests
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import datetime
+import threading
+
+from reverie import ReverieServer
+
+
+class FakePersona:
+    def __init__(self, name, log, barrier=None):
+        self.name = name
+        self.log = log
+        self.barrier = barrier
+        self.chatting_with = None
+
+    def start_step(self, curr_tile, curr_time):
+        self.log.append(("start", self.name))
+        return False
+
+    def think(self, maze, new_day):
+        # Every persona must be thinking at the same time to get past this.
+        if self.barrier:
+            self.barrier.wait(timeout=5)
+        return {"seen": self.name}
+
+    def react(self, maze, personas, retrieved):
+        self.log.append(("react", self.name))
+        # The first persona to react starts a chat with everyone who is free.
+        if not self.chatting_with:
+            for other in personas.values():
+                if other is not self and not other.chatting_with:
+                    other.chatting_with = self.name
+                    self.chatting_with = other.name
+                    break
+        return f"plan of {self.name}"
+
+    def reflect(self):
+        pass
+
+    def execute(self, maze, personas, plan):
+        self.log.append(("execute", self.name))
+        return ((0, 0), "x", plan)
+
+    def move(self, maze, personas, curr_tile, curr_time):
+        self.log.append(("move", self.name))
+        return ((0, 0), "x", f"plan of {self.name}")
+
+
+def _make_server(names, workers, barrier=None):
+    rs = ReverieServer.__new__(ReverieServer)
+    rs.maze = None
+    rs.curr_time = datetime.datetime(2023, 2, 13, 8, 0, 0)
+    rs.persona_workers = workers
+    log = []
+    rs.personas = {name: FakePersona(name, log, barrier) for name in names}
+    rs.personas_tile = {name: (0, 0) for name in names}
+    return rs, log
+
+
+def test_single_worker_moves_personas_in_turn():
+    rs, log = _make_server(["A", "B"], workers=1)
+    executions = rs.move_personas()
+    assert log == [("move", "A"), ("move", "B")]
+    assert executions["B"][2] == "plan of B"
+
+
+def test_concurrent_think_with_ordered_react_and_execute():
+    names = ["A", "B", "C"]
+    rs, log = _make_server(names, workers=3,
+                           barrier=threading.Barrier(len(names)))
+    executions = rs.move_personas()
+
+    assert list(executions) == names
+    assert [entry for entry in log if entry[0] == "react"] == [
+        ("react", "A"), ("react", "B"), ("react", "C")]
+    assert [entry for entry in log if entry[0] == "execute"] == [
+        ("execute", "A"), ("execute", "B"), ("execute", "C")]
+    # A reacted first and took B for a chat, so C found no free partner.
+    assert rs.personas["A"].chatting_with == "B"
+    assert rs.personas["B"].chatting_with == "A"
+    assert rs.personas["C"].chatting_with is None
@@ -0,0 +1,60 @@
+# flake8: noqa: E402
+import os
+import sys
+
+# Make sure reverie/backend_server is importable for tests
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import threading
+
+from global_methods import STEP_CHANNEL_FILE, StepChannel, StepLog, send_step_frame
+
+
+def test_environment_frames_wake_the_backend(tmp_path):
+    channel = StepChannel(str(tmp_path))
+    try:
+        env = {"A": {"maze": "the_ville", "x": 1, "y": 2}}
+        assert send_step_frame(str(tmp_path), {"type": "environment", "sim_code": "s",
+                                               "step": 3, "environment": env}) is None
+        assert channel.poll(1.0)
+        assert channel.pop_environment("s", 2) is None
+        assert channel.pop_environment("other", 3) is None
+        assert channel.pop_environment("s", 3) == env
+    finally:
+        channel.close()
+    assert not (tmp_path / STEP_CHANNEL_FILE).exists()
+
+
+def test_movement_request_waits_for_publish(tmp_path):
+    move_log = StepLog(str(tmp_path / "movement"))
+    channel = StepChannel(str(tmp_path), move_log)
+    replies = []
+    frame = {"type": "movement", "sim_code": "s", "step": 0}
+    waiter = threading.Thread(
+        target=lambda: replies.append(send_step_frame(str(tmp_path), frame, timeout=5)))
+    try:
+        waiter.start()
+        while not channel.waiters:
+            channel.poll(0.1)
+        movements = {"persona": {"A": {"movement": [1, 2]}}, "meta": {}}
+        move_log.append(0, movements)
+        channel.publish_movement("s", 0, movements)
+        waiter.join(5)
+        assert replies == [{"step": 0, "movements": movements}]
+
+        # A step that was already published is answered from the log.
+        waiter = threading.Thread(
+            target=lambda: replies.append(send_step_frame(str(tmp_path), frame, timeout=5)))
+        waiter.start()
+        while waiter.is_alive():
+            channel.poll(0.1)
+        assert replies[-1] == {"step": 0, "movements": movements}
+    finally:
+        channel.close()
+
+
+def test_no_channel_falls_back(tmp_path):
+    frame = {"type": "movement", "sim_code": "s", "step": 0}
+    assert send_step_frame(str(tmp_path), frame, timeout=0.1) is None
@@ -0,0 +1,71 @@
+# flake8: noqa: E402
+import os
+import sys
+
+# Make sure reverie/backend_server is importable for tests
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import json
+
+import global_methods
+from global_methods import StepLog, get_step_log
+
+
+def test_append_and_read_back(tmp_path):
+    log = StepLog(str(tmp_path / "movement"))
+    for step in range(5):
+        log.append(step, {"persona": {"A": {"movement": [step, 0]}}})
+    assert log.has_step(4)
+    assert not log.has_step(5)
+    assert log.read(3) == {"persona": {"A": {"movement": [3, 0]}}}
+    assert log.read(7) is None
+    assert log.steps() == [0, 1, 2, 3, 4]
+    # one log and one index file instead of a file per step
+    assert sorted(os.listdir(tmp_path / "movement")) == [
+        "steps-000000.idx", "steps-000000.jsonl"]
+
+
+def test_other_readers_see_new_steps_and_last_write_wins(tmp_path):
+    folder = str(tmp_path / "environment")
+    writer = StepLog(folder)
+    reader = StepLog(folder)
+    writer.append(0, {"A": {"x": 1, "y": 1}})
+    assert reader.read(0) == {"A": {"x": 1, "y": 1}}
+    assert not reader.has_step(1)
+
+    writer.append(1, {"A": {"x": 2, "y": 1}})
+    writer.append(1, {"A": {"x": 3, "y": 1}})
+    assert reader.has_step(1)
+    assert reader.read(1) == {"A": {"x": 3, "y": 1}}
+
+
+def test_unindexed_record_is_ignored(tmp_path):
+    folder = tmp_path / "movement"
+    log = StepLog(str(folder))
+    log.append(0, {"a": 1})
+    # a writer that died after writing the record but before indexing it
+    with open(folder / "steps-000000.jsonl", "ab") as f:
+        f.write(b'{"a": 2}\n')
+    assert StepLog(str(folder)).steps() == [0]
+
+
+def test_segments_and_legacy_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(global_methods, "STEP_LOG_SEGMENT_STEPS", 2)
+    folder = tmp_path / "environment"
+    folder.mkdir()
+    # older simulations have one json file per step
+    (folder / "0.json").write_text(json.dumps({"A": {"x": 0, "y": 0}}))
+    log = StepLog(str(folder))
+    assert log.has_step(0)
+    for step in range(1, 5):
+        log.append(step, {"A": {"x": step, "y": 0}})
+    assert log.read(0) == {"A": {"x": 0, "y": 0}}
+    assert StepLog(str(folder)).steps() == [0, 1, 2, 3, 4]
+    assert (folder / "steps-000002.jsonl").exists()
+
+
+def test_get_step_log_is_shared_per_folder(tmp_path):
+    folder = str(tmp_path / "movement")
+    assert get_step_log(folder) is get_step_log(folder + "/")
@@ -0,0 +1,85 @@
+# flake8: noqa: E402
+import os
+import sys
+
+# Make sure reverie/backend_server is importable for tests
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import json
+import threading
+import time
+
+import step_profiler
+from step_profiler import StepProfiler, get_step_profiler, profiled
+
+
+@profiled("llm:chat")
+def fake_request():
+    time.sleep(0.02)
+    return "ok"
+
+
+@profiled("path_finder")
+def fake_path_finder():
+    return [(0, 0)]
+
+
+def _persona_step(profiler, name):
+    with profiler.phase("plan", name):
+        fake_request()
+    with profiler.phase("execute", name):
+        fake_path_finder()
+
+
+def test_phases_separate_llm_wait_and_write_trace(tmp_path, monkeypatch):
+    profiler = StepProfiler(enabled=True, window=5)
+    monkeypatch.setattr(step_profiler, "_profiler", profiler)
+    # frames outside a persona's phase are not recorded
+    fake_request()
+
+    for step in range(2):
+        profiler.begin_step(step)
+        threads = [threading.Thread(target=_persona_step, args=(profiler, name))
+                   for name in ("Isabella Rodriguez", "Klaus Mueller")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        profiler.end_step()
+
+    summary = profiler.summary()
+    assert summary.startswith("steps 0-1:")
+    assert "Klaus Mueller" in summary
+    assert "execute/path_finder" in summary
+    phases = profiler.window[-1][2]
+    wall, cpu, llm = phases[("Isabella Rodriguez", "plan")]
+    assert llm >= 0.02
+    assert wall >= llm
+    assert phases[("Isabella Rodriguez", "execute")][2] == 0
+
+    paths = profiler.write_run(str(tmp_path / "step_profile"))
+    assert [os.path.basename(path) for path in paths] == [
+        "steps-0-1.trace.json", "steps-0-1.folded"]
+    trace = json.load(open(paths[0]))["traceEvents"]
+    names = {event["name"] for event in trace}
+    assert {"step 0", "step 1", "plan", "llm:chat", "execute", "path_finder"} <= names
+    folded = open(paths[1]).read().splitlines()
+    stacks = [line.rsplit(" ", 1)[0] for line in folded]
+    assert "step;Klaus Mueller;plan;llm:chat" in stacks
+    assert "step;Isabella Rodriguez;execute;path_finder" in stacks
+    # the recorded frames are cleared, the rolling window is kept
+    assert profiler.write_run(str(tmp_path / "step_profile")) == []
+    assert profiler.window
+
+
+def test_disabled_profiler_records_nothing(monkeypatch):
+    profiler = StepProfiler(enabled=False)
+    monkeypatch.setattr(step_profiler, "_profiler", profiler)
+    profiler.begin_step(0)
+    _persona_step(profiler, "Isabella Rodriguez")
+    profiler.end_step()
+    assert profiler.events == []
+    assert "No profiled steps" in profiler.summary()
+    assert get_step_profiler() is profiler
@@ -21,34 +21,35 @@ def compress(sim_code):
     if x[0] != ".": 
       persona_names += [x]
 
-  max_move_count = max([int(i.split("/")[-1].split(".")[0]) 
-                 for i in find_filenames(move_folder, "json")])
+  # The movement step log reads both the segmented log and the per step 
+  # {step}.json files of older simulations. 
+  move_log = get_step_log(move_folder)
+  max_move_count = move_log.steps()[-1]
   
   persona_last_move = dict()
   master_move = dict()  
   for i in range(max_move_count+1): 
     master_move[i] = dict()
-    with open(f"{move_folder}/{str(i)}.json") as json_file:  
-      i_move_dict = json.load(json_file)["persona"]
-      for p in persona_names: 
-        move = False
-        if i == 0: 
-          move = True
-        elif (i_move_dict[p]["movement"] != persona_last_move[p]["movement"]
-          or i_move_dict[p]["pronunciatio"] != persona_last_move[p]["pronunciatio"]
-          or i_move_dict[p]["description"] != persona_last_move[p]["description"]
-          or i_move_dict[p]["chat"] != persona_last_move[p]["chat"]): 
-          move = True
-
-        if move: 
-          persona_last_move[p] = {"movement": i_move_dict[p]["movement"],
-                                  "pronunciatio": i_move_dict[p]["pronunciatio"], 
-                                  "description": i_move_dict[p]["description"], 
-                                  "chat": i_move_dict[p]["chat"]}
-          master_move[i][p] = {"movement": i_move_dict[p]["movement"],
-                               "pronunciatio": i_move_dict[p]["pronunciatio"], 
-                               "description": i_move_dict[p]["description"], 
-                               "chat": i_move_dict[p]["chat"]}
+    i_move_dict = move_log.read(i)["persona"]
+    for p in persona_names: 
+      move = False
+      if i == 0: 
+        move = True
+      elif (i_move_dict[p]["movement"] != persona_last_move[p]["movement"]
+        or i_move_dict[p]["pronunciatio"] != persona_last_move[p]["pronunciatio"]
+        or i_move_dict[p]["description"] != persona_last_move[p]["description"]
+        or i_move_dict[p]["chat"] != persona_last_move[p]["chat"]): 
+        move = True
+
+      if move: 
+        persona_last_move[p] = {"movement": i_move_dict[p]["movement"],
+                                "pronunciatio": i_move_dict[p]["pronunciatio"], 
+                                "description": i_move_dict[p]["description"], 
+                                "chat": i_move_dict[p]["chat"]}
+        master_move[i][p] = {"movement": i_move_dict[p]["movement"],
+                             "pronunciatio": i_move_dict[p]["pronunciatio"], 
+                             "description": i_move_dict[p]["description"], 
+                             "chat": i_move_dict[p]["chat"]}
 
 
   create_folder_if_not_there(compressed_storage)